@@ -3,6 +3,11 @@ ASGI config for ecommerce project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+En producción se sirve con workers de uvicorn (ver Procfile), así las vistas
+async de pago esperan a Flow/MercadoPago sin ocupar un worker:
+
+    gunicorn ecommerce.asgi:application -k uvicorn.workers.UvicornWorker
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
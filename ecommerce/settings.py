@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
+from .database import database_config, sqlite_pragmas
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -54,7 +56,11 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'stock_smart.middleware.AsyncWhiteNoiseMiddleware',
+    'stock_smart.middleware.VisitorMiddleware',
+    # Solo activo con DEBUG; al final para que sesión, usuario y visitante ya
+    # estén resueltos y solo se inspeccionen las consultas de la vista
+    'stock_smart.middleware.NPlusOneMiddleware',
 ]
 
 ROOT_URLCONF = 'ecommerce.urls'
@@ -74,6 +80,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'stock_smart.context_processors.cart_count',
                 'stock_smart.context_processors.categories_processor',
+                'stock_smart.context_processors.cache_versions',
             ],
         },
     },
@@ -85,12 +92,12 @@ WSGI_APPLICATION = 'ecommerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# SQLite afinado para varios workers, o Postgres con pool si hay DATABASE_URL
+# (ver ecommerce/database.py)
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': database_config(default_sqlite=BASE_DIR / 'db.sqlite3'),
 }
+SQLITE_PRAGMAS = sqlite_pragmas()
 
 
 # Password validation
@@ -152,11 +159,79 @@ LOGOUT_REDIRECT_URL = '/admin/login/'
 # Configuración de mensajes
 MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
 
+# Backends del carrito: 'guest' para visitantes anónimos, 'user' para autenticados
+CART_BACKENDS = {
+    'guest': 'stock_smart.services.cart.SessionCartBackend',
+    'user': 'stock_smart.services.cart.DatabaseCartBackend',
+}
+
+# Segundos que se guardan los fragmentos de las páginas públicas
+# ({% cache %} en home, detalle y menú); se invalidan por versión desde las señales
+FRAGMENT_CACHE_TIMEOUT = 60 * 15
+
+# Caché en dos niveles: LRU en memoria de cada worker (L1) delante de la caché
+# compartida 'shared' (L2). El carrito no pasa por L1 para que todos los
+# workers vean el mismo.
+#
+# L2 debe ser Redis (REDIS_URL) en producción: los límites de seguimiento y
+# las versiones de caché usan cache.incr(), que solo es atómico en Redis.
+# Sin REDIS_URL se usan archivos en CACHE_DIR, pensado para un solo proceso
+# de desarrollo: ahí dos workers pueden perder incrementos.
+REDIS_URL = os.environ.get('REDIS_URL')
+# `manage.py test` usa cachés en memoria: nada queda de una corrida a otra
+TESTING = sys.argv[1:2] == ['test']
+if TESTING:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'stock-smart-tests',
+    }
+elif REDIS_URL:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', os.path.join(BASE_DIR, '.cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+
+CACHES = {
+    'default': {
+        'BACKEND': 'stock_smart.services.tiered_cache.TieredCache',
+        'OPTIONS': {
+            'L2': 'shared',
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 5,
+            'L1_EXCLUDE': ['cart:'],
+            'STALE_TTL': 60,
+            'LOCK_TIMEOUT': 10,
+        },
+    },
+    'shared': SHARED_CACHE,
+}
+
+# Segundos que una orden pendiente de pago mantiene apartado su stock;
+# las reservas vencidas las libera el proceso `sweeper` del Procfile
+STOCK_RESERVATION_TTL = 15 * 60
+
+# Búsquedas de seguimiento permitidas por IP: (peticiones, ventana en segundos)
+TRACKING_RATE_LIMIT = (30, 60)
+# Proxies delante de la app que agregan su IP a X-Forwarded-For (0 = ninguno)
+TRUSTED_PROXY_COUNT = int(os.environ.get('TRUSTED_PROXY_COUNT', 0))
+
+# Repeticiones de una misma consulta en un request que se reportan como N+1
+NPLUSONE_THRESHOLD = 3
+
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 SILENCED_SYSTEM_CHECKS = ['security.W019']
 
-# Configuración de correo
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Configuración de correo. Los correos se encolan en OutboxEmail y los envía
+# `manage.py send_outbox`; con DEBUG quedan como archivos en EMAIL_FILE_PATH
+# (ver más abajo, donde DEBUG toma su valor final)
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
 EMAIL_HOST = 'smtp.gmail.com'  # O tu servidor SMTP
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -304,14 +379,6 @@ CSRF_TRUSTED_ORIGINS = [
     '*'
 ]
 
-# Configuración de base de datos
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
-}
-
 # Configuración de archivos estáticos
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
@@ -320,6 +387,11 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # Configuración de debug
 DEBUG = os.getenv('DEBUG', 'False') == 'True'
 
+# En desarrollo los correos no salen: se escriben en EMAIL_FILE_PATH
+# (los tests usan locmem, que Django configura solo)
+if DEBUG and 'EMAIL_BACKEND' not in os.environ:
+    EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+
 # Configuraciones de seguridad
 SECURE_SSL_REDIRECT = False
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
@@ -364,6 +436,13 @@ MERCADOPAGO_FAILURE_URL = f"{SITE_URL}/payment/mercadopago/failure/"
 MERCADOPAGO_PENDING_URL = f"{SITE_URL}/payment/mercadopago/pending/"
 MERCADOPAGO_WEBHOOK_URL = f"{SITE_URL}/payment/mercadopago/webhook/"
 
+# Clientes HTTP de las pasarelas (services/gateway.py): timeouts (conexión,
+# lectura), reintentos y umbral del circuit breaker por pasarela
+PAYMENT_GATEWAYS = {
+    'flow': {'base_url': FLOW_API_URL, 'timeout': (3.05, 15), 'retries': 2},
+    'mercadopago': {'base_url': 'https://api.mercadopago.com', 'timeout': (3.05, 20), 'retries': 2},
+}
+
 # Development
 if DEBUG:
     SITE_URL = 'http://127.0.0.1:8000'
@@ -2,22 +2,86 @@ import mercadopago
 import logging
 from django.conf import settings
 from django.urls import reverse
+from mercadopago.http import HttpClient
 from urllib.parse import urljoin
 from ..models import OrderItem
+from ..services.gateway import get_async_gateway_client, get_gateway_client
 
 logger = logging.getLogger(__name__)
 
+
+class GatewayHttpClient(HttpClient):
+    """HttpClient del SDK sobre el cliente compartido (pool, timeouts, circuit breaker)"""
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        # Timeouts y reintentos los define PAYMENT_GATEWAYS['mercadopago']
+        kwargs.pop('timeout', None)
+        api_result = get_gateway_client('mercadopago').request(method, url, **kwargs)
+        return {
+            "status": api_result.status_code,
+            "response": api_result.json()
+        }
+
+
 class MercadoPagoAdapter:
     def __init__(self):
         logger.info("="*50)
         logger.info("Inicializando MercadoPago SDK")
         try:
-            self.sdk = mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN)
+            self.sdk = mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN, http_client=GatewayHttpClient())
             logger.info("SDK inicializado correctamente")
         except Exception as e:
             logger.error(f"Error al inicializar SDK: {str(e)}")
             raise
 
+    def preference_data(self, order, order_item):
+        """Datos de la preferencia de pago para una orden de un solo producto"""
+        # Obtener el dominio base desde settings
+        base_url = settings.SITE_URL
+
+        # Construir URLs completas usando el namespace de la app
+        success_url = urljoin(base_url, reverse('stock_smart:payment_success'))
+        failure_url = urljoin(base_url, reverse('stock_smart:payment_failure'))
+        pending_url = urljoin(base_url, reverse('stock_smart:payment_pending'))
+
+        # Crear preferencia básica según documentación de MercadoPago Chile
+        return {
+            "items": [
+                {
+                    "title": order_item.product.name,
+                    "quantity": 1,
+                    "currency_id": "CLP",
+                    "unit_price": float(order_item.price)
+                }
+            ],
+            "back_urls": {
+                "success": success_url,
+                "failure": failure_url,
+                "pending": pending_url
+            },
+            "auto_return": "approved",
+            "external_reference": str(order.id)
+        }
+
+    async def acreate_preference(self, order, order_item):
+        """create_preference sin bloquear el worker: POST directo a la API con httpx"""
+        response = await get_async_gateway_client('mercadopago').post(
+            'checkout/preferences',
+            json=self.preference_data(order, order_item),
+            headers={'Authorization': f'Bearer {settings.MERCADOPAGO_ACCESS_TOKEN}'}
+        )
+        if response.status_code != 201:
+            logger.error(f"Error al crear preferencia en MercadoPago: {response.status_code} - {response.text}")
+            return None
+
+        response_data = response.json()
+        logger.info(f"Preferencia creada exitosamente. ID: {response_data.get('id')}")
+        return {
+            "id": response_data.get("id"),
+            "init_point": response_data.get("init_point"),
+            "sandbox_init_point": response_data.get("sandbox_init_point")
+        }
+
     def create_preference(self, order):
         try:
             logger.info("="*50)
@@ -29,35 +93,7 @@ class MercadoPagoAdapter:
                 logger.error("No se encontraron items en la orden")
                 return None
 
-            # Obtener el dominio base desde settings
-            base_url = settings.SITE_URL
-            
-            # Construir URLs completas usando el namespace de la app
-            success_url = urljoin(base_url, reverse('stock_smart:payment_success'))
-            failure_url = urljoin(base_url, reverse('stock_smart:payment_failure'))
-            pending_url = urljoin(base_url, reverse('stock_smart:payment_pending'))
-            
-            logger.info(f"URL base: {base_url}")
-            logger.info(f"URL success: {success_url}")
-
-            # Crear preferencia básica según documentación de MercadoPago Chile
-            preference_data = {
-                "items": [
-                    {
-                        "title": order_item.product.name,
-                        "quantity": 1,
-                        "currency_id": "CLP",
-                        "unit_price": float(order_item.price)
-                    }
-                ],
-                "back_urls": {
-                    "success": success_url,
-                    "failure": failure_url,
-                    "pending": pending_url
-                },
-                "auto_return": "approved",
-                "external_reference": str(order.id)
-            }
+            preference_data = self.preference_data(order, order_item)
             
             logger.info("Datos de preferencia a enviar:")
             logger.info(preference_data)
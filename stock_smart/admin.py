@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Order, OrderItem, Category, Product, Brand
+from .services.pagination import ApproximateCountPaginator
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -8,6 +9,9 @@ class OrderItemInline(admin.TabularInline):
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    # Sin COUNT(*) completo en cada página del listado
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
     list_display = ['order_number', 'customer_name', 'status', 'total_amount', 'created_at']
     list_filter = ['status', 'shipping_method', 'created_at']
     search_fields = ['order_number', 'customer_name', 'customer_email']
@@ -32,6 +36,8 @@ class OrderAdmin(admin.ModelAdmin):
 
 @admin.register(OrderItem)
 class OrderItemAdmin(admin.ModelAdmin):
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
     list_display = [
         'order',
         'product',
@@ -61,6 +67,8 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
     list_display = ['name', 'category', 'brand', 'published_price', 'discount_percentage', 'stock', 'active', 'is_featured']
     list_filter = ['active', 'is_featured', 'category', 'brand']
     search_fields = ['name', 'description']
@@ -1,27 +1,36 @@
-from .models import Category, Cart, CartItem
-from django.db import models
+from .services.cart import CartService
+from django.utils.functional import SimpleLazyObject
+from .services.category_tree import get_category_tree, get_category_tree_version
+from .services.fragment_cache import fragment_timeout, get_catalog_version
 import logging
 
 logger = logging.getLogger(__name__)
 
 def categories_processor(request):
     try:
-        categories = Category.objects.filter(is_active=True).order_by('name')
-        return {'categories': categories}
+        tree = get_category_tree()
+        return {
+            'categories': tree.active(),
+            'main_categories': tree.roots(),
+        }
     except Exception as e:
-        return {'categories': []}
+        logger.error(f"Error cargando árbol de categorías: {str(e)}")
+        return {'categories': [], 'main_categories': []}
 
 def cart_count(request):
-    count = 0
-    if hasattr(request, 'visitor_id'):
-        cart = Cart.objects.filter(
-            visitor_id=request.visitor_id,
-            is_active=True
-        ).first()
-        
-        if cart:
-            count = CartItem.objects.filter(cart=cart).aggregate(
-                total_items=models.Sum('quantity')
-            )['total_items'] or 0
-    
-    return {'cart_count': count}
\ No newline at end of file
+    # Conteo desde el backend del carrito (sesión o columna desnormalizada)
+    if not hasattr(request, 'session'):
+        return {'cart_count': 0}
+    try:
+        return {'cart_count': CartService(request).count()}
+    except Exception as e:
+        logger.error(f"Error obteniendo conteo del carrito: {str(e)}")
+        return {'cart_count': 0}
+
+def cache_versions(request):
+    # Versiones para las claves de {% cache %}; solo se leen si el template las usa
+    return {
+        'catalog_version': SimpleLazyObject(get_catalog_version),
+        'category_version': SimpleLazyObject(get_category_tree_version),
+        'fragment_timeout': fragment_timeout(),
+    }
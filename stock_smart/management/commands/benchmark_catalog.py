@@ -0,0 +1,78 @@
+import uuid
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from stock_smart.models import Brand, Category, Product
+from stock_smart.services.pagination import KeysetPaginator
+
+
+def _value_size(value):
+    if value is None:
+        return 0
+    if isinstance(value, (bytes, memoryview)):
+        return len(value)
+    return len(str(value).encode())
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara consultas y bytes leídos de la BD al listar una página de productos '
+        'con Product.objects.all() versus Product.objects.catalog()'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--per-page', type=int, default=24)
+        parser.add_argument('--description-size', type=int, default=2000, help='Caracteres de descripción')
+
+    def handle(self, *args, **options):
+        try:
+            # Los datos de prueba se descartan al terminar
+            with transaction.atomic():
+                self._create(options['products'], options['description_size'])
+                full = self._measure(Product.objects.filter(active=True), options['per_page'])
+                lean = self._measure(Product.objects.catalog().filter(active=True), options['per_page'])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+        self._report('Product.objects (filas completas)', full)
+        self._report('Product.objects.catalog()', lean)
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully benchmarked: {full['queries']} -> {lean['queries']} queries, "
+            f"{full['bytes'] / max(lean['bytes'], 1):.1f}x fewer bytes per page"
+        ))
+
+    def _create(self, count, description_size):
+        suffix = uuid.uuid4().hex[:8]
+        categories = [Category.objects.create(name=f'Bench {i}', slug=f'bench-{suffix}-{i}') for i in range(10)]
+        brands = [Brand.objects.create(name=f'Bench {i}', slug=f'bench-{suffix}-{i}') for i in range(10)]
+        Product.objects.bulk_create([
+            Product(
+                name=f'Producto benchmark {i}', slug=f'bench-{suffix}-{i}', description='x' * description_size,
+                published_price=Decimal(1000 + i * 10), discount_percentage=Decimal(i % 30),
+                category=categories[i % 10], brand=brands[i % 10], stock=5,
+            )
+            for i in range(count)
+        ])
+
+    def _measure(self, queryset, per_page):
+        """Primera página y lo que toca cada tarjeta: nombre, precio, categoría y marca"""
+        with CaptureQueriesContext(connection) as queries:
+            page = KeysetPaginator(queryset, per_page).get_page()
+            for product in page:
+                (product.name, product.final_price, product.category.name, product.brand.name)
+        transferred = 0
+        with connection.cursor() as cursor:
+            for query in queries:
+                cursor.execute(query['sql'])
+                transferred += sum(_value_size(value) for row in cursor.fetchall() for value in row)
+        return {'queries': len(queries), 'bytes': transferred}
+
+    def _report(self, label, result):
+        self.stdout.write(f"{label:32} {result['queries']:4} consultas  {result['bytes']:9,} bytes")
@@ -0,0 +1,83 @@
+import asyncio
+import time
+import uuid
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from stock_smart.models import Order, OrderItem, Product
+from stock_smart.services.gateway import reset_gateway_clients
+from stock_smart.services.gateway_stub import StubGatewayServer
+
+class Command(BaseCommand):
+    help = (
+        'Compara el throughput por proceso del retorno de pago (flow_return) '
+        'con un worker WSGI síncrono versus ASGI, contra una pasarela local lenta'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Retornos de pago por modo')
+        parser.add_argument('--concurrency', type=int, default=50, help='Peticiones simultáneas en ASGI')
+        parser.add_argument('--latency', type=float, default=0.2, help='Segundos que tarda la pasarela')
+
+    def handle(self, *args, **options):
+        stub = StubGatewayServer(delay=options['latency'], body={'status': 2})
+        gateways = {'flow': {'base_url': stub.url, 'retries': 0}}
+        product = Product.objects.create(
+            name='Producto benchmark', slug=f'benchmark-{uuid.uuid4().hex[:8]}', description='',
+            published_price=Decimal('1000'), stock=options['requests'] * 2
+        )
+        try:
+            with override_settings(PAYMENT_GATEWAYS=gateways):
+                reset_gateway_clients()
+                wsgi = self._measure_wsgi(self._orders(product, options['requests']))
+                asgi = asyncio.run(self._measure_asgi(
+                    self._orders(product, options['requests']), options['concurrency']
+                ))
+        finally:
+            reset_gateway_clients()
+            stub.close()
+            Order.objects.filter(orderitem__product=product).delete()
+            product.delete()
+
+        self.stdout.write(f"Pasarela simulada: {options['latency'] * 1000:.0f}ms por llamada")
+        self._report('WSGI (1 worker sync)', options['requests'], wsgi)
+        self._report(f"ASGI (1 proceso, {options['concurrency']} concurrentes)", options['requests'], asgi)
+        self.stdout.write(self.style.SUCCESS(f'Mejora: x{wsgi / asgi:.1f}'))
+
+    def _orders(self, product, count):
+        tokens = []
+        for _ in range(count):
+            token = f'bench-{uuid.uuid4().hex}'
+            order = Order.objects.create(
+                order_number=f'BENCH-{uuid.uuid4().hex[:12]}', customer_name='Benchmark',
+                customer_email='benchmark@example.com', customer_phone='0',
+                total_amount=product.published_price, payment_method='flow', flow_token=token,
+            )
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.published_price)
+            tokens.append(token)
+        return tokens
+
+    def _measure_wsgi(self, tokens):
+        # Un worker sync de gunicorn atiende una petición a la vez
+        client = Client(headers={'host': 'localhost'})
+        start = time.perf_counter()
+        for token in tokens:
+            client.get('/checkout/flow/return/', {'token': token})
+        return time.perf_counter() - start
+
+    async def _measure_asgi(self, tokens, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def checkout(token):
+            async with semaphore:
+                await AsyncClient(headers={'host': 'localhost'}).get('/checkout/flow/return/', {'token': token})
+
+        start = time.perf_counter()
+        await asyncio.gather(*(checkout(token) for token in tokens))
+        return time.perf_counter() - start
+
+    def _report(self, label, count, elapsed):
+        self.stdout.write(
+            self.style.SUCCESS(f'{label:38} {count / elapsed:7.1f} req/s ({elapsed:.2f}s para {count})')
+        )
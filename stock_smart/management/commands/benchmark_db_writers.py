@@ -0,0 +1,147 @@
+import multiprocessing
+import os
+import random
+import statistics
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+import django
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, transaction
+
+# (nombre, valor de SQLITE_TUNED en los workers)
+PROFILES = (
+    ('SQLite por defecto', '0'),
+    ('SQLite WAL + IMMEDIATE', '1'),
+)
+
+
+def _init_worker():
+    # Con 'spawn' cada proceso lee la configuración desde el entorno,
+    # como un worker de gunicorn con su propia conexión
+    django.setup()
+
+
+def _prepare(workers, products):
+    from stock_smart.models import Cart, Product
+
+    call_command('migrate', verbosity=0)
+    product_ids = [
+        Product.objects.create(
+            name=f'Producto {i}', slug=f'producto-{i}', description='',
+            published_price=Decimal('9990'), stock=1_000_000
+        ).id
+        for i in range(products)
+    ]
+    cart_ids = [Cart.objects.create(visitor_id=f'bench-{i}', is_guest=True).id for i in range(workers)]
+    return product_ids, cart_ids
+
+
+def _write(cart_id, product_ids, operations, seed):
+    """Alterna checkouts y cambios de carrito; retorna (latencias, bloqueos)"""
+    from stock_smart.models import CartItem
+    from stock_smart.services.order_builder import build_order
+
+    rng = random.Random(seed)
+    latencies = []
+    locked = 0
+    for i in range(operations):
+        start = time.perf_counter()
+        try:
+            if i % 2:
+                with transaction.atomic():
+                    CartItem.objects.update_or_create(
+                        cart_id=cart_id, product_id=rng.choice(product_ids),
+                        defaults={'quantity': rng.randint(1, 5)},
+                    )
+            else:
+                build_order(
+                    {product_id: 1 for product_id in rng.sample(product_ids, 3)},
+                    customer_name='Benchmark', customer_email='benchmark@example.com',
+                    customer_phone='0', payment_method='flow',
+                )
+        except OperationalError as exc:
+            if 'locked' not in str(exc):
+                raise
+            locked += 1
+        latencies.append(time.perf_counter() - start)
+    return latencies, locked
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara escritores concurrentes (checkout + carrito) en SQLite con la '
+        'configuración por defecto de Django versus el perfil de ecommerce/database.py'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8, help='Procesos escribiendo a la vez')
+        parser.add_argument('--operations', type=int, default=100, help='Operaciones por proceso')
+        parser.add_argument('--products', type=int, default=20)
+
+    def handle(self, *args, **options):
+        results = {}
+        for label, tuned in PROFILES:
+            with tempfile.TemporaryDirectory() as tmp:
+                results[label] = self._run(tmp, tuned, options)
+            self._report(label, results[label])
+
+        (base_label, _), (tuned_label, _) = PROFILES
+        base, tuned = results[base_label], results[tuned_label]
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully benchmarked: lock errors {base['locked']} -> {tuned['locked']}, "
+            f"p95 {base['p95'] * 1000:.0f}ms -> {tuned['p95'] * 1000:.0f}ms"
+        ))
+
+    def _run(self, tmp, tuned, options):
+        env = {
+            'DATABASE_URL': f"sqlite:///{os.path.join(tmp, 'bench.sqlite3')}",
+            'SQLITE_TUNED': tuned,
+            'CACHE_DIR': os.path.join(tmp, 'cache'),
+        }
+        previous = {key: os.environ.get(key) for key in env}
+        os.environ.update(env)
+        try:
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_worker) as pool:
+                product_ids, cart_ids = pool.submit(_prepare, options['workers'], options['products']).result()
+
+            workers = options['workers']
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+                # Arrancar los procesos antes de medir
+                list(pool.map(time.sleep, [0.1] * workers))
+                start = time.perf_counter()
+                futures = [
+                    pool.submit(_write, cart_id, product_ids, options['operations'], seed)
+                    for seed, cart_id in enumerate(cart_ids)
+                ]
+                outcomes = [future.result() for future in futures]
+                elapsed = time.perf_counter() - start
+        finally:
+            for key, value in previous.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+
+        latencies = sorted(latency for worker_latencies, _ in outcomes for latency in worker_latencies)
+        locked = sum(worker_locked for _, worker_locked in outcomes)
+        return {
+            'elapsed': elapsed,
+            'operations': len(latencies),
+            'locked': locked,
+            'p50': statistics.median(latencies),
+            'p95': latencies[int(len(latencies) * 0.95) - 1],
+            'max': latencies[-1],
+        }
+
+    def _report(self, label, result):
+        ok = result['operations'] - result['locked']
+        self.stdout.write(
+            f"{label:24} {ok / result['elapsed']:7.1f} ops/s  "
+            f"{result['locked']:4} fallidas por lock  "
+            f"p50 {result['p50'] * 1000:6.1f}ms  p95 {result['p95'] * 1000:6.1f}ms  "
+            f"max {result['max'] * 1000:6.0f}ms"
+        )
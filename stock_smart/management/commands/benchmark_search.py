@@ -0,0 +1,89 @@
+import random
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Q
+from stock_smart.models import Product
+from stock_smart.services.search import get_search_backend, search_catalog
+
+WORDS = [
+    'taladro', 'martillo', 'destornillador', 'llave', 'sierra', 'lijadora',
+    'eléctrico', 'inalámbrico', 'percutor', 'acero', 'madera', 'hormigón',
+    'profesional', 'compacto', 'batería', 'cable', 'juego', 'puntas',
+    'tornillo', 'pintura', 'brocha', 'rodillo', 'escalera', 'guante',
+]
+
+class Command(BaseCommand):
+    help = 'Compara la búsqueda con índice contra icontains sobre un catálogo sintético'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=100000, help='Productos sintéticos a crear')
+        parser.add_argument('--repeat', type=int, default=20, help='Repeticiones por consulta')
+        parser.add_argument('--per-page', type=int, default=12, help='Productos por página')
+        parser.add_argument(
+            '--queries', nargs='+',
+            default=['taladro', 'electrico inalambrico', 'sierra madera', 'hormigon', 'pun'],
+            help='Consultas a medir'
+        )
+
+    def handle(self, *args, **options):
+        # Todo se hace dentro de una transacción que se revierte al final
+        with transaction.atomic():
+            self._populate(options['products'])
+            for query in options['queries']:
+                self._report(query, options['repeat'], options['per_page'])
+            transaction.set_rollback(True)
+
+    def _populate(self, total):
+        rng = random.Random(42)
+        self.stdout.write(f'Creando {total} productos...')
+        batch = []
+        for i in range(total):
+            name = ' '.join(rng.sample(WORDS, 3)).capitalize()
+            batch.append(Product(
+                name=f'{name} {i}',
+                slug=f'benchmark-{i}',
+                description=' '.join(rng.choices(WORDS, k=12)),
+                published_price=rng.randint(1000, 200000),
+            ))
+            if len(batch) >= 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Product.objects.bulk_create(batch)
+
+        # bulk_create no emite señales: indexar de una vez
+        start = time.perf_counter()
+        backend = get_search_backend()
+        count = backend.rebuild()
+        self.stdout.write(
+            f'{backend.__class__.__name__}: {count} productos indexados en {time.perf_counter() - start:.1f}s'
+        )
+
+    def _measure(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        return statistics.median(timings), timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+
+    def _report(self, query, repeat, per_page):
+        def icontains():
+            # Camino anterior: LIKE '%q%' + count() para el log
+            productos = Product.objects.filter(Q(name__icontains=query) | Q(description__icontains=query))
+            productos.count()
+            list(Paginator(productos, per_page).get_page(1))
+
+        def indexed():
+            list(Paginator(search_catalog(query, Product.objects.all()), per_page).get_page(1))
+
+        old_p50, old_p95 = self._measure(icontains, repeat)
+        new_p50, new_p95 = self._measure(indexed, repeat)
+        self.stdout.write(
+            f'{query!r:28} icontains p50={old_p50:8.2f}ms p95={old_p95:8.2f}ms | '
+            f'índice p50={new_p50:8.2f}ms p95={new_p95:8.2f}ms'
+        )
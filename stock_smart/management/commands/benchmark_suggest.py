@@ -0,0 +1,67 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from stock_smart.services import suggest
+from stock_smart.views import search_suggest
+
+WORDS = [
+    'taladro', 'martillo', 'destornillador', 'llave', 'sierra', 'lijadora',
+    'eléctrico', 'inalámbrico', 'percutor', 'acero', 'madera', 'hormigón',
+    'profesional', 'compacto', 'batería', 'cable', 'juego', 'puntas',
+]
+
+class Command(BaseCommand):
+    help = 'Mide la latencia p50/p99 de /api/search/suggest'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--synthetic', type=int, default=0,
+            help='Usar N productos sintéticos en vez de los de la BD'
+        )
+        parser.add_argument('--requests', type=int, default=10000, help='Consultas a medir')
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        if options['synthetic']:
+            index = suggest.SuggestionIndex()
+            index.build(
+                ('product', i, {'type': 'product', 'label': f"{' '.join(rng.sample(WORDS, 3))} {i}", 'url': ''})
+                for i in range(options['synthetic'])
+            )
+            # Reemplazar el índice del proceso para medir también la vista
+            suggest._index = index
+            suggest._built.set()
+        else:
+            start = time.perf_counter()
+            index = suggest.build_suggestion_index()
+            self.stdout.write(f'Índice construido en {(time.perf_counter() - start) * 1000:.1f}ms')
+        self.stdout.write(f'{len(index)} entradas')
+
+        queries = []
+        for _ in range(options['requests']):
+            word = rng.choice(WORDS)
+            queries.append(word[:rng.randint(2, len(word))])
+
+        self._report('lookup', [lambda q=q: index.lookup(q) for q in queries])
+
+        factory = RequestFactory()
+        requests = [factory.get('/api/search/suggest', {'q': q}) for q in queries]
+        with CaptureQueriesContext(connection) as captured:
+            self._report('vista', [lambda r=r: search_suggest(r) for r in requests])
+        self.stdout.write(f'Consultas SQL durante la medición de la vista: {len(captured)}')
+
+    def _report(self, label, calls):
+        timings = []
+        for call in calls:
+            start = time.perf_counter()
+            call()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p50 = timings[len(timings) // 2]
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        self.stdout.write(
+            self.style.SUCCESS(f'{label:8} p50={p50:.3f}ms p99={p99:.3f}ms max={timings[-1]:.3f}ms')
+        )
@@ -0,0 +1,68 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, time as dt_time, timedelta
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from stock_smart.models import Order
+from stock_smart.services.invoices import generate_invoices, paid_orders_filter
+
+def _init_worker():
+    # Con el método 'spawn' el proceso hijo parte sin Django configurado
+    django.setup()
+
+class Command(BaseCommand):
+    help = 'Genera en paralelo las boletas PDF de las órdenes pagadas en un rango de fechas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='Fecha inicial (AAAA-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Fecha final inclusive (AAAA-MM-DD)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', type=int, default=50, help='Órdenes por tarea')
+        parser.add_argument('--force', action='store_true', help='Regenerar también las que ya tienen boleta')
+
+    def _parse_date(self, value, end=False):
+        try:
+            day = datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError(f'Fecha inválida: {value}')
+        if end:
+            day += timedelta(days=1)
+        return timezone.make_aware(datetime.combine(day, dt_time.min))
+
+    def handle(self, *args, **options):
+        orders = Order.objects.filter(paid_orders_filter())
+        if options['date_from']:
+            orders = orders.filter(created_at__gte=self._parse_date(options['date_from']))
+        if options['date_to']:
+            orders = orders.filter(created_at__lt=self._parse_date(options['date_to'], end=True))
+        if not options['force']:
+            orders = orders.filter(invoice='')
+
+        ids = list(orders.order_by('id').values_list('id', flat=True))
+        size = options['chunk_size']
+        chunks = [ids[i:i + size] for i in range(0, len(ids), size)]
+
+        start = time.perf_counter()
+        count = 0
+        if options['workers'] <= 1:
+            for chunk in chunks:
+                count += generate_invoices(chunk)
+        else:
+            # Los hijos no deben heredar las conexiones abiertas del padre
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+                futures = [pool.submit(generate_invoices, chunk) for chunk in chunks]
+                for future in as_completed(futures):
+                    count += future.result()
+        elapsed = time.perf_counter() - start
+
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully generated {count} invoices in {elapsed:.2f}s ({rate:.1f} invoices/s, '
+                f"{options['workers']} workers)"
+            )
+        )
@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from stock_smart.services.webhooks import NOTIFICATION_BATCH_SIZE, drain_notifications
+
+class Command(BaseCommand):
+    help = 'Procesa la bandeja de notificaciones de pago (webhooks de Flow y MercadoPago)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=NOTIFICATION_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Seguir drenando como worker')
+        parser.add_argument('--interval', type=float, default=2.0, help='Segundos de espera con la bandeja vacía')
+
+    def handle(self, *args, **options):
+        while True:
+            processed, total = drain_notifications(options['batch_size'])
+            if total:
+                self.stdout.write(f'Processed {processed}/{total} payment notifications')
+            if not options['loop']:
+                break
+            if total < options['batch_size']:
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Payment notification inbox drained'))
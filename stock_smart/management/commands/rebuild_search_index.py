@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from stock_smart.services.search import get_search_backend
+
+class Command(BaseCommand):
+    help = 'Reconstruye el índice de búsqueda de productos'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        backend.install()
+        count = backend.rebuild()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully indexed {count} products with {backend.__class__.__name__}')
+        )
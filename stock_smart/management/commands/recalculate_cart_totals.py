@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from stock_smart.models import Cart
+
+class Command(BaseCommand):
+    help = 'Recalcula item_count y total_amount de los carritos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--active-only',
+            action='store_true',
+            help='Recalcular solo los carritos activos'
+        )
+
+    def handle(self, *args, **options):
+        queryset = Cart.objects.all()
+        if options['active_only']:
+            queryset = queryset.filter(is_active=True)
+
+        count = Cart.recalculate_totals(queryset)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully recalculated totals for {count} carts')
+        )
@@ -0,0 +1,21 @@
+import time
+from django.core.management.base import BaseCommand
+from stock_smart.services.inventory import release_expired_reservations
+
+class Command(BaseCommand):
+    help = 'Libera el stock de reservas vencidas (órdenes no pagadas a tiempo)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Seguir liberando como worker')
+        parser.add_argument('--interval', type=float, default=60.0, help='Segundos de espera entre barridos')
+
+    def handle(self, *args, **options):
+        while True:
+            count = release_expired_reservations()
+            if count or not options['loop']:
+                self.stdout.write(f'Released {count} expired stock reservations')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Expired stock reservations released'))
@@ -0,0 +1,23 @@
+import time
+from django.core.management.base import BaseCommand
+from stock_smart.services.outbox import OUTBOX_BATCH_SIZE, send_outbox
+
+class Command(BaseCommand):
+    help = 'Envía los correos pendientes de la bandeja de salida'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=OUTBOX_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Seguir enviando como worker')
+        parser.add_argument('--interval', type=float, default=5.0, help='Segundos de espera con la bandeja vacía')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, total = send_outbox(options['batch_size'])
+            if total:
+                self.stdout.write(f'Sent {sent}/{total} emails')
+            if not options['loop']:
+                break
+            if total < options['batch_size']:
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Email outbox drained'))
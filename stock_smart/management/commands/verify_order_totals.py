@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from stock_smart.models import Order, OrderItem
+from stock_smart.services.order_totals import TOTALS_FIELDS, find_mismatched_totals
+
+class Command(BaseCommand):
+    help = 'Verifica que los totales guardados de las órdenes coincidan con sus items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Recalcular las órdenes con diferencias')
+
+    def handle(self, *args, **options):
+        mismatched = find_mismatched_totals(Order.objects.all(), OrderItem)
+        for order, expected in mismatched:
+            differences = ', '.join(
+                f'{field}={getattr(order, field)} (esperado {expected[field]})'
+                for field in TOTALS_FIELDS if getattr(order, field) != expected[field]
+            )
+            self.stdout.write(self.style.WARNING(f'Orden {order.order_number}: {differences}'))
+
+        if mismatched and options['fix']:
+            Order.recalculate_totals(Order.objects.filter(pk__in=[order.pk for order, _ in mismatched]))
+            self.stdout.write(self.style.SUCCESS(f'Successfully fixed {len(mismatched)} orders'))
+        elif mismatched:
+            self.stdout.write(self.style.ERROR(f'{len(mismatched)} orders with inconsistent totals'))
+        else:
+            self.stdout.write(self.style.SUCCESS('All order totals are consistent'))
@@ -1,6 +1,12 @@
 import uuid
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
 from django.utils.deprecation import MiddlewareMixin
 from django.middleware.csrf import CsrfViewMiddleware
+from whitenoise.middleware import WhiteNoiseMiddleware
+from .services.query_inspector import inspect_queries, log_repeated
 import logging
 
 logger = logging.getLogger(__name__)
@@ -65,4 +71,71 @@ class FlowCsrfMiddleware(CsrfViewMiddleware):
         """Procesar la respuesta para permitir Origin: null"""
         if request.path == '/checkout/payment-success/':
             return response
-        return super().process_response(request, response)
\ No newline at end of file
+        return super().process_response(request, response)
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise compatible con ASGI.
+
+    El middleware original es solo síncrono: bajo ASGI Django lo ejecuta en
+    un único hilo que queda tomado mientras espera a la vista, y las vistas
+    async terminan atendiéndose de a una.
+    """
+    async_capable = True
+
+    def __init__(self, get_response=None):
+        super().__init__(get_response)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+class NPlusOneMiddleware:
+    """
+    Solo con DEBUG: registra un warning cuando un request repite la misma
+    consulta (ver services/query_inspector.py) con la línea que la originó.
+    """
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DEBUG:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with inspect_queries() as inspector:
+            response = self.get_response(request)
+        return self._report(request, response, inspector)
+
+    async def __acall__(self, request):
+        # Las conexiones son por hilo: el wrapper se instala en el hilo de
+        # sync_to_async del request, donde corren el ORM y las vistas síncronas
+        stack = ExitStack()
+        inspector = await sync_to_async(stack.enter_context)(inspect_queries())
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self._report(request, response, inspector)
+
+    def _report(self, request, response, inspector):
+        log_repeated(inspector, f"{request.method} {request.path}")
+        response['X-Query-Count'] = str(inspector.total)
+        return response
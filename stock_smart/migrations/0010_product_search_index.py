@@ -0,0 +1,91 @@
+from django.db import migrations
+from unidecode import unidecode
+
+# SQL y normalización copiados de stock_smart.services.search tal como
+# estaban al crear el índice; la migración no depende del código vivo.
+SQLITE_TABLE = 'stock_smart_product_fts'
+POSTGRES_TABLE = 'stock_smart_product_search'
+CHUNK_SIZE = 2000
+
+INSTALL_SQL = {
+    'sqlite': [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TABLE} "
+        f"USING fts5(name, description, keywords, tokenize = 'unicode61 remove_diacritics 2')",
+        f"DELETE FROM {SQLITE_TABLE}",
+    ],
+    'postgresql': [
+        f"CREATE TABLE IF NOT EXISTS {POSTGRES_TABLE} ("
+        f"product_id bigint PRIMARY KEY REFERENCES stock_smart_product (id) "
+        f"ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+        f"document tsvector NOT NULL)",
+        f"CREATE INDEX IF NOT EXISTS {POSTGRES_TABLE}_document_gin "
+        f"ON {POSTGRES_TABLE} USING GIN (document)",
+    ],
+}
+
+INSERT_SQL = {
+    'sqlite': f"INSERT INTO {SQLITE_TABLE} (rowid, name, description, keywords) VALUES (%s, %s, %s, %s)",
+    'postgresql': (
+        f"INSERT INTO {POSTGRES_TABLE} (product_id, document) VALUES (%s, "
+        f"setweight(to_tsvector('simple', %s), 'A') || "
+        f"setweight(to_tsvector('simple', %s), 'C') || "
+        f"setweight(to_tsvector('simple', %s), 'B')) "
+        f"ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document"
+    ),
+}
+
+DROP_SQL = {
+    'sqlite': f"DROP TABLE IF EXISTS {SQLITE_TABLE}",
+    'postgresql': f"DROP TABLE IF EXISTS {POSTGRES_TABLE}",
+}
+
+
+def normalize_search_text(text):
+    return unidecode(text or '').lower()
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in INSTALL_SQL:
+        # Otros motores usan la búsqueda por LIKE, sin índice
+        return
+
+    Product = apps.get_model('stock_smart', 'Product')
+    rows = Product.objects.values_list(
+        'id', 'name', 'description', 'brand__name', 'category__name'
+    ).order_by().iterator(chunk_size=CHUNK_SIZE)
+
+    with schema_editor.connection.cursor() as cursor:
+        for sql in INSTALL_SQL[vendor]:
+            cursor.execute(sql)
+        chunk = []
+        for product_id, name, description, brand, category in rows:
+            chunk.append((
+                product_id,
+                normalize_search_text(name),
+                normalize_search_text(description),
+                normalize_search_text(f'{brand or ""} {category or ""}'),
+            ))
+            if len(chunk) >= CHUNK_SIZE:
+                cursor.executemany(INSERT_SQL[vendor], chunk)
+                chunk = []
+        if chunk:
+            cursor.executemany(INSERT_SQL[vendor], chunk)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor in DROP_SQL:
+        with schema_editor.connection.cursor() as cursor:
+            cursor.execute(DROP_SQL[vendor])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_smart', '0009_cart_item_count_cart_total_amount'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_smart', '0014_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='invoice',
+            field=models.FileField(blank=True, upload_to='invoices/'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:19
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Sum
+
+# Cálculo copiado de stock_smart.services.order_totals tal como estaba al
+# agregar los campos; la migración no depende del código vivo.
+IVA_RATE = Decimal('0.19')
+TOTALS_FIELDS = ('subtotal_amount', 'iva_amount', 'grand_total')
+BATCH_SIZE = 500
+
+
+def _clp(value):
+    return Decimal(value).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+
+
+def compute_totals(items_gross, shipping_cost=0):
+    gross = _clp(items_gross or 0)
+    subtotal = _clp(gross / (1 + IVA_RATE))
+    return {
+        'subtotal_amount': subtotal,
+        'iva_amount': gross - subtotal,
+        'grand_total': gross + _clp(shipping_cost or 0),
+    }
+
+
+def backfill_order_totals(apps, schema_editor):
+    Order = apps.get_model('stock_smart', 'Order')
+    OrderItem = apps.get_model('stock_smart', 'OrderItem')
+
+    orders = Order.objects.order_by('pk').only('pk', 'shipping_cost', *TOTALS_FIELDS)
+    last_pk = None
+    while True:
+        page = orders if last_pk is None else orders.filter(pk__gt=last_pk)
+        batch = list(page[:BATCH_SIZE])
+        if not batch:
+            return
+        gross = dict(
+            OrderItem.objects.filter(order_id__in=[order.pk for order in batch])
+            .order_by()
+            .values_list('order_id')
+            .annotate(gross=Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2)))
+        )
+        for order in batch:
+            for field, value in compute_totals(gross.get(order.pk), order.shipping_cost).items():
+                setattr(order, field, value)
+        Order.objects.bulk_update(batch, TOTALS_FIELDS)
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_smart', '0015_order_invoice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='grand_total',
+            field=models.DecimalField(decimal_places=0, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='subtotal_amount',
+            field=models.DecimalField(decimal_places=0, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+    ]
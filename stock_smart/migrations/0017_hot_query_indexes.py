@@ -0,0 +1,48 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:32
+
+from django.db import migrations, models
+
+# LIKE 'prefijo%' (order_number__startswith) solo usa un índice si su
+# collation/opclass coincide con la del LIKE, y eso depende del motor
+ORDER_NUMBER_PREFIX_INDEX = {
+    'sqlite': 'CREATE INDEX order_number_prefix_idx ON stock_smart_order (order_number COLLATE NOCASE)',
+    'postgresql': 'CREATE INDEX order_number_prefix_idx ON stock_smart_order (order_number varchar_pattern_ops)',
+}
+
+
+def create_order_number_prefix_index(apps, schema_editor):
+    sql = ORDER_NUMBER_PREFIX_INDEX.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql)
+
+
+def drop_order_number_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ORDER_NUMBER_PREFIX_INDEX:
+        schema_editor.execute('DROP INDEX IF EXISTS order_number_prefix_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_smart', '0016_order_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('flow_token__isnull', False)), fields=['flow_token'], name='order_flow_token_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('active', True)), fields=['-created_at'], name='product_active_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('active', True)), fields=['discount_percentage'], name='product_active_sale_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'stock'], name='product_category_stock_idx'),
+        ),
+        migrations.RunPython(create_order_number_prefix_index, drop_order_number_prefix_index),
+    ]
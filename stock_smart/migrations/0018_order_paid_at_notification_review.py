@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_smart', '0017_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='paid_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='paymentnotification',
+            name='status',
+            field=models.CharField(choices=[('received', 'Recibida'), ('processed', 'Procesada'), ('failed', 'Fallida'), ('review', 'Requiere revisión')], default='received', max_length=20),
+        ),
+    ]
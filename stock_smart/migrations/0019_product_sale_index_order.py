@@ -0,0 +1,21 @@
+# Generated by Django 5.1.2 on 2026-10-18 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stock_smart', '0018_order_paid_at_notification_review'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='product',
+            name='product_active_sale_idx',
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('active', True)), fields=['discount_percentage', 'created_at'], name='product_active_sale_idx'),
+        ),
+    ]
@@ -1,10 +1,11 @@
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, connection, transaction, IntegrityError
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.text import slugify
 from django.conf import settings
 from django.core.exceptions import ValidationError
+from django.db.models.functions import Coalesce, Floor, Round
 from unidecode import unidecode
 from decimal import Decimal
 import datetime
@@ -110,11 +111,11 @@ class Pedido(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.numero_seguimiento:
-            fecha = timezone.now()
-            pedidos_hoy = Pedido.objects.filter(
-                fecha_pedido__date=fecha.date()
-            ).count()
-            self.numero_seguimiento = f"{fecha.strftime('%d%m%Y')}{str(pedidos_hoy + 1).zfill(3)}"
+            from .services.order_numbers import next_sequence_value
+
+            fecha = timezone.localdate()
+            numero = next_sequence_value('PEDIDO', fecha)
+            self.numero_seguimiento = f"{fecha.strftime('%d%m%Y')}{str(numero).zfill(3)}"
         
         if not self.iva:
             self.iva = round(float(self.subtotal) * 0.19, 2)
@@ -131,23 +132,96 @@ class Pedido(models.Model):
     def items(self):
         return self.pedidoitem_set.all()
 
+class OrderSequence(models.Model):
+    """
+    Contador diario por prefijo para numerar órdenes.
+
+    Cada asignación es un solo UPDATE atómico sobre la fila del día, en vez
+    de buscar el último número con un `startswith` sobre las órdenes.
+    """
+    prefix = models.CharField(max_length=20)
+    day = models.DateField()
+    last_value = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['prefix', 'day'], name='unique_order_sequence_day'),
+        ]
+
+    # prefijo -> (modelo, campo, formato de la parte fija antes del correlativo)
+    NUMBERED_FIELDS = {
+        'ORD': ('Order', 'order_number', 'ORD%d%m%y'),
+        'ORDER': ('Order', 'order_number', '%d%m%y'),
+        'PEDIDO': ('Pedido', 'numero_seguimiento', '%d%m%Y'),
+    }
+
+    def __str__(self):
+        return f"{self.prefix} {self.day}: {self.last_value}"
+
+    @classmethod
+    def existing_max(cls, prefix, day):
+        """
+        Mayor correlativo ya usado en `day` por las filas numeradas con
+        `prefix`. Las órdenes creadas antes de OrderSequence (o el mismo día
+        del despliegue) no pasaron por el contador.
+        """
+        if prefix not in cls.NUMBERED_FIELDS:
+            return 0
+        model_name, field, date_format = cls.NUMBERED_FIELDS[prefix]
+        start = day.strftime(date_format)
+        numbers = cls._meta.apps.get_model('stock_smart', model_name).objects.filter(
+            **{f'{field}__startswith': start}
+        ).values_list(field, flat=True)
+        suffixes = (number[len(start):] for number in numbers)
+        return max((int(suffix) for suffix in suffixes if suffix.isdigit()), default=0)
+
+    @classmethod
+    def reserve(cls, prefix, day, count=1):
+        """Reserva `count` números y retorna el último (el bloque es last-count+1..last)"""
+        while True:
+            value = cls._increment(prefix, day, count)
+            if value is not None:
+                return value
+            try:
+                with transaction.atomic():
+                    # La fila del día parte desde los números ya existentes
+                    last = cls.existing_max(prefix, day) + count
+                    cls.objects.create(prefix=prefix, day=day, last_value=last)
+                return last
+            except IntegrityError:
+                # Otro proceso creó la fila del día; reintentar el UPDATE
+                continue
+
+    @classmethod
+    def _increment(cls, prefix, day, count):
+        if connection.vendor in ('postgresql', 'sqlite'):
+            # UPDATE ... RETURNING: incremento y lectura en una sola sentencia
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"UPDATE {cls._meta.db_table} SET last_value = last_value + %s "
+                    f"WHERE prefix = %s AND day = %s RETURNING last_value",
+                    [count, prefix, connection.ops.adapt_datefield_value(day)]
+                )
+                row = cursor.fetchone()
+            return row[0] if row else None
+
+        with transaction.atomic():
+            updated = cls.objects.filter(prefix=prefix, day=day).update(
+                last_value=models.F('last_value') + count
+            )
+            if not updated:
+                return None
+            # La fila queda bloqueada por el UPDATE hasta el commit
+            return cls.objects.filter(prefix=prefix, day=day).values_list('last_value', flat=True).get()
+
+
 def generate_order_number():
     """Genera un número de orden con formato DDMMAAXXXX"""
-    today = timezone.now()
-    date_str = today.strftime("%d%m%y")
-    
-    # Obtener el último número de orden del día
-    last_order = Order.objects.filter(
-        order_number__startswith=f'ORD{date_str}'
-    ).order_by('-order_number').first()
-    
-    if last_order:
-        last_number = int(last_order.order_number[-4:])
-        new_number = str(last_number + 1).zfill(4)
-    else:
-        new_number = '0001'
-    
-    return f'ORD{date_str}{new_number}'
+    from .services.order_numbers import next_sequence_value
+
+    today = timezone.localdate()
+    new_number = str(next_sequence_value('ORD', today)).zfill(4)
+    return f'ORD{today.strftime("%d%m%y")}{new_number}'
 
 class Order(models.Model):
     STATUS_CHOICES = (
@@ -180,6 +254,7 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     payment_status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='pending')
+    paid_at = models.DateTimeField(null=True, blank=True)
     payment_method = models.CharField(max_length=20, choices=PAYMENT_CHOICES)
     shipping_method = models.CharField(max_length=20, choices=SHIPPING_METHOD_CHOICES, default='pickup')
     
@@ -203,6 +278,11 @@ class Order(models.Model):
     final_price = models.DecimalField(max_digits=10, decimal_places=0, default=0)
     iva_amount = models.DecimalField(max_digits=10, decimal_places=0, default=0)
     total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    # Totales guardados en pesos enteros; se recalculan al cambiar los items
+    # (ver services/order_totals.py y la señal de OrderItem)
+    subtotal_amount = models.DecimalField(max_digits=12, decimal_places=0, default=0)
+    grand_total = models.DecimalField(max_digits=12, decimal_places=0, default=0)
     
     # Relación con el producto (permitir null para órdenes existentes)
     product = models.ForeignKey(
@@ -219,23 +299,20 @@ class Order(models.Model):
     shipping_address = models.TextField(blank=True, null=True)
     payment_method = models.CharField(max_length=20, choices=PAYMENT_CHOICES)
     observaciones = models.TextField(blank=True, null=True)
+
+    # Boleta PDF ya generada (ruta por hash del contenido, ver services/invoices.py)
+    invoice = models.FileField(upload_to='invoices/', blank=True)
     
     def save(self, *args, **kwargs):
         if not self.order_number:
-            today = timezone.now()
-            date_prefix = today.strftime('%d%m%y')
-            
-            last_order = Order.objects.filter(
-                order_number__startswith=date_prefix
-            ).order_by('-order_number').first()
-            
-            if last_order:
-                last_number = int(last_order.order_number[-3:])
-                new_number = str(last_number + 1).zfill(3)
-            else:
-                new_number = '001'
-            
-            self.order_number = f"{date_prefix}{new_number}"
+            from .services.order_numbers import next_sequence_value
+
+            today = timezone.localdate()
+            new_number = str(next_sequence_value('ORDER', today)).zfill(3)
+            self.order_number = f"{today.strftime('%d%m%y')}{new_number}"
+
+        # El despacho puede cambiar sin tocar los items
+        self.grand_total = self.subtotal_amount + self.iva_amount + (self.shipping_cost or 0)
         
         super().save(*args, **kwargs)
 
@@ -244,6 +321,12 @@ class Order(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Retorno y confirmación de Flow buscan la orden por token.
+            # Las búsquedas por prefijo de order_number usan un índice propio
+            # de cada motor creado en la migración 0017
+            models.Index(fields=['flow_token'], condition=models.Q(flow_token__isnull=False), name='order_flow_token_idx'),
+        ]
 
     @property
     def full_name(self):
@@ -257,31 +340,36 @@ class Order(models.Model):
     def calculate_total(self):
         return sum(item.total for item in self.orderitem_set.all())
 
+    @classmethod
+    def recalculate_totals(cls, queryset=None):
+        """Recalcula subtotal, IVA y total general de las órdenes en lotes"""
+        from .services.order_totals import recalculate_order_totals
+
+        if queryset is None:
+            queryset = cls.objects.all()
+        return recalculate_order_totals(queryset, OrderItem)
+
+    def refresh_totals(self):
+        """Recalcula y guarda los totales de esta orden (2 consultas)"""
+        from .services.order_totals import TOTALS_FIELDS, compute_totals, items_gross_by_order
+
+        gross = items_gross_by_order(OrderItem, [self.pk]).get(self.pk)
+        totals = compute_totals(gross, self.shipping_cost)
+        Order.objects.filter(pk=self.pk).update(**totals)
+        for field in TOTALS_FIELDS:
+            setattr(self, field, totals[field])
+
     def get_subtotal(self):
-        """Calcula el subtotal de la orden (sin IVA)"""
-        try:
-            subtotal = sum(item.get_total() for item in self.orderitem_set.all())
-            return round(subtotal / Decimal('1.19'), 0)  # Dividir por 1.19 para obtener el subtotal sin IVA
-        except Exception as e:
-            logger.error(f"Error calculando subtotal: {str(e)}")
-            return Decimal('0')
+        """Subtotal de la orden (sin IVA)"""
+        return self.subtotal_amount
 
     def get_iva(self):
-        """Calcula el IVA de la orden (19%)"""
-        try:
-            subtotal = self.get_subtotal()
-            return round(subtotal * Decimal('0.19'), 0)
-        except Exception as e:
-            logger.error(f"Error calculando IVA: {str(e)}")
-            return Decimal('0')
+        """IVA de la orden (19%)"""
+        return self.iva_amount
 
     def get_total(self):
-        """Calcula el total de la orden (con IVA)"""
-        try:
-            return self.get_subtotal() + self.get_iva()
-        except Exception as e:
-            logger.error(f"Error calculando total: {str(e)}")
-            return Decimal('0')
+        """Total de los items (con IVA, sin despacho)"""
+        return self.subtotal_amount + self.iva_amount
 
 class OrderTracking(models.Model):
     """Modelo para registrar el historial de estados de una orden"""
@@ -439,6 +527,123 @@ class Category(models.Model):
     def get_children(self):
         return self.children.filter(is_active=True)
 
+IVA_FACTOR = Decimal('1.19')
+PRICE_FIELD = models.DecimalField(max_digits=12, decimal_places=2)
+
+
+def product_prices(product):
+    """
+    Descuento, precio final, neto e IVA de un producto en pesos enteros.
+
+    Misma fórmula que ProductQuerySet.with_prices(): el descuento se trunca
+    a pesos y el neto e IVA se desglosan del precio final con descuento
+    (lo que paga el cliente), no del precio publicado.
+    """
+    published = Decimal(product.published_price or 0)
+    discount = Decimal(0)
+    if product.discount_percentage and product.discount_percentage > 0:
+        discount = (published * Decimal(product.discount_percentage) / 100).to_integral_value(rounding='ROUND_FLOOR')
+    final = published - discount
+    net = (final / IVA_FACTOR).to_integral_value(rounding='ROUND_HALF_UP')
+    return {'discount_amount': discount, 'final_price': final, 'net_price': net, 'iva_amount': final - net}
+
+
+PRICE_INPUT_FIELDS = ('published_price', 'discount_percentage')
+
+
+def _price_inputs(instance):
+    # Desde __dict__ para no cargar campos diferidos
+    return tuple(instance.__dict__.get(field) for field in PRICE_INPUT_FIELDS)
+
+
+class AnnotatedPrice:
+    """
+    Precio calculado en Python salvo que el queryset lo haya anotado
+    (with_prices()); en ese caso se usa el valor que trajo la BD mientras
+    published_price y discount_percentage no cambien en la instancia.
+    """
+
+    def __init__(self, compute):
+        self.compute = compute
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.cache_name = f'_annotated_{name}'
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        cached = instance.__dict__.get(self.cache_name)
+        if cached is not None and cached[1] == _price_inputs(instance):
+            return cached[0]
+        return self.compute(instance)
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.cache_name] = (value, _price_inputs(instance))
+
+
+def discount_amount_expression(prefix=''):
+    """Descuento truncado a pesos como expresión SQL; `prefix` para usarlo desde otra tabla"""
+    published = models.F(f'{prefix}published_price')
+    percentage = models.F(f'{prefix}discount_percentage')
+    return Floor(
+        models.Case(
+            models.When(**{f'{prefix}discount_percentage__gt': 0}, then=published * percentage / 100),
+            default=models.Value(0),
+            output_field=PRICE_FIELD,
+        ),
+        output_field=PRICE_FIELD,
+    )
+
+
+def final_price_expression(prefix=''):
+    """Precio final (con descuento) como expresión SQL"""
+    return models.ExpressionWrapper(
+        models.F(f'{prefix}published_price') - discount_amount_expression(prefix), output_field=PRICE_FIELD
+    )
+
+
+# Columnas que usan las tarjetas de producto en los listados (sin description).
+# created_at e id van siempre porque son la clave de la paginación por cursor
+CATALOG_FIELDS = (
+    'id', 'name', 'slug', 'published_price', 'discount_percentage', 'stock', 'reserved_stock',
+    'active', 'is_featured', 'image', 'created_at',
+    'category', 'category__name', 'category__slug',
+    'brand', 'brand__name', 'brand__slug',
+)
+
+
+class ProductQuerySet(models.QuerySet):
+    def catalog(self):
+        """
+        Productos para listados: solo las columnas de la tarjeta, categoría
+        y marca en el mismo JOIN y los precios calculados por la BD.
+        """
+        return self.select_related('category', 'brand').only(*CATALOG_FIELDS).with_prices()
+
+    def with_prices(self):
+        """
+        Anota discount_amount, final_price, net_price e iva_amount como
+        expresiones SQL para filtrar, ordenar y agregar por el precio que
+        paga el cliente (neto e IVA incluidos, sobre el precio con
+        descuento). Los valores coinciden con product_prices().
+        """
+        if 'final_price' in self.query.annotations:
+            return self
+        return self.annotate(
+            discount_amount=discount_amount_expression(),
+            final_price=models.ExpressionWrapper(
+                models.F('published_price') - models.F('discount_amount'), output_field=PRICE_FIELD
+            ),
+        ).annotate(
+            net_price=Round(models.F('final_price') / models.Value(IVA_FACTOR), output_field=PRICE_FIELD),
+        ).annotate(
+            iva_amount=models.ExpressionWrapper(
+                models.F('final_price') - models.F('net_price'), output_field=PRICE_FIELD
+            ),
+        )
+
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(unique=True, blank=True, null=True)
@@ -448,15 +653,29 @@ class Product(models.Model):
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
     brand = models.ForeignKey(Brand, on_delete=models.SET_NULL, null=True)
     stock = models.PositiveIntegerField(default=0)
+    # Unidades apartadas por órdenes pendientes de pago (StockReservation)
+    reserved_stock = models.PositiveIntegerField(default=0)
     active = models.BooleanField(default=True)
     is_featured = models.BooleanField(default=False, verbose_name="Destacado")
     image = models.ImageField(upload_to='products/', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Producto"
         verbose_name_plural = "Productos"
         ordering = ['-created_at']
+        indexes = [
+            # Listados públicos: activos más recientes y ofertas activas (mayor descuento primero)
+            models.Index(fields=['-created_at'], condition=models.Q(active=True), name='product_active_recent_idx'),
+            models.Index(
+                fields=['discount_percentage', 'created_at'], condition=models.Q(active=True),
+                name='product_active_sale_idx'
+            ),
+            # Productos con stock de una categoría
+            models.Index(fields=['category', 'stock'], name='product_category_stock_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -467,37 +686,20 @@ class Product(models.Model):
         return self.name
 
     @property
-    def net_price(self):
-        """Calcula el precio neto (sin IVA)"""
-        return int(self.published_price / 1.19)
-
-    @property
-    def iva_amount(self):
-        """Calcula el monto del IVA"""
-        return int(self.published_price - self.net_price)
+    def available_stock(self):
+        """Stock que aún se puede vender (descontando reservas)"""
+        return max(self.stock - self.reserved_stock, 0)
 
-    @property
-    def discount_amount(self):
-        """Calcula el monto del descuento"""
-        if self.discount_percentage > 0:
-            return int((self.published_price * self.discount_percentage) / 100)
-        return 0
-
-    @property
-    def final_price(self):
-        """Calcula el precio final con descuento"""
-        return self.published_price - self.discount_amount
+    # Precios de venta en pesos: con with_prices() vienen calculados por la BD.
+    # Neto e IVA se desglosan del precio final con descuento.
+    discount_amount = AnnotatedPrice(lambda product: product_prices(product)['discount_amount'])
+    final_price = AnnotatedPrice(lambda product: product_prices(product)['final_price'])
+    net_price = AnnotatedPrice(lambda product: product_prices(product)['net_price'])
+    iva_amount = AnnotatedPrice(lambda product: product_prices(product)['iva_amount'])
 
     @property
     def get_final_price(self):
-        try:
-            if self.discount_percentage and self.discount_percentage > 0:
-                discount = (self.published_price * self.discount_percentage) / Decimal('100')
-                return self.published_price - discount
-            return self.published_price
-        except Exception as e:
-            print(f"Error calculando precio final: {str(e)}")
-            return Decimal('0')
+        return self.final_price
 
 class Profile(models.Model):
     user = models.OneToOneField(
@@ -517,6 +719,10 @@ class Cart(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
 
+    # Totales desnormalizados, mantenidos por las señales de CartItem
+    item_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
     class Meta:
         indexes = [
             models.Index(fields=['visitor_id', 'is_active']),
@@ -558,17 +764,41 @@ class Cart(models.Model):
         
         return cart
 
-    # Agregar método para calcular total
     @property
     def total(self):
-        return sum(item.total for item in self.cartitem_set.all())
-    
-    # Agregar método para contar items
-    @property
-    def item_count(self):
-        return self.cartitem_set.aggregate(
-            total=models.Sum('quantity')
-        )['total'] or 0
+        return self.total_amount
+
+    @classmethod
+    def recalculate_totals(cls, queryset=None):
+        """Recalcula item_count y total_amount de los carritos con un único UPDATE"""
+        if queryset is None:
+            queryset = cls.objects.all()
+
+        items = CartItem.objects.filter(cart=models.OuterRef('pk')).order_by().values('cart')
+        count_subquery = items.annotate(
+            count=models.Sum('quantity')
+        ).values('count')
+        amount_subquery = items.annotate(
+            amount=models.Sum(
+                models.F('quantity') * final_price_expression('product__'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)
+            )
+        ).values('amount')
+
+        return queryset.update(
+            item_count=Coalesce(models.Subquery(count_subquery), 0),
+            total_amount=Coalesce(
+                models.Subquery(amount_subquery),
+                Decimal('0'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)
+            ),
+            updated_at=timezone.now()
+        )
+
+    def refresh_totals(self):
+        """Recalcula los totales de este carrito y los recarga en la instancia"""
+        Cart.recalculate_totals(Cart.objects.filter(pk=self.pk))
+        self.refresh_from_db(fields=['item_count', 'total_amount', 'updated_at'])
 
 class CartItem(models.Model):
     cart = models.ForeignKey('Cart', on_delete=models.CASCADE)
@@ -629,6 +859,117 @@ class OrderItem(models.Model):
             logger.error(f"Error calculando total del item: {str(e)}")
             return Decimal('0')
 
+class StockReservation(models.Model):
+    """
+    Unidades de un producto apartadas para una orden.
+
+    Al crear la orden se reserva (held) con vencimiento; al confirmar el
+    pago se descuenta del stock (committed) y si vence o falla el pago se
+    libera (released). Ver services/inventory.py.
+    """
+    HELD = 'held'
+    COMMITTED = 'committed'
+    RELEASED = 'released'
+    STATUS_CHOICES = (
+        (HELD, 'Reservado'),
+        (COMMITTED, 'Descontado'),
+        (RELEASED, 'Liberado'),
+    )
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='stock_reservations')
+    product = models.ForeignKey('Product', on_delete=models.PROTECT, related_name='stock_reservations')
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='stock_reservation_expiry'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity}x {self.product_id} ({self.status}) orden {self.order_id}"
+
+class PaymentNotification(models.Model):
+    """
+    Bandeja de entrada de webhooks de las pasarelas de pago.
+
+    Los webhooks solo insertan aquí (una fila por proveedor y referencia,
+    los reintentos de la pasarela se descartan por la restricción única) y
+    `manage.py process_payment_notifications` aplica los cambios a las órdenes.
+    """
+    RECEIVED = 'received'
+    PROCESSED = 'processed'
+    FAILED = 'failed'
+    # Pago confirmado que no se pudo aplicar solo (p. ej. sin stock)
+    REVIEW = 'review'
+    STATUS_CHOICES = (
+        (RECEIVED, 'Recibida'),
+        (PROCESSED, 'Procesada'),
+        (FAILED, 'Fallida'),
+        (REVIEW, 'Requiere revisión'),
+    )
+
+    provider = models.CharField(max_length=20)
+    reference = models.CharField(max_length=255)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=RECEIVED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'reference'], name='unique_payment_notification'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='payment_notification_queue'),
+        ]
+
+    def __str__(self):
+        return f"{self.provider}:{self.reference} ({self.status})"
+
+class OutboxEmail(models.Model):
+    """
+    Correos pendientes de envío.
+
+    Se insertan en la misma transacción que el cambio que los origina (si
+    ésta se revierte, el correo no existe) y `manage.py send_outbox` los
+    envía por lotes fuera del request.
+    """
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pendiente'),
+        (SENT, 'Enviado'),
+        (FAILED, 'Fallido'),
+    )
+
+    # Evita duplicar un mismo aviso (p. ej. 'order-paid:15')
+    key = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='outbox_email_queue'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+
 class Payment(BasePayment):
     def get_failure_url(self):
         return 'http://' + settings.PAYMENT_HOST + reverse('payment:failed')
@@ -0,0 +1,361 @@
+import logging
+from dataclasses import dataclass, field
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+from ..models import Cart, CartItem, Product
+
+logger = logging.getLogger(__name__)
+
+CART_SESSION_KEY = 'cart'
+# Atributo del request donde se guarda el conteo leído (vale solo ese request)
+CART_COUNT_ATTR = '_cart_count'
+CART_CACHE_KEY = 'cart:{identity}'
+CART_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+# Columnas necesarias para precios y templates del carrito
+CART_PRODUCT_FIELDS = (
+    'id', 'name', 'slug', 'image', 'published_price',
+    'discount_percentage', 'stock', 'active',
+)
+
+DEFAULT_CART_BACKENDS = {
+    'guest': 'stock_smart.services.cart.SessionCartBackend',
+    'user': 'stock_smart.services.cart.DatabaseCartBackend',
+}
+
+
+def _visitor_key(request):
+    """Identificador estable del visitante anónimo (cookie o sesión)"""
+    visitor_id = getattr(request, 'visitor_id', None)
+    if visitor_id:
+        return visitor_id
+    if not request.session.session_key:
+        request.session.save()
+    return request.session.session_key
+
+
+@dataclass(frozen=True)
+class CartLine:
+    product: Product
+    quantity: int
+    price: Decimal
+    total: Decimal
+
+
+@dataclass(frozen=True)
+class CartSnapshot:
+    """Estado del carrito con productos y precios resueltos"""
+    lines: list = field(default_factory=list)
+    subtotal: Decimal = Decimal('0')
+    count: int = 0
+    missing_ids: tuple = ()
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def __bool__(self):
+        return bool(self.lines)
+
+    def get(self, product_id):
+        for line in self.lines:
+            if line.product.id == int(product_id):
+                return line
+        return None
+
+
+def load_cart_products(product_ids):
+    """Productos del carrito en una sola consulta, solo con CART_PRODUCT_FIELDS"""
+    if not product_ids:
+        return {}
+    return Product.objects.only(*CART_PRODUCT_FIELDS).in_bulk(list(product_ids))
+
+
+def hydrate_cart(quantities):
+    """Construye un CartSnapshot desde {product_id: cantidad} con una consulta"""
+    products = load_cart_products(quantities)
+
+    lines = []
+    missing_ids = []
+    subtotal = Decimal('0')
+    count = 0
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None:
+            logger.warning(f"Producto {product_id} no encontrado, ignorando")
+            missing_ids.append(product_id)
+            continue
+        price = product.get_final_price
+        line_total = price * quantity
+        lines.append(CartLine(product=product, quantity=quantity, price=price, total=line_total))
+        subtotal += line_total
+        count += quantity
+
+    return CartSnapshot(lines=lines, subtotal=subtotal, count=count, missing_ids=tuple(missing_ids))
+
+
+class BaseCartBackend:
+    """
+    Almacenamiento de un carrito como {product_id: cantidad}.
+
+    Las subclases implementan load, set_quantity y clear; count y total
+    pueden sobrescribirse cuando el backend tiene un valor precalculado.
+    """
+
+    def __init__(self, request, user=None):
+        self.request = request
+        self.user = user
+
+    def load(self):
+        raise NotImplementedError
+
+    def set_quantity(self, product_id, quantity, product=None):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def count(self):
+        return sum(self.load().values())
+
+    def total(self):
+        return None
+
+
+class SessionCartBackend(BaseCartBackend):
+    """Carrito en request.session['cart'] (formato {id: {quantity, price, name}})"""
+
+    def _raw(self):
+        return self.request.session.get(CART_SESSION_KEY, {})
+
+    def load(self):
+        quantities = {}
+        for product_id, item in self._raw().items():
+            # Ignorar entradas con product_id o cantidad inválidos
+            try:
+                product_id = int(product_id)
+                quantity = int(item.get('quantity', 0) if isinstance(item, dict) else item)
+            except (TypeError, ValueError):
+                logger.warning(f"Ignorando entrada inválida en carrito: {product_id}")
+                continue
+            if quantity > 0:
+                quantities[product_id] = quantity
+        return quantities
+
+    def set_quantity(self, product_id, quantity, product=None):
+        cart = dict(self._raw())
+        key = str(product_id)
+        if quantity <= 0:
+            cart.pop(key, None)
+        else:
+            item = cart.get(key) if isinstance(cart.get(key), dict) else {}
+            item = dict(item, quantity=quantity)
+            if product is not None:
+                item['price'] = str(product.get_final_price)
+                item['name'] = product.name
+            cart[key] = item
+        self.request.session[CART_SESSION_KEY] = cart
+        self.request.session.modified = True
+
+    def clear(self):
+        self.request.session[CART_SESSION_KEY] = {}
+        self.request.session.modified = True
+
+
+class DatabaseCartBackend(BaseCartBackend):
+    """Carrito persistente en Cart/CartItem, por usuario o por visitor_id"""
+
+    def __init__(self, request, user=None):
+        super().__init__(request, user)
+        self._cart = None
+
+    def _lookup(self):
+        if self.user is not None:
+            return {'user': self.user}
+        return {'visitor_id': _visitor_key(self.request), 'user__isnull': True}
+
+    def get_cart(self, create=False):
+        if self._cart is None:
+            self._cart = Cart.objects.filter(
+                is_active=True, **self._lookup()
+            ).order_by('-created_at').first()
+        if self._cart is None and create:
+            if self.user is not None:
+                self._cart = Cart.objects.create(user=self.user, is_active=True)
+            else:
+                self._cart = Cart.objects.create(
+                    visitor_id=_visitor_key(self.request),
+                    is_guest=True,
+                    is_active=True
+                )
+        return self._cart
+
+    def load(self):
+        cart = self.get_cart()
+        if cart is None:
+            return {}
+        return dict(CartItem.objects.filter(cart=cart).values_list('product_id', 'quantity'))
+
+    def set_quantity(self, product_id, quantity, product=None):
+        with transaction.atomic():
+            cart = self.get_cart(create=True)
+            if quantity <= 0:
+                CartItem.objects.filter(cart=cart, product_id=product_id).delete()
+            else:
+                CartItem.objects.update_or_create(
+                    cart=cart,
+                    product_id=product_id,
+                    defaults={'quantity': quantity}
+                )
+            # Totales desnormalizados (mantenidos por las señales de CartItem)
+            cart.refresh_from_db(fields=['item_count', 'total_amount'])
+        setattr(self.request, CART_COUNT_ATTR, cart.item_count)
+
+    def clear(self):
+        cart = self.get_cart()
+        if cart is not None:
+            Cart.objects.filter(pk=cart.pk).update(is_active=False)
+            self._cart = None
+        setattr(self.request, CART_COUNT_ATTR, 0)
+
+    def count(self):
+        # item_count lo mantienen las señales de CartItem, así que está al día
+        # aunque el carrito cambie desde otra sesión o el admin; se lee una vez por request
+        count = getattr(self.request, CART_COUNT_ATTR, None)
+        if count is None:
+            cart = self.get_cart()
+            count = cart.item_count if cart else 0
+            setattr(self.request, CART_COUNT_ATTR, count)
+        return count
+
+    def total(self):
+        cart = self.get_cart()
+        return cart.total_amount if cart else Decimal('0')
+
+
+class CacheCartBackend(BaseCartBackend):
+    """Carrito en la caché de Django, por usuario o por visitante"""
+
+    def _key(self):
+        identity = f'user:{self.user.pk}' if self.user is not None else _visitor_key(self.request)
+        return CART_CACHE_KEY.format(identity=identity)
+
+    def load(self):
+        return dict(cache.get(self._key(), {}))
+
+    def set_quantity(self, product_id, quantity, product=None):
+        quantities = self.load()
+        if quantity <= 0:
+            quantities.pop(int(product_id), None)
+        else:
+            quantities[int(product_id)] = quantity
+        cache.set(self._key(), quantities, CART_CACHE_TIMEOUT)
+
+    def clear(self):
+        cache.delete(self._key())
+
+
+def get_cart_backend_class(kind):
+    backends = getattr(settings, 'CART_BACKENDS', {})
+    return import_string(backends.get(kind, DEFAULT_CART_BACKENDS[kind]))
+
+
+class CartService:
+    """
+    API única del carrito. El backend se elige según CART_BACKENDS
+    ('guest' para anónimos, 'user' para usuarios autenticados).
+    """
+
+    def __init__(self, request, backend=None):
+        self.request = request
+        if backend is None:
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                backend = get_cart_backend_class('user')(request, user=user)
+            else:
+                backend = get_cart_backend_class('guest')(request)
+        self.backend = backend
+        self._quantities = None
+        self._snapshot = None
+
+    def _invalidate(self):
+        self._quantities = None
+        self._snapshot = None
+
+    def quantities(self):
+        if self._quantities is None:
+            self._quantities = self.backend.load()
+        return self._quantities
+
+    def quantity(self, product_id):
+        return self.quantities().get(int(product_id), 0)
+
+    def is_empty(self):
+        return not self.quantities()
+
+    def add(self, product, quantity=1):
+        new_quantity = self.quantity(product.id) + quantity
+        self.backend.set_quantity(product.id, new_quantity, product=product)
+        self._invalidate()
+        return new_quantity
+
+    def update(self, product_id, quantity, product=None):
+        self.backend.set_quantity(int(product_id), quantity, product=product)
+        self._invalidate()
+
+    def remove(self, product_id):
+        self.update(product_id, 0)
+
+    def clear(self):
+        self.backend.clear()
+        self._invalidate()
+
+    def count(self):
+        return self.backend.count()
+
+    def snapshot(self):
+        """CartSnapshot del carrito actual (memoizado hasta el próximo cambio)"""
+        if self._snapshot is None:
+            self._snapshot = hydrate_cart(self.quantities())
+        return self._snapshot
+
+    def lines(self):
+        return self.snapshot().lines
+
+    def total(self, lines=None):
+        if lines is None:
+            if self._snapshot is not None:
+                return self._snapshot.subtotal
+            total = self.backend.total()
+            if total is not None:
+                return total
+            return self.snapshot().subtotal
+        return sum((line.total for line in lines), Decimal('0'))
+
+    @classmethod
+    def merge_guest_cart(cls, request, user):
+        """Traspasa el carrito de invitado al carrito del usuario al iniciar sesión"""
+        guest_class = get_cart_backend_class('guest')
+        user_class = get_cart_backend_class('user')
+        if guest_class is user_class and guest_class is SessionCartBackend:
+            # La sesión se conserva al iniciar sesión; no hay nada que traspasar
+            return
+
+        guest = cls(request, backend=guest_class(request))
+        guest_quantities = guest.quantities()
+        if not guest_quantities:
+            return
+
+        user_cart = cls(request, backend=user_class(request, user=user))
+        products = load_cart_products(guest_quantities)
+        for product_id, quantity in guest_quantities.items():
+            product = products.get(product_id)
+            if product is not None:
+                user_cart.add(product, quantity)
+        guest.clear()
+        logger.info(f"Carrito de invitado traspasado al usuario {user.pk}: {len(products)} productos")
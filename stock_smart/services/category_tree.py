@@ -0,0 +1,149 @@
+import logging
+from collections import defaultdict
+from django.core.cache import cache
+from django.http import Http404
+from .tiered_cache import get_or_compute
+
+logger = logging.getLogger(__name__)
+
+CATEGORY_TREE_VERSION_KEY = 'category_tree:version'
+CATEGORY_TREE_KEY = 'category_tree:{version}'
+CATEGORY_TREE_TIMEOUT = 60 * 60 * 24
+
+# Copia en memoria del proceso para no deserializar el árbol en cada request
+_local_tree = {'version': None, 'tree': None}
+
+
+class CategoryTree:
+    """
+    Árbol de categorías completo construido desde una sola consulta.
+
+    Cada instancia de Category queda con su padre cacheado (category.parent
+    no consulta la BD) y con `active_children` precargado para los templates.
+    """
+
+    def __init__(self, categories):
+        from ..models import Category
+
+        self.by_id = {category.id: category for category in categories}
+        self.by_slug = {category.slug: category for category in categories}
+        self.children_ids = defaultdict(list)
+
+        parent_field = Category._meta.get_field('parent')
+        for category in sorted(categories, key=lambda c: c.name):
+            if category.parent_id is not None and category.parent_id in self.by_id:
+                self.children_ids[category.parent_id].append(category.id)
+                parent_field.set_cached_value(category, self.by_id[category.parent_id])
+
+        for category in categories:
+            category.active_children = [
+                self.by_id[child_id]
+                for child_id in self.children_ids[category.id]
+                if self.by_id[child_id].is_active
+            ]
+
+        self.descendant_ids = {}
+        self.active_descendant_ids = {}
+        for category_id in self.by_id:
+            self._build_descendants(category_id)
+
+    def _build_descendants(self, category_id):
+        """Precalcula los ids del subárbol (incluyendo la propia categoría)"""
+        if category_id in self.descendant_ids:
+            return self.descendant_ids[category_id]
+
+        ids = {category_id}
+        active_ids = {category_id} if self.by_id[category_id].is_active else set()
+        for child_id in self.children_ids[category_id]:
+            ids |= self._build_descendants(child_id)
+            if self.by_id[category_id].is_active:
+                active_ids |= self.active_descendant_ids[child_id]
+
+        self.descendant_ids[category_id] = frozenset(ids)
+        self.active_descendant_ids[category_id] = frozenset(active_ids)
+        return self.descendant_ids[category_id]
+
+    def get(self, category_id, active_only=False):
+        category = self.by_id.get(category_id)
+        if category is None or (active_only and not category.is_active):
+            return None
+        return category
+
+    def get_by_slug(self, slug, active_only=False):
+        category = self.by_slug.get(slug)
+        if category is None or (active_only and not category.is_active):
+            return None
+        return category
+
+    def get_or_404(self, category_id=None, slug=None, active_only=False):
+        if slug is not None:
+            category = self.get_by_slug(slug, active_only=active_only)
+        else:
+            category = self.get(category_id, active_only=active_only)
+        if category is None:
+            raise Http404('Categoría no encontrada')
+        return category
+
+    def roots(self, active_only=True):
+        """Categorías principales (sin padre), ordenadas por nombre"""
+        return sorted(
+            (c for c in self.by_id.values()
+             if c.parent_id is None and (c.is_active or not active_only)),
+            key=lambda c: c.name
+        )
+
+    def children(self, category_id, active_only=True):
+        children = [self.by_id[child_id] for child_id in self.children_ids.get(category_id, [])]
+        if active_only:
+            children = [child for child in children if child.is_active]
+        return children
+
+    def active(self):
+        """Todas las categorías activas, ordenadas por nombre"""
+        return sorted((c for c in self.by_id.values() if c.is_active), key=lambda c: c.name)
+
+    def subtree_ids(self, category_id, active_only=True):
+        if active_only:
+            return self.active_descendant_ids.get(category_id, frozenset())
+        return self.descendant_ids.get(category_id, frozenset())
+
+
+def get_category_tree_version():
+    version = cache.get(CATEGORY_TREE_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(CATEGORY_TREE_VERSION_KEY, version, None)
+        version = cache.get(CATEGORY_TREE_VERSION_KEY, version)
+    return version
+
+
+def bump_category_tree_version():
+    """Invalida el árbol cacheado; se llama desde las señales de Category"""
+    try:
+        version = cache.incr(CATEGORY_TREE_VERSION_KEY)
+    except ValueError:
+        version = 2
+        cache.set(CATEGORY_TREE_VERSION_KEY, version, None)
+    logger.info(f"Versión del árbol de categorías actualizada a {version}")
+    return version
+
+
+def get_category_tree():
+    """Retorna el árbol de categorías desde caché, construyéndolo si es necesario"""
+    from ..models import Category
+
+    version = get_category_tree_version()
+    if _local_tree['version'] == version:
+        return _local_tree['tree']
+
+    def build():
+        tree = CategoryTree(list(Category.objects.all()))
+        logger.info(f"Árbol de categorías reconstruido ({len(tree.by_id)} categorías, versión {version})")
+        return tree
+
+    # Un solo worker reconstruye el árbol a la vez; los demás lo esperan
+    tree = get_or_compute(CATEGORY_TREE_KEY.format(version=version), build, CATEGORY_TREE_TIMEOUT, cache=cache)
+
+    _local_tree['version'] = version
+    _local_tree['tree'] = tree
+    return tree
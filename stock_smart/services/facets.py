@@ -0,0 +1,172 @@
+import logging
+from decimal import Decimal, InvalidOperation
+from django.db.models import Count, Q
+from .category_tree import get_category_tree
+
+logger = logging.getLogger(__name__)
+
+# Rangos de precio (CLP): (clave, etiqueta, mínimo, máximo exclusivo)
+PRICE_BUCKETS = (
+    ('0-10000', 'Hasta $10.000', None, Decimal('10000')),
+    ('10000-50000', '$10.000 - $50.000', Decimal('10000'), Decimal('50000')),
+    ('50000-100000', '$50.000 - $100.000', Decimal('50000'), Decimal('100000')),
+    ('100000+', 'Más de $100.000', Decimal('100000'), None),
+)
+
+FLAG_FILTERS = {
+    'on_sale': Q(discount_percentage__gt=0),
+    'in_stock': Q(stock__gt=0),
+    'featured': Q(is_featured=True),
+}
+
+
+def _price_bucket_q(minimum, maximum):
+    condition = Q()
+    if minimum is not None:
+        condition &= Q(final_price__gte=minimum)
+    if maximum is not None:
+        condition &= Q(final_price__lt=maximum)
+    return condition
+
+
+def _to_int_list(values):
+    result = []
+    for value in values:
+        try:
+            result.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    return result
+
+
+def _to_decimal(value):
+    try:
+        return Decimal(value) if value not in (None, '') else None
+    except InvalidOperation:
+        return None
+
+
+class ProductFacets:
+    """
+    Listado de productos activos con filtros y conteos por faceta.
+
+    Cada familia de facetas se cuenta con una sola consulta agregada que
+    aplica todos los filtros excepto los de la propia familia, de modo que
+    los conteos muestran cuántos resultados habría al cambiar esa opción.
+    """
+
+    def __init__(self, params, queryset=None):
+        from ..models import Product
+
+        base = queryset if queryset is not None else Product.objects.catalog().filter(active=True)
+        # Rangos de precio sobre el precio final, calculado en la BD
+        self.base = base.with_prices()
+        self.tree = get_category_tree()
+
+        category_id = _to_int_list([params.get('category')])
+        self.category = self.tree.get(category_id[0], active_only=True) if category_id else None
+        self.brands = _to_int_list(params.getlist('brand'))
+        valid_buckets = {key for key, *_ in PRICE_BUCKETS}
+        self.price_buckets = [key for key in params.getlist('price') if key in valid_buckets]
+        self.min_price = _to_decimal(params.get('min_price'))
+        self.max_price = _to_decimal(params.get('max_price'))
+        self.flags = [flag for flag in FLAG_FILTERS if params.get(flag) in ('1', 'on', 'true')]
+
+    def _filters(self, exclude=None):
+        """Q con todos los filtros activos, salvo los de la familia `exclude`"""
+        condition = Q()
+        if self.category and exclude != 'category':
+            condition &= Q(category_id__in=self.tree.subtree_ids(self.category.id))
+        if self.brands and exclude != 'brand':
+            condition &= Q(brand_id__in=self.brands)
+        if exclude != 'price':
+            if self.price_buckets:
+                buckets = Q()
+                for key, _, minimum, maximum in PRICE_BUCKETS:
+                    if key in self.price_buckets:
+                        buckets |= _price_bucket_q(minimum, maximum)
+                condition &= buckets
+            if self.min_price is not None:
+                condition &= Q(final_price__gte=self.min_price)
+            if self.max_price is not None:
+                condition &= Q(final_price__lte=self.max_price)
+        if exclude != 'flags':
+            for flag in self.flags:
+                condition &= FLAG_FILTERS[flag]
+        return condition
+
+    def results(self):
+        return self.base.filter(self._filters())
+
+    def category_counts(self):
+        """Conteos por categoría acumulados hacia arriba en el árbol"""
+        rows = (
+            self.base.filter(self._filters(exclude='category'))
+            .order_by()
+            .values_list('category_id')
+            .annotate(total=Count('id'))
+        )
+        direct = dict(rows)
+        if self.category:
+            options = self.tree.children(self.category.id)
+        else:
+            options = self.tree.roots()
+
+        counts = []
+        for category in options:
+            total = sum(direct.get(pk, 0) for pk in self.tree.subtree_ids(category.id))
+            if total:
+                counts.append({'category': category, 'count': total})
+        return counts
+
+    def brand_counts(self):
+        rows = (
+            self.base.filter(self._filters(exclude='brand'), brand__isnull=False)
+            .order_by()
+            .values('brand_id', 'brand__name')
+            .annotate(total=Count('id'))
+            .order_by('brand__name')
+        )
+        return [
+            {
+                'id': row['brand_id'],
+                'name': row['brand__name'],
+                'count': row['total'],
+                'selected': row['brand_id'] in self.brands,
+            }
+            for row in rows
+        ]
+
+    def price_counts(self):
+        aggregates = {
+            f'bucket_{i}': Count('id', filter=_price_bucket_q(minimum, maximum))
+            for i, (_, _, minimum, maximum) in enumerate(PRICE_BUCKETS)
+        }
+        totals = self.base.filter(self._filters(exclude='price')).aggregate(**aggregates)
+        return [
+            {
+                'key': key,
+                'label': label,
+                'count': totals[f'bucket_{i}'],
+                'selected': key in self.price_buckets,
+            }
+            for i, (key, label, _, _) in enumerate(PRICE_BUCKETS)
+        ]
+
+    def flag_counts(self):
+        aggregates = {
+            flag: Count('id', filter=condition) for flag, condition in FLAG_FILTERS.items()
+        }
+        totals = self.base.filter(self._filters(exclude='flags')).aggregate(**aggregates)
+        return {
+            flag: {'count': totals[flag], 'selected': flag in self.flags}
+            for flag in FLAG_FILTERS
+        }
+
+    def facets(self):
+        return {
+            'categories': self.category_counts(),
+            'brands': self.brand_counts(),
+            'prices': self.price_counts(),
+            'flags': self.flag_counts(),
+        }
@@ -1,10 +1,10 @@
 import hmac
 import hashlib
 import json
-import requests
 from typing import Dict, Optional
 from django.conf import settings
 from decimal import Decimal
+from .gateway import get_async_gateway_client, get_gateway_client
 
 class FlowPaymentService:
     def __init__(self):
@@ -12,6 +12,31 @@ class FlowPaymentService:
         self.secret_key = settings.FLOW_SECRET_KEY
         self.api_url = settings.FLOW_API_URL
 
+    def sign(self, params) -> str:
+        """Firma HMAC-SHA256 de los parámetros ordenados alfabéticamente"""
+        to_sign = "".join(f"{k}{v}" for k, v in sorted(params.items()))
+        return hmac.new(self.secret_key.encode(), to_sign.encode(), hashlib.sha256).hexdigest()
+
+    def get_payment_status(self, token) -> Optional[Dict]:
+        """Estado del pago en Flow (status 1 pendiente, 2 pagado, 3 rechazado, 4 anulado)"""
+        params = {"apiKey": self.api_key, "token": token}
+        params["s"] = self.sign(params)
+        response = get_gateway_client("flow").get(f"{self.api_url}/payment/getStatus", params=params)
+        if response.status_code == 200:
+            return response.json()
+        print(f"Error consultando estado en Flow: {response.status_code} - {response.text}")
+        return None
+
+    async def aget_payment_status(self, token) -> Optional[Dict]:
+        """get_payment_status para vistas async (httpx, sin bloquear el worker)"""
+        params = {"apiKey": self.api_key, "token": token}
+        params["s"] = self.sign(params)
+        response = await get_async_gateway_client("flow").get(f"{self.api_url}/payment/getStatus", params=params)
+        if response.status_code == 200:
+            return response.json()
+        print(f"Error consultando estado en Flow: {response.status_code} - {response.text}")
+        return None
+
     def create_payment(self, order) -> Optional[str]:
         try:
             # Datos mínimos requeridos según documentación Flow
@@ -46,7 +71,7 @@ class FlowPaymentService:
             payment_data["s"] = signature
 
             # Realizar petición a Flow
-            response = requests.post(
+            response = get_gateway_client("flow").post(
                 f"{self.api_url}/payment/create",
                 data=payment_data,
                 headers={
@@ -0,0 +1,38 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'catalog:version'
+DEFAULT_FRAGMENT_CACHE_TIMEOUT = 60 * 15
+
+
+def fragment_timeout():
+    return getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', DEFAULT_FRAGMENT_CACHE_TIMEOUT)
+
+
+def get_catalog_version():
+    """
+    Versión del catálogo (productos, marcas, categorías).
+
+    Va en la clave de los fragmentos cacheados ({% cache %}): al cambiar la
+    versión las claves viejas dejan de usarse y expiran solas.
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = 1
+        cache.add(CATALOG_VERSION_KEY, version, None)
+        version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    """Invalida los fragmentos del catálogo; se llama desde las señales"""
+    try:
+        version = cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        version = 2
+        cache.set(CATALOG_VERSION_KEY, version, None)
+    logger.info(f"Versión del catálogo actualizada a {version}")
+    return version
@@ -0,0 +1,314 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+import httpx
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# (conexión, lectura) en segundos
+DEFAULT_TIMEOUT = (3.05, 15)
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF = 0.3
+DEFAULT_POOL_SIZE = 10
+# Conexiones simultáneas del cliente async (muchas vistas esperan a la vez)
+ASYNC_MAX_CONNECTIONS = 100
+# El circuito se abre tras N fallas seguidas y se prueba de nuevo a los X segundos
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+
+class GatewayError(Exception):
+    pass
+
+
+class GatewayUnavailable(GatewayError):
+    """El circuito está abierto: la pasarela falló hace poco y no se llama"""
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._state = self.CLOSED
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+        return self._state
+
+    def allow(self):
+        """True si se puede llamar; en semiabierto deja pasar una sola prueba"""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN:
+                # La prueba vuelve a abrir el circuito hasta que tenga éxito
+                self._state = self.OPEN
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class GatewayClient:
+    """
+    Cliente HTTP compartido para una pasarela de pago.
+
+    Reutiliza conexiones keep-alive con un requests.Session por proceso,
+    aplica timeouts, reintenta con backoff y jitter (los POST solo si la
+    conexión nunca se estableció) y corta las llamadas con un circuit
+    breaker cuando la pasarela falla seguido. Cada llamada deja una línea
+    de métricas en el log.
+    """
+
+    def __init__(self, name, base_url='', timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, pool_size=DEFAULT_POOL_SIZE, breaker=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        # Una sesión por proceso: los workers de gunicorn no comparten sockets
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session, self._pid = session, os.getpid()
+        return self._session
+
+    def url(self, path):
+        if path.startswith(('http://', 'https://')):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _sleep(self, attempt):
+        time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+
+    def _log_call(self, method, url, status, attempt, elapsed):
+        logger.info(
+            f"gateway={self.name} method={method} url={url} status={status} "
+            f"attempt={attempt} elapsed_ms={elapsed * 1000:.1f}"
+        )
+
+    def request(self, method, path, **kwargs):
+        method = method.upper()
+        url = self.url(path)
+        if not self.breaker.allow():
+            logger.warning(f"gateway={self.name} circuito abierto, se omite {method} {url}")
+            raise GatewayUnavailable(f'{self.name} no disponible temporalmente')
+
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.RequestException as e:
+                self._log_call(method, url, type(e).__name__, attempt + 1, time.perf_counter() - start)
+                # Sin conexión el POST no llegó a la pasarela y es seguro repetirlo
+                retryable = method in IDEMPOTENT_METHODS or isinstance(e, requests.ConnectTimeout)
+                if attempt < self.retries and retryable:
+                    self._sleep(attempt)
+                    continue
+                self.breaker.record_failure()
+                raise GatewayError(f'{self.name}: {str(e)}') from e
+
+            self._log_call(method, url, response.status_code, attempt + 1, time.perf_counter() - start)
+            if response.status_code not in RETRY_STATUSES:
+                self.breaker.record_success()
+                return response
+            if attempt < self.retries and method in IDEMPOTENT_METHODS:
+                self._sleep(attempt)
+                continue
+            self.breaker.record_failure()
+            return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+
+async def _close_on_loop_shutdown(client):
+    """
+    Cierra `client` cuando termina su event loop: asyncio.run, async_to_sync
+    y uvicorn llaman a loop.shutdown_asyncgens() antes de cerrar el loop,
+    y eso ejecuta el finally de los generadores async vivos.
+    """
+    try:
+        yield
+    finally:
+        await client.aclose()
+
+
+class AsyncGatewayClient(GatewayClient):
+    """
+    Versión asíncrona (httpx) para vistas async bajo ASGI.
+
+    Usa la misma configuración, política de reintentos y circuit breaker
+    que el cliente síncrono de la pasarela. El pool de httpx es por event
+    loop y se cierra al terminar ese loop.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # loop -> (cliente httpx, generador que lo cierra con el loop)
+        self._loop_clients = weakref.WeakKeyDictionary()
+
+    async def get_client(self):
+        loop = asyncio.get_running_loop()
+        entry = self._loop_clients.get(loop)
+        if entry is None:
+            connect, read = self.timeout
+            client = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=self.pool_size),
+            )
+            closer = _close_on_loop_shutdown(client)
+            await closer.__anext__()
+            entry = self._loop_clients[loop] = (client, closer)
+        return entry[0]
+
+    async def aclose(self):
+        """Cierra el pool del loop actual (p. ej. al apagar el servidor)"""
+        entry = self._loop_clients.pop(asyncio.get_running_loop(), None)
+        if entry is not None:
+            await entry[1].aclose()
+
+    async def request(self, method, path, **kwargs):
+        method = method.upper()
+        url = self.url(path)
+        if not self.breaker.allow():
+            logger.warning(f"gateway={self.name} circuito abierto, se omite {method} {url}")
+            raise GatewayUnavailable(f'{self.name} no disponible temporalmente')
+
+        client = await self.get_client()
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+            except httpx.HTTPError as e:
+                self._log_call(method, url, type(e).__name__, attempt + 1, time.perf_counter() - start)
+                # ConnectError/ConnectTimeout: el POST no llegó a enviarse
+                retryable = method in IDEMPOTENT_METHODS or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if attempt < self.retries and retryable:
+                    await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+                    continue
+                self.breaker.record_failure()
+                raise GatewayError(f'{self.name}: {str(e)}') from e
+
+            self._log_call(method, url, response.status_code, attempt + 1, time.perf_counter() - start)
+            if response.status_code not in RETRY_STATUSES:
+                self.breaker.record_success()
+                return response
+            if attempt < self.retries and method in IDEMPOTENT_METHODS:
+                await asyncio.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+                continue
+            self.breaker.record_failure()
+            return response
+
+    async def get(self, path, **kwargs):
+        return await self.request('GET', path, **kwargs)
+
+    async def post(self, path, **kwargs):
+        return await self.request('POST', path, **kwargs)
+
+
+_clients = {}
+_async_clients = {}
+_clients_lock = threading.Lock()
+
+
+def gateway_settings(name):
+    defaults = {
+        'flow': {'base_url': getattr(settings, 'FLOW_API_URL', '')},
+        'mercadopago': {'base_url': 'https://api.mercadopago.com'},
+    }
+    options = dict(defaults.get(name, {}))
+    options.update(getattr(settings, 'PAYMENT_GATEWAYS', {}).get(name, {}))
+    if 'timeout' in options:
+        options['timeout'] = tuple(options['timeout'])
+    return options
+
+
+def get_gateway_client(name):
+    """Cliente compartido del proceso para la pasarela `name` ('flow', 'mercadopago')"""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                options = gateway_settings(name)
+                breaker = CircuitBreaker(
+                    options.pop('failure_threshold', DEFAULT_FAILURE_THRESHOLD),
+                    options.pop('reset_timeout', DEFAULT_RESET_TIMEOUT),
+                )
+                client = _clients[name] = GatewayClient(name, breaker=breaker, **options)
+    return client
+
+
+def get_async_gateway_client(name):
+    """Cliente httpx del proceso para `name`; comparte el circuit breaker con el síncrono"""
+    client = _async_clients.get(name)
+    if client is None:
+        breaker = get_gateway_client(name).breaker
+        with _clients_lock:
+            client = _async_clients.get(name)
+            if client is None:
+                options = gateway_settings(name)
+                options.pop('failure_threshold', None)
+                options.pop('reset_timeout', None)
+                client = _async_clients[name] = AsyncGatewayClient(name, breaker=breaker, **options)
+    return client
+
+
+def reset_gateway_clients():
+    """Descarta los clientes (p. ej. tras cambiar PAYMENT_GATEWAYS en pruebas)"""
+    with _clients_lock:
+        _clients.clear()
+        _async_clients.clear()
@@ -0,0 +1,59 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubGatewayServer:
+    """
+    Pasarela falsa local para pruebas y benchmarks.
+
+    Responde los estados de `statuses` en orden (luego 200) con `body` como
+    JSON, opcionalmente tras `delay` segundos; registra cada petición.
+    """
+
+    def __init__(self, statuses=(), delay=0, body=None):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.body = json.dumps(body if body is not None else {'status': 2}).encode()
+        self.requests = []
+        self.client_ports = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _respond(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    self.rfile.read(length)
+                stub.requests.append((self.command, self.path))
+                stub.client_ports.add(self.client_address[1])
+                if stub.delay:
+                    time.sleep(stub.delay)
+                status = stub.statuses.pop(0) if stub.statuses else 200
+                body = stub.body
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            do_GET = do_POST = _respond
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            request_queue_size = 128
+
+            def handle_error(self, request, client_address):
+                pass  # el cliente cortó por timeout
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/api'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,229 @@
+import logging
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Segundos que una orden pendiente mantiene apartado su stock
+DEFAULT_STOCK_RESERVATION_TTL = 15 * 60
+RELEASE_BATCH_SIZE = 500
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, requested):
+        self.product_id = product_id
+        self.requested = requested
+        super().__init__(f'Stock insuficiente para el producto {product_id} ({requested} unidades)')
+
+
+def reservation_ttl():
+    seconds = getattr(settings, 'STOCK_RESERVATION_TTL', DEFAULT_STOCK_RESERVATION_TTL)
+    return timedelta(seconds=seconds)
+
+
+def _order_quantities(order):
+    quantities = Counter()
+    for product_id, quantity in order.orderitem_set.values_list('product_id', 'quantity'):
+        quantities[product_id] += quantity
+    return quantities
+
+
+def _claim(reservations, from_status, to_status):
+    """
+    Cambia el estado de cada reserva solo si sigue en `from_status`.
+
+    El UPDATE condicional decide quién gana entre procesos concurrentes
+    (p. ej. el barrido de vencidas y la confirmación del pago), así una
+    reserva nunca se libera y se descuenta a la vez.
+    Retorna las reservas tomadas.
+    """
+    from ..models import StockReservation
+
+    if not reservations:
+        return []
+    if connection.vendor in ('postgresql', 'sqlite'):
+        # Un solo UPDATE ... RETURNING: las filas devueltas son las que tomó este proceso
+        ids = [reservation.pk for reservation in reservations]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {StockReservation._meta.db_table} SET status = %s "
+                f"WHERE status = %s AND id IN ({', '.join(['%s'] * len(ids))}) RETURNING id",
+                [to_status, from_status, *ids]
+            )
+            claimed = {row[0] for row in cursor.fetchall()}
+        return [reservation for reservation in reservations if reservation.pk in claimed]
+
+    return [
+        reservation for reservation in reservations
+        if StockReservation.objects.filter(pk=reservation.pk, status=from_status).update(status=to_status)
+    ]
+
+
+def _by_product(reservations):
+    quantities = Counter()
+    for reservation in reservations:
+        quantities[reservation.product_id] += reservation.quantity
+    return quantities
+
+
+def _release_products(quantities):
+    from ..models import Product
+
+    if not quantities:
+        return
+    amount = _quantity_case(quantities)
+    Product.objects.filter(pk__in=list(quantities), reserved_stock__gte=amount).update(
+        reserved_stock=F('reserved_stock') - amount
+    )
+
+
+def _quantity_case(quantities):
+    return Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        output_field=IntegerField()
+    )
+
+
+def _reserve_products(quantities):
+    """
+    Aparta stock de todos los productos con un único UPDATE condicionado.
+
+    Si alguna fila no cumple la condición el UPDATE afecta menos filas que
+    productos y se lanza InsufficientStock (el llamador revierte la transacción).
+    """
+    from ..models import Product
+
+    if not quantities:
+        return
+    amount = _quantity_case(quantities)
+    updated = Product.objects.filter(
+        pk__in=list(quantities), stock__gte=F('reserved_stock') + amount
+    ).update(reserved_stock=F('reserved_stock') + amount)
+    if updated == len(quantities):
+        return
+
+    stock = Product.objects.filter(pk__in=list(quantities)).values_list('pk', 'stock', 'reserved_stock')
+    available = {pk: total - reserved for pk, total, reserved in stock}
+    for product_id, quantity in sorted(quantities.items()):
+        if available.get(product_id, 0) < quantity:
+            raise InsufficientStock(product_id, quantity)
+    raise InsufficientStock(None, sum(quantities.values()))
+
+
+def reserve_order(order, ttl=None, quantities=None):
+    """
+    Aparta el stock de los items de la orden hasta `ttl` (STOCK_RESERVATION_TTL).
+
+    `quantities` ({product_id: cantidad}) evita releer los items cuando el
+    llamador ya los conoce. Todos los productos se reservan con un UPDATE
+    condicionado a que quede stock libre; si alguno no alcanza se revierte
+    todo, la orden queda cancelada y se lanza InsufficientStock.
+    """
+    from ..models import StockReservation
+
+    if order.stock_reservations.filter(status=StockReservation.HELD).exists():
+        return False
+
+    expires_at = timezone.now() + (ttl or reservation_ttl())
+    if quantities is None:
+        quantities = _order_quantities(order)
+    try:
+        with transaction.atomic():
+            _reserve_products(quantities)
+            StockReservation.objects.bulk_create([
+                StockReservation(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+                for product_id, quantity in quantities.items()
+            ])
+    except InsufficientStock as e:
+        logger.warning(f"No se pudo reservar stock para orden {order.order_number}: {str(e)}")
+        order.status = 'cancelled'
+        order.save(update_fields=['status'])
+        raise
+
+    logger.info(f"Stock reservado para orden {order.order_number} hasta {expires_at}")
+    return True
+
+
+def commit_order(order):
+    """
+    Descuenta del stock los items de una orden pagada.
+
+    Un solo `UPDATE ... SET stock = stock - n WHERE stock >= n` por producto,
+    que además consume la reserva de la orden si la había. Lo que no estaba
+    reservado solo se descuenta si no toca stock apartado por otras órdenes.
+    Es idempotente: si la orden ya se descontó retorna False.
+    """
+    from ..models import Product, StockReservation
+
+    with transaction.atomic():
+        reservations = list(order.stock_reservations.all())
+        if any(r.status == StockReservation.COMMITTED for r in reservations):
+            return False
+
+        held = _by_product(_claim(
+            [r for r in reservations if r.status == StockReservation.HELD],
+            StockReservation.HELD, StockReservation.COMMITTED
+        ))
+        quantities = _order_quantities(order)
+        for product_id, quantity in sorted(quantities.items()):
+            reserved = min(held[product_id], quantity)
+            updated = Product.objects.filter(
+                pk=product_id, reserved_stock__gte=reserved,
+                stock__gte=F('reserved_stock') - reserved + quantity
+            ).update(
+                stock=F('stock') - quantity,
+                reserved_stock=F('reserved_stock') - reserved
+            )
+            if not updated:
+                raise InsufficientStock(product_id, quantity)
+
+        # Registrar lo descontado sin reserva previa (también marca la orden
+        # como descontada para llamadas repetidas)
+        now = timezone.now()
+        StockReservation.objects.bulk_create([
+            StockReservation(
+                order=order, product_id=product_id, quantity=quantity,
+                status=StockReservation.COMMITTED, expires_at=now
+            )
+            for product_id, quantity in quantities.items() if not held[product_id]
+        ])
+
+    logger.info(f"Stock descontado para orden {order.order_number}")
+    return True
+
+
+def release_order(order):
+    """Libera las reservas vigentes de una orden (pago fallido o cancelado)"""
+    from ..models import StockReservation
+
+    with transaction.atomic():
+        held = list(order.stock_reservations.filter(status=StockReservation.HELD))
+        released = _by_product(_claim(held, StockReservation.HELD, StockReservation.RELEASED))
+        _release_products(released)
+    if released:
+        logger.info(f"Reservas liberadas para orden {order.order_number}")
+    return sum(released.values())
+
+
+def release_expired_reservations(now=None, batch_size=RELEASE_BATCH_SIZE):
+    """Libera las reservas vencidas en lotes; retorna cuántas se liberaron"""
+    from ..models import StockReservation
+
+    now = now or timezone.now()
+    total = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                StockReservation.objects.filter(status=StockReservation.HELD, expires_at__lt=now)
+                .order_by('expires_at')[:batch_size]
+            )
+            if not batch:
+                break
+            released = _claim(batch, StockReservation.HELD, StockReservation.RELEASED)
+            _release_products(_by_product(released))
+        total += len(released)
+    return total
@@ -0,0 +1,77 @@
+import hashlib
+import logging
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch, Q
+
+logger = logging.getLogger(__name__)
+
+INVOICE_DIR = 'invoices'
+# Status de pago antiguos que aún tienen órdenes guardadas
+PAID_STATUSES = ('PAID', 'paid')
+
+
+def paid_orders_filter():
+    """Órdenes con el pago confirmado (payment_status o el status antiguo)"""
+    return Q(payment_status='completed') | Q(status__in=PAID_STATUSES)
+
+
+def invoice_queryset():
+    """Órdenes con sus items y productos precargados para renderizar sin N+1"""
+    from ..models import Order, OrderItem
+
+    return Order.objects.prefetch_related(
+        Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('product').order_by('id'))
+    )
+
+
+def render_invoice(order):
+    """Bytes del PDF de la boleta"""
+    from ..utils.invoice_generator import InvoiceGenerator
+
+    return InvoiceGenerator().generate_invoice(order).getvalue()
+
+
+def invoice_name(content):
+    digest = hashlib.sha256(content).hexdigest()
+    return f'{INVOICE_DIR}/{digest[:2]}/{digest}.pdf'
+
+
+def store_invoice(order):
+    """
+    Renderiza la boleta y la guarda en MEDIA_ROOT con el hash como nombre.
+
+    El PDF es determinista, así que volver a generarlo da el mismo archivo
+    y no se escribe de nuevo. Retorna el nombre en el storage.
+    """
+    from ..models import Order
+
+    content = render_invoice(order)
+    name = invoice_name(content)
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, ContentFile(content))
+        if saved != name:
+            # Otro proceso lo escribió entre exists() y save()
+            default_storage.delete(saved)
+    if order.invoice.name != name:
+        Order.objects.filter(pk=order.pk).update(invoice=name)
+        order.invoice.name = name
+    logger.info(f"Boleta de orden {order.order_number} guardada en {name}")
+    return name
+
+
+def get_invoice(order):
+    """Archivo de la boleta; se genera solo si aún no existe"""
+    if not order.invoice or not default_storage.exists(order.invoice.name):
+        store_invoice(invoice_queryset().get(pk=order.pk))
+        order.refresh_from_db(fields=['invoice'])
+    return order.invoice
+
+
+def generate_invoices(order_ids):
+    """Renderiza las boletas de `order_ids` en una pasada; retorna cuántas"""
+    count = 0
+    for order in invoice_queryset().filter(pk__in=order_ids).iterator(chunk_size=100):
+        store_invoice(order)
+        count += 1
+    return count
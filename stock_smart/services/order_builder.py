@@ -0,0 +1,64 @@
+import logging
+from decimal import Decimal
+from django.db import transaction
+from .inventory import InsufficientStock, reserve_order
+from .order_totals import compute_totals
+
+logger = logging.getLogger(__name__)
+
+# Columnas necesarias para precio y stock al armar la orden
+ORDER_PRODUCT_FIELDS = (
+    'id', 'name', 'published_price', 'discount_percentage', 'stock', 'reserved_stock', 'active',
+)
+
+
+class OrderBuildError(ValueError):
+    pass
+
+
+def build_order(quantities, reserve=True, **fields):
+    """
+    Crea la orden y todos sus items desde {product_id: cantidad} en una transacción.
+
+    Los productos se leen en una sola consulta; el precio sale del producto
+    (no del cliente) y total_amount y los totales guardados se calculan aquí.
+    Los items se insertan con bulk_create y, con `reserve`, el stock se
+    aparta con un único UPDATE, así que la cantidad de consultas no
+    depende del tamaño del carrito. Retorna (orden, items).
+    """
+    from ..models import Order, OrderItem, Product
+
+    quantities = {int(product_id): int(quantity) for product_id, quantity in quantities.items() if int(quantity) > 0}
+    if not quantities:
+        raise OrderBuildError('El carrito está vacío')
+
+    with transaction.atomic():
+        products = Product.objects.only(*ORDER_PRODUCT_FIELDS).in_bulk(list(quantities))
+        lines = []
+        gross = Decimal('0')
+        for product_id, quantity in quantities.items():
+            product = products.get(product_id)
+            if product is None or not product.active:
+                raise OrderBuildError(f'Producto {product_id} no disponible')
+            if product.available_stock < quantity:
+                raise InsufficientStock(product_id, quantity)
+            price = product.get_final_price
+            lines.append((product, quantity, price))
+            gross += price * quantity
+
+        order = Order(**fields)
+        order.total_amount = gross
+        # bulk_create no dispara la señal de OrderItem: totales calculados aquí
+        for field, value in compute_totals(gross, order.shipping_cost).items():
+            setattr(order, field, value)
+        order.save()
+
+        items = OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=quantity, price=price)
+            for product, quantity, price in lines
+        ])
+        if reserve:
+            reserve_order(order, quantities=quantities)
+
+    logger.info(f"Orden {order.order_number} creada con {len(items)} items")
+    return order, items
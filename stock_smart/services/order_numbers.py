@@ -0,0 +1,55 @@
+import logging
+import threading
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Números reservados por vez en cada proceso. Con 1 la numeración es
+# correlativa; con bloques mayores cada proceso consume su propio rango
+# y se evita una escritura por orden (pueden quedar huecos al reiniciar).
+DEFAULT_ORDER_NUMBER_BLOCK_SIZE = 1
+
+
+class OrderNumberAllocator:
+    """Entrega números de secuencia desde bloques reservados en OrderSequence"""
+
+    def __init__(self, block_size=None):
+        self.block_size = block_size
+        self._blocks = {}
+        self._lock = threading.Lock()
+
+    def get_block_size(self):
+        if self.block_size is not None:
+            return self.block_size
+        return getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', DEFAULT_ORDER_NUMBER_BLOCK_SIZE)
+
+    def next_value(self, prefix, day=None):
+        from ..models import OrderSequence
+
+        day = day or timezone.localdate()
+        key = (prefix, day)
+        with self._lock:
+            current, last = self._blocks.get(key, (0, 0))
+            if current >= last:
+                size = self.get_block_size()
+                if size > 1 and transaction.get_connection().in_atomic_block:
+                    # Un bloque reservado dentro de una transacción puede
+                    # revertirse después: reservar solo el número necesario
+                    return OrderSequence.reserve(prefix, day, 1)
+                last = OrderSequence.reserve(prefix, day, size)
+                current = last - size
+                # Los bloques de días anteriores ya no se usan
+                self._blocks = {k: v for k, v in self._blocks.items() if k[1] == day}
+            current += 1
+            self._blocks[key] = (current, last)
+            return current
+
+
+_allocator = OrderNumberAllocator()
+
+
+def next_sequence_value(prefix, day=None):
+    """Siguiente número del día para `prefix`, único entre procesos"""
+    return _allocator.next_value(prefix, day)
@@ -0,0 +1,89 @@
+from decimal import ROUND_HALF_UP, Decimal
+from django.db.models import DecimalField, F, Sum
+
+IVA_RATE = Decimal('0.19')
+TOTALS_FIELDS = ('subtotal_amount', 'iva_amount', 'grand_total')
+BATCH_SIZE = 500
+
+
+def _clp(value):
+    return Decimal(value).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
+
+
+def compute_totals(items_gross, shipping_cost=0):
+    """
+    Totales en pesos enteros a partir de la suma de los items (precios con IVA).
+
+    Neto e IVA se derivan del bruto para que siempre sumen lo mismo que
+    los items; el total general agrega el despacho.
+    """
+    gross = _clp(items_gross or 0)
+    subtotal = _clp(gross / (1 + IVA_RATE))
+    return {
+        'subtotal_amount': subtotal,
+        'iva_amount': gross - subtotal,
+        'grand_total': gross + _clp(shipping_cost or 0),
+    }
+
+
+def items_gross_by_order(item_model, order_ids):
+    """Suma de precio * cantidad por orden con una sola consulta agrupada"""
+    rows = (
+        item_model.objects.filter(order_id__in=order_ids)
+        .order_by()
+        .values_list('order_id')
+        .annotate(gross=Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2)))
+    )
+    return dict(rows)
+
+
+def recalculate_order_totals(queryset, item_model, batch_size=BATCH_SIZE):
+    """
+    Recalcula y guarda los totales de las órdenes del queryset por lotes.
+
+    Recibe los modelos explícitamente para poder usarse también desde
+    migraciones con modelos históricos. Retorna {pk: totales}.
+    """
+    results = {}
+    orders = queryset.order_by('pk').only('pk', 'shipping_cost', *TOTALS_FIELDS)
+    last_pk = None
+    while True:
+        page = orders if last_pk is None else orders.filter(pk__gt=last_pk)
+        batch = list(page[:batch_size])
+        if not batch:
+            return results
+        results.update(_save_batch(queryset.model, item_model, batch))
+        last_pk = batch[-1].pk
+
+
+def _save_batch(order_model, item_model, orders):
+    gross = items_gross_by_order(item_model, [order.pk for order in orders])
+    changed = []
+    results = {}
+    for order in orders:
+        totals = results[order.pk] = compute_totals(gross.get(order.pk), order.shipping_cost)
+        if any(getattr(order, field) != value for field, value in totals.items()):
+            for field, value in totals.items():
+                setattr(order, field, value)
+            changed.append(order)
+    if changed:
+        order_model.objects.bulk_update(changed, TOTALS_FIELDS)
+    return results
+
+
+def find_mismatched_totals(queryset, item_model, batch_size=BATCH_SIZE):
+    """Órdenes cuyos totales guardados no coinciden con sus items: [(orden, esperados)]"""
+    orders = queryset.order_by('pk').only('pk', 'order_number', 'shipping_cost', *TOTALS_FIELDS)
+    mismatched = []
+    last_pk = None
+    while True:
+        page = orders if last_pk is None else orders.filter(pk__gt=last_pk)
+        batch = list(page[:batch_size])
+        if not batch:
+            return mismatched
+        gross = items_gross_by_order(item_model, [order.pk for order in batch])
+        for order in batch:
+            expected = compute_totals(gross.get(order.pk), order.shipping_cost)
+            if any(getattr(order, field) != value for field, value in expected.items()):
+                mismatched.append((order, expected))
+        last_pk = batch[-1].pk
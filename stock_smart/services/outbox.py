@@ -0,0 +1,131 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = 50
+MAX_EMAIL_ATTEMPTS = 8
+# Espera entre reintentos: base * 2^intentos, con tope
+RETRY_BASE_DELAY = timedelta(seconds=60)
+RETRY_MAX_DELAY = timedelta(hours=2)
+
+
+def queue_email(subject, body, to, from_email=None, key=None):
+    """
+    Deja un correo en la bandeja de salida; no abre conexión SMTP.
+
+    Llamado dentro de una transacción, el correo solo queda visible para
+    el worker cuando ésta se confirma. Con `key` un mismo aviso se encola
+    una sola vez. Retorna False si no hay destinatarios.
+    """
+    from ..models import OutboxEmail
+
+    recipients = [address for address in ([to] if isinstance(to, str) else to) if address]
+    if not recipients:
+        return False
+    OutboxEmail.objects.bulk_create(
+        [OutboxEmail(
+            key=key, subject=subject, body=body, to=recipients,
+            from_email=from_email or settings.DEFAULT_FROM_EMAIL
+        )],
+        ignore_conflicts=True
+    )
+    return True
+
+
+def queue_order_confirmation(order):
+    """Encola el correo de confirmación de pago de la orden"""
+    body = f"""
+        ¡Gracias por tu compra!
+
+        Detalles de la orden:
+        Número de orden: {order.order_number}
+        Total: ${order.total_amount}
+        Estado: Pagado
+
+        Pronto recibirás información sobre el envío.
+        """
+    return queue_email(
+        f'Confirmación de Pago - Orden #{order.order_number}', body,
+        order.customer_email, key=f'order-paid:{order.pk}'
+    )
+
+
+def _retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * (2 ** (attempts - 1)), RETRY_MAX_DELAY)
+
+
+def _claim_batch(batch_size, now):
+    """Toma un lote corriendo `available_at` para que otro worker no lo envíe"""
+    from ..models import OutboxEmail
+
+    pending = list(
+        OutboxEmail.objects.filter(status=OutboxEmail.PENDING, available_at__lte=now)
+        .order_by('available_at', 'id')[:batch_size]
+    )
+    lease = now + RETRY_BASE_DELAY
+    claimed = []
+    for email in pending:
+        if OutboxEmail.objects.filter(
+            pk=email.pk, status=OutboxEmail.PENDING, available_at=email.available_at
+        ).update(available_at=lease):
+            email.available_at = lease
+            claimed.append(email)
+    return claimed
+
+
+def send_outbox(batch_size=OUTBOX_BATCH_SIZE):
+    """
+    Envía un lote de correos pendientes; retorna (enviados, total).
+
+    Todo el lote sale por una sola conexión SMTP. Un correo que falla se
+    reprograma con backoff exponencial y tras MAX_EMAIL_ATTEMPTS se marca
+    como fallido; si no se puede abrir la conexión se reprograma el lote.
+    """
+    from ..models import OutboxEmail
+
+    now = timezone.now()
+    batch = _claim_batch(batch_size, now)
+    if not batch:
+        return 0, 0
+
+    sent = 0
+    failures = {}
+    try:
+        with get_connection(fail_silently=False) as connection:
+            for email in batch:
+                message = EmailMessage(
+                    email.subject, email.body, email.from_email or None, email.to, connection=connection
+                )
+                try:
+                    connection.send_messages([message])
+                except Exception as e:
+                    failures[email.pk] = str(e)
+                    continue
+                email.status = OutboxEmail.SENT
+                email.sent_at = timezone.now()
+                sent += 1
+    except Exception as e:
+        # Falló la conexión: lo que no alcanzó a salir se reintenta
+        logger.error(f"No se pudo conectar al servidor de correo: {str(e)}")
+        for email in batch:
+            if email.status != OutboxEmail.SENT:
+                failures.setdefault(email.pk, str(e))
+
+    for email in batch:
+        email.attempts += 1
+        if email.status == OutboxEmail.SENT:
+            email.last_error = ''
+        else:
+            email.last_error = failures.get(email.pk, '')
+            if email.attempts >= MAX_EMAIL_ATTEMPTS:
+                email.status = OutboxEmail.FAILED
+                logger.error(f"Correo {email.pk} descartado tras {email.attempts} intentos")
+            else:
+                email.available_at = now + _retry_delay(email.attempts)
+                logger.warning(f"Correo {email.pk} no enviado, se reintenta: {email.last_error}")
+    OutboxEmail.objects.bulk_update(batch, ['status', 'attempts', 'last_error', 'available_at', 'sent_at'])
+    return sent, len(batch)
@@ -0,0 +1,287 @@
+import base64
+import datetime
+import json
+import logging
+from decimal import Decimal
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+CURSOR_PARAM = 'cursor'
+DEFAULT_ORDERING = ('-created_at', '-id')
+
+# Órdenes disponibles para ?order=; todos terminan en id para ser únicos
+KEYSET_ORDERINGS = {
+    'newest': DEFAULT_ORDERING,
+    'oldest': ('created_at', 'id'),
+    # Precio que paga el cliente (Product.objects.with_prices())
+    'price_asc': ('final_price', 'id'),
+    'price_desc': ('-final_price', '-id'),
+    'name': ('name', 'id'),
+}
+
+# Sobre este número los conteos se muestran como "N+"
+COUNT_CAP = 1000
+# Tablas con más filas estimadas usan la estadística de Postgres
+APPROXIMATE_COUNT_THRESHOLD = 10000
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def _cursor_value(value):
+    # isoformat con microsegundos: DjangoJSONEncoder los trunca a milisegundos
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'Valor no serializable en cursor: {value!r}')
+
+
+def encode_cursor(values, direction, ordering=DEFAULT_ORDERING):
+    payload = json.dumps(
+        {'v': values, 'd': direction, 'o': ','.join(ordering)},
+        default=_cursor_value, separators=(',', ':')
+    )
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ordering=DEFAULT_ORDERING):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        values, direction = payload['v'], payload['d']
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(str(e))
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        raise InvalidCursor('Cursor inválido')
+    if payload.get('o') != ','.join(ordering):
+        # Cursor generado con otro orden (p. ej. tras cambiar ?order=)
+        raise InvalidCursor('Cursor de otro orden')
+    return values, direction
+
+
+def approximate_count(queryset, cap=COUNT_CAP):
+    """
+    Conteo barato: (total, es_aproximado).
+
+    En Postgres, sin filtros, usa pg_class.reltuples para tablas grandes;
+    en otro caso cuenta como máximo `cap` filas.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not queryset.query.has_filters():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row and row[0] > APPROXIMATE_COUNT_THRESHOLD:
+            return row[0], True
+
+    if cap is None:
+        return queryset.count(), False
+    total = queryset.order_by()[:cap + 1].count()
+    return min(total, cap), total > cap
+
+
+def ordering_from_request(request, default='newest', param='order'):
+    key = request.GET.get(param)
+    if key not in KEYSET_ORDERINGS:
+        key = default
+    return KEYSET_ORDERINGS[key]
+
+
+class KeysetPage:
+    """Página de resultados con cursores opacos hacia la siguiente y la anterior"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = None
+        self.count_is_approximate = False
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def count_label(self):
+        if self.count is None:
+            return ''
+        return f'{self.count}+' if self.count_is_approximate else str(self.count)
+
+
+class KeysetPaginator:
+    """
+    Paginación por cursor sobre un orden único (p. ej. created_at, id).
+
+    Cada página es un WHERE sobre la clave del último elemento más un
+    LIMIT, así la página N cuesta lo mismo que la primera (sin OFFSET).
+    """
+
+    def __init__(self, queryset, per_page, ordering=DEFAULT_ORDERING):
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.descending = [name.startswith('-') for name in self.ordering]
+        if 'final_price' in self.fields and hasattr(queryset, 'with_prices'):
+            # Orden por precio final: se calcula en la BD
+            queryset = queryset.with_prices()
+        self.queryset = queryset
+
+    def _key(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def _parse_values(self, values):
+        if len(values) != len(self.fields):
+            raise InvalidCursor('Cursor no corresponde al orden')
+        annotations = self.queryset.query.annotations
+        try:
+            return [
+                (annotations[field].output_field if field in annotations else self.queryset.model._meta.get_field(field))
+                .to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except Exception as e:
+            raise InvalidCursor(str(e))
+
+    def _after(self, values, reverse=False):
+        """Filtro (a, b) > (x, y) respetando el sentido de cada columna"""
+        condition = Q()
+        equal = {}
+        for field, descending, value in zip(self.fields, self.descending, values):
+            lookup = 'lt' if descending != reverse else 'gt'
+            condition |= Q(**equal, **{f'{field}__{lookup}': value})
+            equal[field] = value
+        return condition
+
+    def get_page(self, cursor=None):
+        queryset = self.queryset
+        direction = 'next'
+        if cursor:
+            try:
+                values, direction = decode_cursor(cursor, self.ordering)
+                values = self._parse_values(values)
+            except InvalidCursor as e:
+                logger.warning(f"Cursor de paginación inválido: {str(e)}")
+                cursor, direction = None, 'next'
+            else:
+                queryset = queryset.filter(self._after(values, reverse=direction == 'prev'))
+
+        if direction == 'prev':
+            reversed_ordering = [
+                name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering
+            ]
+            rows = list(queryset.order_by(*reversed_ordering)[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page][::-1]
+            has_next, has_previous = True, has_more
+        else:
+            rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_next, has_previous = has_more, bool(cursor)
+
+        next_cursor = encode_cursor(self._key(rows[-1]), 'next', self.ordering) if rows and has_next else None
+        previous_cursor = encode_cursor(self._key(rows[0]), 'prev', self.ordering) if rows and has_previous else None
+        return KeysetPage(rows, next_cursor=next_cursor, previous_cursor=previous_cursor)
+
+
+class SequencePaginator:
+    """
+    Paginación por cursor sobre una secuencia ya ordenada en memoria
+    (p. ej. resultados de búsqueda rankeados, acotados a SEARCH_MAX_RESULTS).
+    """
+
+    ordering = ('position',)
+
+    def __init__(self, sequence, per_page):
+        self.sequence = sequence
+        self.per_page = per_page
+
+    def get_page(self, cursor=None):
+        start = 0
+        if cursor:
+            try:
+                values, direction = decode_cursor(cursor, self.ordering)
+                start = max(int(values[0]), 0)
+            except (InvalidCursor, IndexError, TypeError, ValueError) as e:
+                logger.warning(f"Cursor de paginación inválido: {str(e)}")
+                start = 0
+
+        total = len(self.sequence)
+        rows = list(self.sequence[start:start + self.per_page])
+        end = start + self.per_page
+        next_cursor = encode_cursor([end], 'next', self.ordering) if end < total else None
+        previous_cursor = (
+            encode_cursor([max(start - self.per_page, 0)], 'prev', self.ordering) if start > 0 else None
+        )
+        page = KeysetPage(rows, next_cursor=next_cursor, previous_cursor=previous_cursor)
+        page.count = total
+        return page
+
+
+def paginate(request, object_list, per_page, ordering=DEFAULT_ORDERING, with_count=False):
+    """
+    Página de `object_list` según ?cursor=.
+
+    Los QuerySet se paginan por clave (`ordering`); otras secuencias, como
+    los resultados de búsqueda, por posición.
+    """
+    cursor = request.GET.get(CURSOR_PARAM)
+    if isinstance(object_list, QuerySet):
+        page = KeysetPaginator(object_list, per_page, ordering).get_page(cursor)
+        if with_count:
+            page.count, page.count_is_approximate = approximate_count(object_list)
+        return page
+    return SequencePaginator(object_list, per_page).get_page(cursor)
+
+
+class KeysetPaginationMixin:
+    """Reemplaza la paginación por OFFSET de ListView por cursores"""
+
+    keyset_default_order = 'newest'
+    keyset_with_count = False
+
+    def get_keyset_ordering(self):
+        return ordering_from_request(self.request, default=self.keyset_default_order)
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate(
+            self.request, queryset, page_size,
+            ordering=self.get_keyset_ordering(), with_count=self.keyset_with_count
+        )
+        return None, page, page.object_list, page.has_other_pages
+
+
+class ApproximateCountPaginator(Paginator):
+    """Paginator para el admin que evita COUNT(*) completos en tablas grandes"""
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            return approximate_count(self.object_list, cap=None)[0]
+        return super().count
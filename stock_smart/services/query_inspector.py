@@ -0,0 +1,140 @@
+"""
+Detector de N+1 basado en connection.execute_wrapper.
+
+Agrupa las consultas de un bloque por su forma (el SQL sin valores) y marca
+las que se repiten settings.NPLUSONE_THRESHOLD veces o más, con el archivo
+y la línea del proyecto que las disparó. Lo usan NPlusOneMiddleware (solo con DEBUG) y
+QueryBudgetMixin en los tests.
+"""
+
+import logging
+import os
+import re
+import sys
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass, field
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)')
+_SPACES_RE = re.compile(r'\s+')
+
+
+def query_shape(sql):
+    """SQL sin valores: literales como %s y listas IN (...) de cualquier largo iguales"""
+    shape = _STRING_RE.sub('%s', sql)
+    shape = _NUMBER_RE.sub('%s', shape)
+    shape = _IN_LIST_RE.sub('IN (...)', shape)
+    return _SPACES_RE.sub(' ', shape).strip()
+
+
+def _project_root():
+    return os.path.abspath(str(getattr(settings, 'BASE_DIR', os.getcwd()))) + os.sep
+
+
+def call_site():
+    """'archivo:línea en función' del frame del proyecto más cercano a la consulta"""
+    root = _project_root()
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if (filename.startswith(root) and filename != os.path.abspath(__file__)
+                and 'site-packages' not in filename):
+            return f'{os.path.relpath(filename, root)}:{frame.f_lineno} en {frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'desconocido'
+
+
+@dataclass
+class QueryShape:
+    sql: str
+    count: int = 0
+    sites: Counter = field(default_factory=Counter)
+
+
+class QueryInspector:
+    """execute_wrapper que cuenta las consultas por forma y por sitio de llamada"""
+
+    def __init__(self, threshold=None):
+        self.threshold = threshold or settings.NPLUSONE_THRESHOLD
+        self.shapes = {}
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        shape = query_shape(sql)
+        entry = self.shapes.get(shape)
+        if entry is None:
+            entry = self.shapes[shape] = QueryShape(shape)
+        entry.count += 1
+        entry.sites[call_site()] += 1
+        self.total += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self):
+        """Formas repetidas al menos `threshold` veces, de más a menos"""
+        shapes = [shape for shape in self.shapes.values() if shape.count >= self.threshold]
+        return sorted(shapes, key=lambda shape: shape.count, reverse=True)
+
+    def report(self, shapes=None):
+        if shapes is None:
+            shapes = sorted(self.shapes.values(), key=lambda shape: shape.count, reverse=True)
+        lines = []
+        for shape in shapes:
+            lines.append(f'{shape.count}x {shape.sql}')
+            lines.extend(f'    {count}x desde {site}' for site, count in shape.sites.most_common())
+        return '\n'.join(lines)
+
+
+@contextmanager
+def inspect_queries(using=None, threshold=None):
+    """
+    Instala un QueryInspector en la conexión `using` (o en todas) mientras
+    dura el bloque:
+
+        with inspect_queries() as inspector:
+            ...
+        inspector.repeated()
+    """
+    inspector = QueryInspector(threshold)
+    aliases = [using] if using else list(connections)
+    with ExitStack() as stack:
+        for alias in aliases:
+            stack.enter_context(connections[alias].execute_wrapper(inspector))
+        yield inspector
+
+
+def log_repeated(inspector, label):
+    for shape in inspector.repeated():
+        sites = ', '.join(site for site, _ in shape.sites.most_common(3))
+        logger.warning(f"Posible N+1 en {label}: {shape.count}x {shape.sql[:200]} (desde {sites})")
+
+
+class QueryBudgetMixin:
+    """
+    Mixin para TestCase: falla si un bloque repite la misma consulta
+    (N+1) o pasa de un número máximo de consultas.
+    """
+    nplusone_threshold = None
+
+    @contextmanager
+    def assertQueryBudget(self, budget, using='default', label=''):
+        with inspect_queries(using, self.nplusone_threshold) as inspector:
+            yield inspector
+        prefix = f'{label}: ' if label else ''
+        repeated = inspector.repeated()
+        if repeated:
+            self.fail(f'{prefix}N+1 detectado\n{inspector.report(repeated)}')
+        if inspector.total > budget:
+            self.fail(
+                f'{prefix}{inspector.total} consultas, presupuesto {budget}\n{inspector.report()}'
+            )
+
+    @contextmanager
+    def assertNoNPlusOne(self, using='default', label=''):
+        with self.assertQueryBudget(sys.maxsize, using, label) as inspector:
+            yield inspector
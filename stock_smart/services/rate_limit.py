@@ -0,0 +1,43 @@
+import logging
+import time
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_KEY = 'ratelimit:{scope}:{ident}:{window}'
+
+
+def client_ip(request):
+    """
+    IP del cliente. Detrás de un proxy (TRUSTED_PROXY_COUNT > 0) se toma de
+    X-Forwarded-For contando desde la derecha, que es la parte que agregan
+    los proxies y no el cliente.
+    """
+    proxies = getattr(settings, 'TRUSTED_PROXY_COUNT', 0)
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        chain = [ip.strip() for ip in forwarded.split(',') if ip.strip()]
+        if chain:
+            return chain[-min(proxies, len(chain))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def is_rate_limited(scope, ident, limit, window):
+    """
+    Cuenta una petición de `ident` en `scope` y dice si superó `limit` en
+    la ventana actual de `window` segundos. El contador vive en la caché
+    compartida, así que el límite vale para todos los workers.
+    """
+    key = RATE_LIMIT_KEY.format(scope=scope, ident=ident, window=int(time.time() // window))
+    if cache.add(key, 1, window):
+        return False
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # La ventana expiró entre add() e incr()
+        cache.add(key, 1, window)
+        return False
+    if count == limit + 1:
+        logger.warning(f"Límite de {limit} peticiones/{window}s superado en {scope} por {ident}")
+    return count > limit
@@ -0,0 +1,177 @@
+import socketserver
+import threading
+import time
+
+
+class StubRedisServer:
+    """
+    Servidor Redis falso en memoria para pruebas locales.
+
+    Habla RESP2 y entiende solo los comandos que usa el backend RedisCache
+    de Django (GET/SET/MGET/MSET/DEL/EXISTS/EXPIRE/INCRBY/FLUSHDB y
+    MULTI/EXEC de los pipelines). Registra cada comando en `commands`.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.commands = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                queued = None
+                while True:
+                    try:
+                        args = stub._read_command(self.rfile)
+                    except (ConnectionError, ValueError):
+                        return
+                    if args is None:
+                        return
+                    name = args[0].upper()
+                    if name == b'MULTI':
+                        queued = []
+                        reply = b'+OK\r\n'
+                    elif name == b'EXEC':
+                        replies = [stub.execute(queued_args) for queued_args in queued or []]
+                        queued = None
+                        reply = b'*%d\r\n' % len(replies) + b''.join(replies)
+                    elif queued is not None:
+                        queued.append(args)
+                        reply = b'+QUEUED\r\n'
+                    else:
+                        reply = stub.execute(args)
+                    self.wfile.write(reply)
+                    self.wfile.flush()
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = f'redis://127.0.0.1:{self.server.server_address[1]}/0'
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # --- Protocolo ---
+
+    @staticmethod
+    def _read_command(rfile):
+        line = rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()  # comando inline (redis-cli, telnet)
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(rfile.readline()[1:])
+            args.append(rfile.read(size + 2)[:-2])
+        return args
+
+    @staticmethod
+    def _bulk(value):
+        if value is None:
+            return b'$-1\r\n'
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+
+    @staticmethod
+    def _int(value):
+        return b':%d\r\n' % value
+
+    # --- Comandos ---
+
+    def _alive(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def _expire(self, key, seconds):
+        self.expires[key] = time.monotonic() + seconds
+
+    def execute(self, args):
+        name, args = args[0].upper().decode(), args[1:]
+        with self.lock:
+            self.commands.append((name, *args))
+            handler = getattr(self, f'cmd_{name.lower()}', None)
+            if handler is None:
+                return b'-ERR unknown command ' + name.encode() + b'\r\n'
+            try:
+                return handler(*args)
+            except (TypeError, ValueError):
+                return b'-ERR wrong arguments for ' + name.encode() + b'\r\n'
+
+    def cmd_ping(self, *args):
+        return b'+PONG\r\n'
+
+    def cmd_client(self, *args):
+        return b'+OK\r\n'
+
+    def cmd_select(self, db):
+        return b'+OK\r\n'
+
+    def cmd_get(self, key):
+        return self._bulk(self.data[key] if self._alive(key) else None)
+
+    def cmd_mget(self, *keys):
+        return b'*%d\r\n' % len(keys) + b''.join(self.cmd_get(key) for key in keys)
+
+    def cmd_set(self, key, value, *options):
+        options = [option.upper() for option in options]
+        exists = self._alive(key)
+        if (b'NX' in options and exists) or (b'XX' in options and not exists):
+            return self._bulk(None)
+        self.data[key] = value
+        self.expires.pop(key, None)
+        for unit, scale in ((b'EX', 1), (b'PX', 0.001)):
+            if unit in options:
+                self._expire(key, int(options[options.index(unit) + 1]) * scale)
+        return b'+OK\r\n'
+
+    def cmd_mset(self, *pairs):
+        for key, value in zip(pairs[::2], pairs[1::2]):
+            self.cmd_set(key, value)
+        return b'+OK\r\n'
+
+    def cmd_del(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self._alive(key):
+                deleted += 1
+                self.data.pop(key)
+                self.expires.pop(key, None)
+        return self._int(deleted)
+
+    def cmd_exists(self, *keys):
+        return self._int(sum(1 for key in keys if self._alive(key)))
+
+    def cmd_expire(self, key, seconds):
+        if not self._alive(key):
+            return self._int(0)
+        self._expire(key, int(seconds))
+        return self._int(1)
+
+    def cmd_persist(self, key):
+        return self._int(1 if self._alive(key) and self.expires.pop(key, None) is not None else 0)
+
+    def cmd_incrby(self, key, delta):
+        value = int(self.data[key]) if self._alive(key) else 0
+        value += int(delta)
+        self.data[key] = str(value).encode()
+        return self._int(value)
+
+    def cmd_incr(self, key):
+        return self.cmd_incrby(key, b'1')
+
+    def cmd_decrby(self, key, delta):
+        return self.cmd_incrby(key, str(-int(delta)).encode())
+
+    def cmd_flushdb(self, *args):
+        self.data.clear()
+        self.expires.clear()
+        return b'+OK\r\n'
@@ -0,0 +1,286 @@
+import logging
+import re
+from django.conf import settings
+from django.db import connection as default_connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+from unidecode import unidecode
+
+logger = logging.getLogger(__name__)
+
+# Máximo de resultados rankeados que se paginan por búsqueda
+SEARCH_MAX_RESULTS = 1000
+SEARCH_INDEX_CHUNK_SIZE = 2000
+
+DEFAULT_SEARCH_BACKENDS = {
+    'sqlite': 'stock_smart.services.search.SQLiteFTSSearchBackend',
+    'postgresql': 'stock_smart.services.search.PostgresSearchBackend',
+}
+FALLBACK_SEARCH_BACKEND = 'stock_smart.services.search.IcontainsSearchBackend'
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def normalize_search_text(text):
+    """Texto sin acentos y en minúsculas ('Martíllo' -> 'martillo')"""
+    return unidecode(text or '').lower()
+
+
+def search_tokens(query):
+    return _TOKEN_RE.findall(normalize_search_text(query))
+
+
+def product_index_rows(queryset=None):
+    """Filas (id, nombre, descripción, palabras clave) listas para indexar"""
+    from ..models import Product
+
+    if queryset is None:
+        queryset = Product.objects.all()
+    rows = queryset.values_list(
+        'id', 'name', 'description', 'brand__name', 'category__name'
+    ).order_by().iterator(chunk_size=SEARCH_INDEX_CHUNK_SIZE)
+    for product_id, name, description, brand, category in rows:
+        yield (
+            product_id,
+            normalize_search_text(name),
+            normalize_search_text(description),
+            normalize_search_text(f'{brand or ""} {category or ""}'),
+        )
+
+
+def _chunked(rows, size=SEARCH_INDEX_CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class SearchResults:
+    """
+    Resultados rankeados de una búsqueda.
+
+    Se pagina sobre la lista de ids y solo se cargan los productos de la
+    página pedida, por lo que funciona directamente con Paginator.
+    """
+
+    def __init__(self, ids, queryset):
+        self.ids = ids
+        self.queryset = queryset
+
+    def __len__(self):
+        return len(self.ids)
+
+    def count(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            ids = self.ids[index]
+            products = self.queryset.in_bulk(ids)
+            return [products[pk] for pk in ids if pk in products]
+        return self.queryset.get(pk=self.ids[index])
+
+    def as_queryset(self):
+        """Los mismos productos como QuerySet (sin el orden por relevancia)"""
+        return self.queryset.filter(id__in=self.ids)
+
+
+class BaseSearchBackend:
+    """
+    Índice de búsqueda de productos.
+
+    Las subclases implementan install, index_rows, remove y ranked_ids;
+    search combina el ranking del índice con los filtros del queryset.
+    """
+
+    def __init__(self, connection=None):
+        self.connection = connection or default_connection
+
+    def install(self):
+        pass
+
+    def uninstall(self):
+        pass
+
+    def index_rows(self, rows):
+        raise NotImplementedError
+
+    def remove(self, product_ids):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def ranked_ids(self, tokens, limit):
+        raise NotImplementedError
+
+    def index_products(self, queryset):
+        for chunk in _chunked(product_index_rows(queryset)):
+            self.index_rows(chunk)
+
+    def rebuild(self, rows=None):
+        """Reconstruye el índice completo; retorna la cantidad de productos"""
+        if rows is None:
+            rows = product_index_rows()
+        self.clear()
+        total = 0
+        for chunk in _chunked(rows):
+            self.index_rows(chunk)
+            total += len(chunk)
+        return total
+
+    def search(self, query, queryset=None, limit=SEARCH_MAX_RESULTS):
+        from ..models import Product
+
+        if queryset is None:
+            queryset = Product.objects.all()
+        tokens = search_tokens(query)
+        if not tokens:
+            return SearchResults([], queryset)
+
+        ids = self.ranked_ids(tokens, limit)
+        if ids and queryset.query.has_filters():
+            # Respetar los filtros de la vista (activo, categoría, etc.)
+            allowed = set(queryset.filter(id__in=ids).values_list('id', flat=True))
+            ids = [pk for pk in ids if pk in allowed]
+        return SearchResults(ids, queryset)
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """Tabla virtual FTS5 con rowid = id del producto"""
+
+    table = 'stock_smart_product_fts'
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} "
+                f"USING fts5(name, description, keywords, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def index_rows(self, rows):
+        rows = list(rows)
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(row[0],) for row in rows])
+            cursor.executemany(
+                f"INSERT INTO {self.table} (rowid, name, description, keywords) VALUES (%s, %s, %s, %s)",
+                rows
+            )
+
+    def remove(self, product_ids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {self.table} WHERE rowid = %s", [(pk,) for pk in product_ids])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def ranked_ids(self, tokens, limit):
+        # Cada token como prefijo; FTS5 combina los términos con AND
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s "
+                f"ORDER BY bm25({self.table}, 10.0, 1.0, 3.0) LIMIT %s",
+                [match, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """Tabla auxiliar con un tsvector por producto e índice GIN"""
+
+    table = 'stock_smart_product_search'
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                f"product_id bigint PRIMARY KEY REFERENCES stock_smart_product (id) "
+                f"ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+                f"document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {self.table}_document_gin "
+                f"ON {self.table} USING GIN (document)"
+            )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def index_rows(self, rows):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} (product_id, document) VALUES (%s, "
+                f"setweight(to_tsvector('simple', %s), 'A') || "
+                f"setweight(to_tsvector('simple', %s), 'C') || "
+                f"setweight(to_tsvector('simple', %s), 'B')) "
+                f"ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                list(rows)
+            )
+
+    def remove(self, product_ids):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE product_id = ANY(%s)", [list(product_ids)])
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"TRUNCATE {self.table}")
+
+    def ranked_ids(self, tokens, limit):
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT product_id FROM {self.table}, to_tsquery('simple', %s) AS query "
+                f"WHERE document @@ query ORDER BY ts_rank(document, query) DESC LIMIT %s",
+                [tsquery, limit]
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class IcontainsSearchBackend(BaseSearchBackend):
+    """Sin índice: LIKE sobre nombre y descripción (otros motores de BD)"""
+
+    def index_rows(self, rows):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def clear(self):
+        pass
+
+    def search(self, query, queryset=None, limit=SEARCH_MAX_RESULTS):
+        from ..models import Product
+
+        if queryset is None:
+            queryset = Product.objects.all()
+        filters = Q()
+        for token in query.split():
+            filters &= Q(name__icontains=token) | Q(description__icontains=token)
+        ids = list(queryset.filter(filters).values_list('id', flat=True)[:limit])
+        return SearchResults(ids, queryset)
+
+
+def get_search_backend(connection=None):
+    connection = connection or default_connection
+    backends = dict(DEFAULT_SEARCH_BACKENDS, **getattr(settings, 'SEARCH_BACKENDS', {}))
+    path = backends.get(connection.vendor, FALLBACK_SEARCH_BACKEND)
+    return import_string(path)(connection)
+
+
+def search_catalog(query, queryset=None):
+    """Búsqueda rankeada de productos con el backend de la BD actual"""
+    return get_search_backend().search(query, queryset)
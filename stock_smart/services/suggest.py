@@ -0,0 +1,168 @@
+import logging
+import threading
+from bisect import bisect_left, insort
+from urllib.parse import urlencode
+from django.urls import reverse
+from .search import normalize_search_text, search_tokens
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_LIMIT = 8
+# Máximo de claves revisadas por consulta (prefijos muy cortos)
+SUGGEST_MAX_SCAN = 500
+
+# Orden de los tipos en las sugerencias
+KIND_ORDER = {'category': 0, 'brand': 1, 'product': 2}
+
+
+def _product_entry(product):
+    return {
+        'type': 'product',
+        'label': product.name,
+        'url': reverse('stock_smart:detalle_producto', args=[product.id]),
+    }
+
+
+def _brand_entry(brand):
+    return {
+        'type': 'brand',
+        'label': brand.name,
+        'url': reverse('stock_smart:productos_lista') + '?' + urlencode({'q': brand.name}),
+    }
+
+
+def _category_entry(category):
+    if category.slug:
+        url = reverse('stock_smart:productos_por_categoria', args=[category.slug])
+    else:
+        url = reverse('stock_smart:category_detail', args=[category.id])
+    return {'type': 'category', 'label': category.name, 'url': url}
+
+
+class SuggestionIndex:
+    """
+    Índice de prefijos en memoria para autocompletar.
+
+    Guarda una lista ordenada de claves (token, tipo, id) sobre nombres sin
+    acentos y en minúsculas; cada búsqueda es un bisect más un recorrido
+    corto, sin consultas a la BD.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._entries = {}
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _entry_tokens(label):
+        tokens = set(search_tokens(label))
+        # El nombre completo permite completar frases ("taladro perc")
+        tokens.add(normalize_search_text(label).strip())
+        tokens.discard('')
+        return tokens
+
+    def build(self, entries):
+        """Reemplaza el contenido completo; entries es [(tipo, id, dict)]"""
+        keys, data, tokens_by_entry = [], {}, {}
+        for kind, pk, entry in entries:
+            tokens = self._entry_tokens(entry['label'])
+            data[(kind, pk)] = entry
+            tokens_by_entry[(kind, pk)] = tokens
+            keys.extend((token, KIND_ORDER[kind], pk) for token in tokens)
+        keys.sort()
+        with self._lock:
+            self._keys, self._entries, self._tokens = keys, data, tokens_by_entry
+
+    def add(self, kind, pk, entry):
+        with self._lock:
+            self._remove(kind, pk)
+            tokens = self._entry_tokens(entry['label'])
+            self._entries[(kind, pk)] = entry
+            self._tokens[(kind, pk)] = tokens
+            for token in tokens:
+                insort(self._keys, (token, KIND_ORDER[kind], pk))
+
+    def remove(self, kind, pk):
+        with self._lock:
+            self._remove(kind, pk)
+
+    def _remove(self, kind, pk):
+        self._entries.pop((kind, pk), None)
+        for token in self._tokens.pop((kind, pk), ()):
+            key = (token, KIND_ORDER[kind], pk)
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+
+    def lookup(self, query, limit=SUGGEST_LIMIT):
+        normalized = normalize_search_text(query).strip()
+        if not normalized:
+            return []
+
+        keys, entries = self._keys, self._entries
+        kinds = {order: kind for kind, order in KIND_ORDER.items()}
+        results, seen = [], set()
+        i = bisect_left(keys, (normalized,))
+        end = min(len(keys), i + SUGGEST_MAX_SCAN)
+        while i < end and len(results) < limit:
+            token, order, pk = keys[i]
+            if not token.startswith(normalized):
+                break
+            ref = (kinds[order], pk)
+            entry = entries.get(ref)
+            if entry is not None and ref not in seen:
+                seen.add(ref)
+                results.append(entry)
+            i += 1
+
+        results.sort(key=lambda entry: (KIND_ORDER[entry['type']], len(entry['label'])))
+        return results
+
+
+_index = SuggestionIndex()
+_built = threading.Event()
+_build_lock = threading.Lock()
+
+
+def build_suggestion_index():
+    """Carga productos, marcas y categorías activos en el índice"""
+    from ..models import Brand, Category, Product
+
+    entries = []
+    for product in Product.objects.filter(active=True).only('id', 'name').order_by().iterator():
+        entries.append(('product', product.id, _product_entry(product)))
+    for brand in Brand.objects.filter(is_active=True).only('id', 'name').order_by():
+        entries.append(('brand', brand.id, _brand_entry(brand)))
+    for category in Category.objects.filter(is_active=True).only('id', 'name', 'slug').order_by():
+        entries.append(('category', category.id, _category_entry(category)))
+
+    _index.build(entries)
+    _built.set()
+    logger.info(f"Índice de sugerencias construido con {len(entries)} entradas")
+    return _index
+
+
+def get_suggestion_index():
+    """Índice del proceso; se construye una sola vez, en el primer uso"""
+    if not _built.is_set():
+        with _build_lock:
+            if not _built.is_set():
+                build_suggestion_index()
+    return _index
+
+
+def refresh_suggestion(kind, instance, deleted=False):
+    """Actualiza una entrada del índice desde las señales del modelo"""
+    if not _built.is_set():
+        # Aún no construido: se cargará completo en el primer uso
+        return
+    active = instance.active if kind == 'product' else instance.is_active
+    if deleted or not active:
+        _index.remove(kind, instance.pk)
+        return
+    builders = {'product': _product_entry, 'brand': _brand_entry, 'category': _category_entry}
+    _index.add(kind, instance.pk, builders[kind](instance))
@@ -0,0 +1,217 @@
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, NamedTuple
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.functional import cached_property
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_L1_MAX_ENTRIES = 1000
+DEFAULT_L1_TIMEOUT = 5
+DEFAULT_STALE_TTL = 60
+DEFAULT_LOCK_TIMEOUT = 10
+DEFAULT_LOCK_WAIT = 2
+
+_MISSING = object()
+
+
+class TieredCache(BaseCache):
+    """
+    Caché en dos niveles: un LRU pequeño en memoria del proceso (L1) delante
+    de un backend compartido entre workers (L2, otro alias de CACHES).
+
+    Las escrituras van siempre a L2; L1 guarda copias por a lo más
+    L1_TIMEOUT segundos, así que un cambio hecho por otro worker se ve con
+    ese retraso máximo. Las claves que empiezan con algún prefijo de
+    L1_EXCLUDE (p. ej. el carrito) se leen siempre desde L2.
+
+    OPTIONS: L2, L1_MAX_ENTRIES, L1_TIMEOUT, L1_EXCLUDE, STALE_TTL, LOCK_TIMEOUT.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l2_alias = options.get('L2') or location or 'shared'
+        self.l1_max_entries = int(options.get('L1_MAX_ENTRIES', DEFAULT_L1_MAX_ENTRIES))
+        self.l1_timeout = float(options.get('L1_TIMEOUT', DEFAULT_L1_TIMEOUT))
+        self.l1_exclude = tuple(options.get('L1_EXCLUDE', ()))
+        self.stale_ttl = int(options.get('STALE_TTL', DEFAULT_STALE_TTL))
+        self.lock_timeout = int(options.get('LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT))
+        self._l1 = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(('l1_hits', 'l2_hits', 'misses', 'stale_hits', 'recomputes'), 0)
+
+    @cached_property
+    def l2(self):
+        return caches[self._l2_alias]
+
+    # --- L1 ---
+
+    def _local(self, key):
+        return not key.startswith(self.l1_exclude)
+
+    def _l1_get(self, key, version):
+        local_key = self.make_key(key, version)
+        with self._lock:
+            entry = self._l1.get(local_key)
+            if entry is None:
+                return _MISSING
+            if entry[1] <= time.monotonic():
+                del self._l1[local_key]
+                return _MISSING
+            self._l1.move_to_end(local_key)
+        return pickle.loads(entry[0])
+
+    def _l1_set(self, key, value, timeout, version):
+        if not self._local(key):
+            return
+        ttl = self.l1_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            ttl = min(ttl, timeout)
+        if ttl <= 0:
+            self._l1_delete(key, version)
+            return
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        local_key = self.make_key(key, version)
+        with self._lock:
+            self._l1[local_key] = (data, time.monotonic() + ttl)
+            self._l1.move_to_end(local_key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_delete(self, key, version):
+        with self._lock:
+            self._l1.pop(self.make_key(key, version), None)
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        """Contadores de aciertos y fallos de este proceso"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['l1_size'] = len(self._l1)
+        lookups = stats['l1_hits'] + stats['l2_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['l1_hits'] + stats['l2_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            for name in self._stats:
+                self._stats[name] = 0
+
+    # --- API de BaseCache ---
+
+    def get(self, key, default=None, version=None):
+        if self._local(key):
+            value = self._l1_get(key, version)
+            if value is not _MISSING:
+                self._count('l1_hits')
+                return value
+        value = self.l2.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._count('misses')
+            return default
+        self._count('l2_hits')
+        self._l1_set(key, value, DEFAULT_TIMEOUT, version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.l2.set(key, value, timeout, version=version)
+        self._l1_set(key, value, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_delete(key, version)
+        return self.l2.add(key, value, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self._l1_delete(key, version)
+        return self.l2.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._l1_delete(key, version)
+        return self.l2.delete(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._l1_delete(key, version)
+        return self.l2.incr(key, delta, version=version)
+
+    def has_key(self, key, version=None):
+        if self._local(key) and self._l1_get(key, version) is not _MISSING:
+            return True
+        return self.l2.has_key(key, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._l1.clear()
+        self.l2.clear()
+
+    def close(self, **kwargs):
+        self.l2.close(**kwargs)
+
+    # --- Protección contra estampidas ---
+
+    def get_or_compute(self, key, compute, timeout, stale_ttl=None, lock_timeout=None, wait=DEFAULT_LOCK_WAIT):
+        return get_or_compute(
+            key, compute, timeout, cache=self,
+            stale_ttl=self.stale_ttl if stale_ttl is None else stale_ttl,
+            lock_timeout=self.lock_timeout if lock_timeout is None else lock_timeout,
+            wait=wait,
+        )
+
+
+class _Entry(NamedTuple):
+    value: Any
+    fresh_until: float
+
+
+def _count(cache, name):
+    if isinstance(cache, TieredCache):
+        cache._count(name)
+
+
+def get_or_compute(key, compute, timeout, cache=None, stale_ttl=DEFAULT_STALE_TTL,
+                   lock_timeout=DEFAULT_LOCK_TIMEOUT, wait=DEFAULT_LOCK_WAIT):
+    """
+    Valor de `key`, calculándolo con `compute()` en un solo worker a la vez.
+
+    El valor se guarda `timeout + stale_ttl` segundos pero es fresco solo
+    durante `timeout`. Cuando vence, el worker que obtiene el lock (un add()
+    en la caché compartida) lo recalcula y el resto sigue sirviendo el valor
+    viejo. Si no hay ningún valor, los demás esperan hasta `wait` segundos
+    al que está calculando antes de calcularlo ellos mismos.
+    Sirve con cualquier backend de Django.
+    """
+    if cache is None:
+        cache = caches['default']
+    entry = cache.get(key)
+    if isinstance(entry, _Entry) and entry.fresh_until > time.time():
+        return entry.value
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, lock_timeout):
+        try:
+            _count(cache, 'recomputes')
+            value = compute()
+            cache.set(key, _Entry(value, time.time() + timeout), timeout + stale_ttl)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    if isinstance(entry, _Entry):
+        _count(cache, 'stale_hits')
+        return entry.value
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if isinstance(entry, _Entry):
+            return entry.value
+    logger.warning(f"Tiempo de espera agotado para {key}; se calcula sin lock")
+    return compute()
@@ -0,0 +1,99 @@
+import logging
+import re
+import time
+from django.core.cache import cache
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from .fragment_cache import fragment_timeout
+from .tiered_cache import get_or_compute
+
+logger = logging.getLogger(__name__)
+
+TRACKING_VERSION_KEY = 'tracking:version:{order_number}'
+TRACKING_FRAGMENT_KEY = 'tracking:fragment:{order_number}:{version}'
+TRACKING_FRAGMENT_TEMPLATE = 'stock_smart/includes/tracking_order.html'
+# Solo números con forma válida llegan a la caché y a la BD
+ORDER_NUMBER_RE = re.compile(r'[A-Za-z0-9-]{1,50}')
+
+
+def get_tracking_version(order_number):
+    """Versión del seguimiento de una orden (va en la clave del fragmento), o None"""
+    return cache.get(TRACKING_VERSION_KEY.format(order_number=order_number))
+
+
+def create_tracking_version(order_number):
+    """
+    Crea la versión de una orden que existe, con la misma duración que el
+    fragmento. Parte de un valor basado en la hora (no en 1) para que, si
+    la clave expira, no vuelva a coincidir con un fragmento antiguo.
+    """
+    key = TRACKING_VERSION_KEY.format(order_number=order_number)
+    cache.add(key, time.time_ns(), fragment_timeout())
+    return cache.get(key, 0)
+
+
+def bump_tracking_version(order_number):
+    """
+    Invalida el fragmento de seguimiento; se llama desde las señales. Sin
+    versión en caché no hay fragmento que invalidar.
+    """
+    key = TRACKING_VERSION_KEY.format(order_number=order_number)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return None
+
+
+def tracking_queryset():
+    """Orden con items, productos e historial precargados"""
+    from ..models import Order, OrderItem, OrderTracking
+
+    return Order.objects.prefetch_related(
+        Prefetch('orderitem_set', queryset=OrderItem.objects.select_related('product').order_by('id')),
+        Prefetch('tracking_history', queryset=OrderTracking.objects.order_by('-created_at', '-id')),
+    )
+
+
+def find_order(order_number):
+    from ..models import Order
+
+    try:
+        return tracking_queryset().get(order_number=order_number)
+    except Order.DoesNotExist:
+        return None
+
+
+def _render(order_number):
+    order = find_order(order_number)
+    if order is None:
+        return None
+    return render_to_string(TRACKING_FRAGMENT_TEMPLATE, {
+        'order': order,
+        'items': order.orderitem_set.all(),
+        'history': order.tracking_history.all(),
+    })
+
+
+def render_tracking(order_number):
+    """
+    HTML del detalle de seguimiento, o None si la orden no existe.
+
+    Se guarda en caché hasta el próximo cambio de la orden o de su
+    historial, así que las consultas repetidas no llegan a la BD. Las
+    búsquedas sin resultado no crean claves: con números inventados desde
+    muchas IPs la caché crecería sin límite.
+    """
+    html = None
+    version = get_tracking_version(order_number)
+    if version is None:
+        # La clave de versión se crea solo después de encontrar la orden
+        html = _render(order_number)
+        if html is None:
+            return None
+        version = create_tracking_version(order_number)
+
+    def compute():
+        return html if html is not None else _render(order_number)
+
+    key = TRACKING_FRAGMENT_KEY.format(order_number=order_number, version=version)
+    return get_or_compute(key, compute, fragment_timeout(), cache=cache)
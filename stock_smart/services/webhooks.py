@@ -0,0 +1,232 @@
+import logging
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .inventory import InsufficientStock, commit_order, release_order
+from .invoices import generate_invoices
+from .outbox import queue_order_confirmation
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATION_BATCH_SIZE = 100
+MAX_NOTIFICATION_ATTEMPTS = 10
+# Espera entre reintentos: base * 2^intentos, con tope
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=1)
+
+# Estados de pago de Flow (payment/getStatus)
+FLOW_PAID = 2
+FLOW_REJECTED = (3, 4)
+
+MERCADOPAGO_PAID = 'approved'
+MERCADOPAGO_REJECTED = ('rejected', 'cancelled', 'refunded', 'charged_back')
+
+# Órdenes a la espera del pago; 'pending_payment' y 'PENDING' los escribían
+# checkouts antiguos y siguen en la base de datos
+PENDING_STATUSES = ('pending', 'pending_payment', 'PENDING')
+
+
+class RetryLater(Exception):
+    """El pago aún no tiene estado final; se reintenta en el próximo drenado"""
+
+
+class NeedsReview(Exception):
+    """El pago no se puede aplicar automáticamente; no se reintenta"""
+
+
+def record_notification(provider, reference, payload=None):
+    """
+    Guarda la notificación en la bandeja con un solo INSERT.
+
+    Si la pasarela reintenta la misma notificación, la restricción única
+    (proveedor, referencia) la descarta sin error.
+    """
+    from ..models import PaymentNotification
+
+    if not reference:
+        return False
+    PaymentNotification.objects.bulk_create(
+        [PaymentNotification(provider=provider, reference=str(reference), payload=payload or {})],
+        ignore_conflicts=True
+    )
+    return True
+
+
+def _mark_paid(order):
+    if order.payment_status != 'completed':
+        order.payment_status = 'completed'
+        order.paid_at = timezone.now()
+        order.save(update_fields=['payment_status', 'paid_at', 'updated_at'])
+    try:
+        commit_order(order)
+    except InsufficientStock as e:
+        # El cobro ya está hecho: reintentar no repone el stock
+        raise NeedsReview(f'Orden {order.order_number} pagada sin stock suficiente: {e}') from e
+    if order.status in PENDING_STATUSES:
+        order.status = 'processing'
+        order.save(update_fields=['status', 'updated_at'])
+        logger.info(f"Orden {order.order_number} marcada como pagada")
+    queue_order_confirmation(order)
+    if not order.invoice:
+        # La boleta se renderiza en el worker una vez confirmado el pago
+        transaction.on_commit(lambda: generate_invoices([order.pk]), robust=True)
+
+
+def _mark_failed(order):
+    if order.payment_status not in ('completed', 'failed'):
+        order.payment_status = 'failed'
+        update_fields = ['payment_status', 'updated_at']
+        if order.status in PENDING_STATUSES:
+            order.status = 'cancelled'
+            update_fields.append('status')
+        order.save(update_fields=update_fields)
+        logger.warning(f"Pago fallido para orden {order.order_number}")
+    release_order(order)
+
+
+def fetch_flow_payment(notification):
+    from .flow_service import FlowPaymentService
+
+    payment = FlowPaymentService().get_payment_status(notification.reference)
+    if not payment:
+        raise RetryLater('Flow no respondió el estado del pago')
+    return payment
+
+
+def apply_flow_payment(notification, payment):
+    from ..models import Order
+
+    order = (
+        Order.objects.select_for_update().filter(flow_token=notification.reference).first()
+        or Order.objects.select_for_update().get(order_number=payment.get('commerceOrder'))
+    )
+    status = payment.get('status')
+    if status == FLOW_PAID:
+        _mark_paid(order)
+    elif status in FLOW_REJECTED:
+        _mark_failed(order)
+    else:
+        raise RetryLater(f'Pago pendiente en Flow (estado {status})')
+
+
+def fetch_mercadopago_payment(notification):
+    from ..adapters.mercadopago_adapter import MercadoPagoAdapter
+
+    topic, _, payment_id = notification.reference.partition(':')
+    if topic != 'payment':
+        # merchant_order y otros avisos no cambian el estado de la orden
+        return None
+
+    response = MercadoPagoAdapter().sdk.payment().get(payment_id)
+    if response.get('status') != 200:
+        raise RetryLater(f'MercadoPago respondió {response.get("status")}')
+    return response.get('response', {})
+
+
+def apply_mercadopago_payment(notification, payment):
+    from ..models import Order
+
+    if payment is None:
+        return
+    order = Order.objects.select_for_update().get(id=payment.get('external_reference'))
+    status = payment.get('status')
+    if status == MERCADOPAGO_PAID:
+        _mark_paid(order)
+    elif status in MERCADOPAGO_REJECTED:
+        _mark_failed(order)
+    else:
+        raise RetryLater(f'Pago pendiente en MercadoPago ({status})')
+
+
+def apply_payments_notification(notification, payment):
+    from payments import PaymentStatus, get_payment_model
+
+    payment = get_payment_model().objects.select_for_update().get(id=notification.reference)
+    if payment.status != PaymentStatus.CONFIRMED:
+        payment.status = PaymentStatus.CONFIRMED
+        payment.save()
+
+
+# proveedor -> (consulta a la pasarela fuera de la transacción, cambio en la BD)
+NOTIFICATION_HANDLERS = {
+    'flow': (fetch_flow_payment, apply_flow_payment),
+    'mercadopago': (fetch_mercadopago_payment, apply_mercadopago_payment),
+    'payments': (lambda notification: None, apply_payments_notification),
+}
+
+
+def _retry_delay(attempts):
+    return min(RETRY_BASE_DELAY * (2 ** (attempts - 1)), RETRY_MAX_DELAY)
+
+
+def process_notification(notification):
+    """Aplica una notificación; retorna True si ya no queda pendiente"""
+    from ..models import PaymentNotification
+
+    handler = NOTIFICATION_HANDLERS.get(notification.provider)
+    notification.attempts += 1
+    try:
+        if handler is None:
+            raise ValueError(f'Proveedor desconocido: {notification.provider}')
+        fetch, apply = handler
+        # La llamada HTTP va fuera de la transacción: con transaction_mode
+        # IMMEDIATE en SQLite el lock de escritura se tomaría durante toda
+        # la espera a la pasarela y bloquearía checkout y reservas
+        payment = fetch(notification)
+        with transaction.atomic():
+            if not PaymentNotification.objects.select_for_update().filter(
+                pk=notification.pk, status=PaymentNotification.RECEIVED
+            ).exists():
+                # Otro worker la aplicó mientras se consultaba la pasarela
+                return False
+            try:
+                apply(notification, payment)
+            except NeedsReview as e:
+                # Estado terminal: el pago queda registrado y se revisa a mano
+                notification.status = PaymentNotification.REVIEW
+                notification.last_error = str(e)
+                logger.error(f"Notificación {notification} requiere revisión manual: {str(e)}")
+            else:
+                notification.status = PaymentNotification.PROCESSED
+                notification.last_error = ''
+            notification.processed_at = timezone.now()
+            notification.save(update_fields=['status', 'attempts', 'processed_at', 'last_error'])
+        return True
+    except Exception as e:
+        logger.warning(f"Notificación {notification} no procesada: {str(e)}")
+        notification.last_error = str(e)
+        if notification.attempts >= MAX_NOTIFICATION_ATTEMPTS:
+            notification.status = PaymentNotification.FAILED
+            logger.error(f"Notificación {notification} descartada tras {notification.attempts} intentos")
+        else:
+            notification.available_at = timezone.now() + _retry_delay(notification.attempts)
+        notification.save(update_fields=['status', 'attempts', 'last_error', 'available_at'])
+        return False
+
+
+def drain_notifications(batch_size=NOTIFICATION_BATCH_SIZE):
+    """
+    Procesa un lote de notificaciones pendientes; retorna (procesadas, total).
+
+    Cada notificación se toma con un UPDATE condicionado (corriendo
+    `available_at` hacia adelante) para que dos workers no la apliquen a la vez.
+    """
+    from ..models import PaymentNotification
+
+    now = timezone.now()
+    pending = list(
+        PaymentNotification.objects.filter(status=PaymentNotification.RECEIVED, available_at__lte=now)
+        .order_by('available_at', 'id')[:batch_size]
+    )
+    processed = 0
+    for notification in pending:
+        lease = now + RETRY_BASE_DELAY
+        claimed = PaymentNotification.objects.filter(
+            pk=notification.pk, status=PaymentNotification.RECEIVED, available_at=notification.available_at
+        ).update(available_at=lease)
+        if not claimed:
+            continue
+        notification.available_at = lease
+        if process_notification(notification):
+            processed += 1
+    return processed, len(pending)
@@ -0,0 +1,119 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+from django.contrib.auth.signals import user_logged_in
+from django.dispatch import receiver
+from .models import Brand, Category, Cart, CartItem, Order, OrderItem, OrderTracking, Product
+from .services.cart import CartService
+from .services.category_tree import bump_category_tree_version
+from .services.fragment_cache import bump_catalog_version
+from .services.search import get_search_backend
+from .services.suggest import refresh_suggestion
+from .services.tracking import bump_tracking_version
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Aplica SQLITE_PRAGMAS (WAL, busy_timeout, caché...) a cada conexión SQLite nueva"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_tree(sender, instance, **kwargs):
+    """Invalida el árbol de categorías cacheado al modificar una categoría"""
+    bump_category_tree_version()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Brand)
+@receiver(post_delete, sender=Brand)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_fragments(sender, instance, **kwargs):
+    """Invalida los fragmentos cacheados de home y detalle de producto"""
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def update_cart_totals(sender, instance, **kwargs):
+    """Mantiene item_count y total_amount del carrito al cambiar sus items"""
+    Cart.recalculate_totals(Cart.objects.filter(pk=instance.cart_id))
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def update_order_totals(sender, instance, raw=False, **kwargs):
+    """Mantiene subtotal, IVA y total general de la orden al cambiar sus items"""
+    origin = kwargs.get('origin')
+    if raw or isinstance(origin, Order) or getattr(origin, 'model', None) is Order:
+        # Carga de fixtures o la orden misma se está eliminando
+        return
+    # Si quien creó el item tiene la orden en memoria, también se actualiza
+    order = instance._state.fields_cache.get('order')
+    if order is not None:
+        order.refresh_totals()
+    else:
+        Order.recalculate_totals(Order.objects.filter(pk=instance.order_id))
+
+
+@receiver(post_save, sender=Order)
+def invalidate_order_tracking(sender, instance, **kwargs):
+    """Invalida el seguimiento cacheado al cambiar la orden (o al crearla)"""
+    bump_tracking_version(instance.order_number)
+
+
+@receiver(post_save, sender=OrderTracking)
+def invalidate_tracking_history(sender, instance, created=False, **kwargs):
+    """Cada nuevo estado del historial invalida el seguimiento cacheado"""
+    if created:
+        bump_tracking_version(instance.order.order_number)
+
+
+@receiver(user_logged_in)
+def merge_guest_cart(sender, request, user, **kwargs):
+    """Traspasa el carrito de invitado al carrito del usuario al iniciar sesión"""
+    if request is not None:
+        CartService.merge_guest_cart(request, user)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    """Actualiza el índice de búsqueda del producto"""
+    if not raw:
+        get_search_backend().index_products(Product.objects.filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+def reindex_related_products(sender, instance, created=False, raw=False, **kwargs):
+    """Las palabras clave del índice incluyen marca y categoría"""
+    if not created and not raw:
+        lookup = 'brand' if sender is Brand else 'category'
+        get_search_backend().index_products(Product.objects.filter(**{lookup: instance}))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+def update_suggestion(sender, instance, **kwargs):
+    """Mantiene el índice de autocompletado del proceso"""
+    refresh_suggestion(sender._meta.model_name, instance)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Category)
+def remove_suggestion(sender, instance, **kwargs):
+    refresh_suggestion(sender._meta.model_name, instance, deleted=True)
@@ -40,4 +40,37 @@ function addToCart(productId) {
         console.error('Error:', error);
         alert('Error al agregar al carrito');
     });
-}
\ No newline at end of file
+}
+function initSearchSuggest() {
+    // Autocompletado del buscador usando /api/search/suggest
+    const input = document.querySelector('input[data-suggest-url]');
+    const list = document.getElementById('search-suggestions');
+    if (!input || !list) {
+        return;
+    }
+
+    let timer = null;
+    input.addEventListener('input', function() {
+        clearTimeout(timer);
+        const query = input.value.trim();
+        if (query.length < 2) {
+            list.innerHTML = '';
+            return;
+        }
+        timer = setTimeout(function() {
+            fetch(`${input.dataset.suggestUrl}?q=${encodeURIComponent(query)}`)
+                .then(response => response.json())
+                .then(data => {
+                    list.innerHTML = '';
+                    data.suggestions.forEach(suggestion => {
+                        const option = document.createElement('option');
+                        option.value = suggestion.label;
+                        list.appendChild(option);
+                    });
+                })
+                .catch(error => console.error('Error:', error));
+        }, 150);
+    });
+}
+
+document.addEventListener('DOMContentLoaded', initSearchSuggest);
@@ -0,0 +1,21 @@
+from django import template
+from ..services.pagination import CURSOR_PARAM
+
+register = template.Library()
+
+@register.simple_tag(takes_context=True)
+def cursor_url(context, cursor):
+    """
+    URL de la página actual con otro cursor, conservando los filtros
+    Ejemplo: {% cursor_url page.next_cursor %} -> ?q=taladro&cursor=...
+    """
+    params = context['request'].GET.copy()
+    params.pop(CURSOR_PARAM, None)
+    if cursor:
+        params[CURSOR_PARAM] = cursor
+    return f'?{params.urlencode()}' if params else '?'
+
+@register.inclusion_tag('stock_smart/includes/keyset_pagination.html', takes_context=True)
+def keyset_pagination(context, page):
+    """Links Anterior/Siguiente de una KeysetPage"""
+    return {'page': page, 'request': context['request']}
@@ -19,6 +19,7 @@ urlpatterns = [
     path('about/', views.about, name='about'),
     path('contacto/', views.contacto, name='contacto'),
     path('terminos/', views.TerminosView.as_view(), name='terminos'),
+    path('seguimiento/', views.TrackingView.as_view(), name='tracking'),
    
     
     # Autenticación
@@ -46,6 +47,9 @@ urlpatterns = [
     
     # API endpoints para carrito
     path('api/cart/update/', views.update_cart_api, name='update_cart_api'),
+
+    # Autocompletado del buscador
+    path('api/search/suggest', views.search_suggest, name='search_suggest'),
     
     # Proceso de compra
     path('checkout/options/', views.checkout_options, name='checkout_options'),
@@ -53,6 +57,7 @@ urlpatterns = [
     path('checkout/process-payment/', views.process_payment, name='process_payment'),
     path('checkout/process-guest-order/', views.process_guest_order, name='process_guest_order'),
     path('checkout/flow-payment/<int:order_id>/', views.flow_payment, name='flow_payment'),
+    path('pedido/<int:order_id>/boleta/', views.descargar_boleta, name='descargar_boleta'),
     path('checkout/transfer-instructions/<int:order_id>/', views.transfer_instructions, name='transfer_instructions'),
     path('checkout/flow/confirm/', views.flow_confirm, name='flow_confirm'),
     path('checkout/flow/return/', views.flow_return, name='flow_return'),
@@ -96,6 +101,7 @@ urlpatterns = [
     path('categoria/<int:category_id>/', views.category_detail, name='category_detail'),
     path('categoria/<slug:slug>/', views.productos_por_categoria, name='productos_por_categoria'),
     path('productos/', views.ProductosListaView.as_view(), name='productos_lista'),
+    path('productos/filtrar/', views.filter_products, name='filter_products'),
     # Compra rápida (existente)
     path('checkout/options/<int:product_id>/', views.CheckoutOptionsView.as_view(), name='checkout_options'),
     # Checkout del carrito (nueva)
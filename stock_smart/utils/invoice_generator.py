@@ -6,19 +6,30 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 import io
 import logging
-from datetime import datetime
+from django.utils import timezone
 
 logger = logging.getLogger(__name__)
 
-class InvoiceGenerator:
-    def __init__(self):
-        self.styles = getSampleStyleSheet()
-        self.title_style = ParagraphStyle(
+_styles = None
+
+
+def get_styles():
+    """Hoja de estilos compartida: getSampleStyleSheet es costoso y no cambia"""
+    global _styles
+    if _styles is None:
+        styles = getSampleStyleSheet()
+        title_style = ParagraphStyle(
             'CustomTitle',
-            parent=self.styles['Heading1'],
+            parent=styles['Heading1'],
             alignment=1,
             spaceAfter=30
         )
+        _styles = (styles, title_style)
+    return _styles
+
+class InvoiceGenerator:
+    def __init__(self):
+        self.styles, self.title_style = get_styles()
 
     def generate_invoice(self, order):
         """Genera la boleta en PDF"""
@@ -30,7 +41,9 @@ class InvoiceGenerator:
                 rightMargin=72,
                 leftMargin=72,
                 topMargin=72,
-                bottomMargin=72
+                bottomMargin=72,
+                # Sin fecha de creación ni ID aleatorio: misma orden, mismo PDF
+                invariant=1
             )
             
             elements = self._build_elements(order)
@@ -60,7 +73,7 @@ class InvoiceGenerator:
         return [
             Paragraph("BOLETA ELECTRÓNICA", self.title_style),
             Paragraph(f"Orden #{order.order_number}", self.styles['Heading2']),
-            Paragraph(f"Fecha: {datetime.now().strftime('%d/%m/%Y')}", self.styles['Normal']),
+            Paragraph(f"Fecha: {timezone.localtime(order.created_at).strftime('%d/%m/%Y')}", self.styles['Normal']),
             Spacer(1, 20),
             Paragraph("Tu Empresa", self.styles['Heading3']),
             Paragraph("RUT: 76.XXX.XXX-X", self.styles['Normal']),
@@ -72,6 +85,7 @@ class InvoiceGenerator:
         """Construye la tabla de productos"""
         data = [['Producto', 'Cantidad', 'Precio', 'Total']]
         
+        # Con prefetch_related('orderitem_set__product') no hay consultas por item
         for item in order.orderitem_set.all():
             data.append([
                 item.product.name,
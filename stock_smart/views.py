@@ -1,11 +1,12 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils.crypto import get_random_string
 from django.db.models import Q
-from django.http import JsonResponse, HttpResponse, FileResponse
-from django.views.decorators.http import require_POST, require_http_methods
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
 from django.core.paginator import Paginator
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt, csrf_protect
 from .forms import RegisterForm, GuestCheckoutForm, UserProfileForm, CustomUserCreationForm
@@ -13,12 +14,24 @@ from .models import CustomUser, Product, Category, Cart, CartItem, Order, FlowCr
 import json
 from decimal import Decimal
 from django.utils import timezone
-from django.core.mail import EmailMessage, send_mail
+from django.core.mail import EmailMessage
 from django.conf import settings
 from .services.flow_service import FlowPaymentService
+from .services.gateway import get_async_gateway_client, get_gateway_client
+from .services.category_tree import get_category_tree
+from .services.facets import ProductFacets
+from .services.pagination import KeysetPaginationMixin, KeysetPaginator, ordering_from_request, paginate
+from .services.search import search_catalog
+from .services.suggest import get_suggestion_index
+from .services.cart import CartService, DatabaseCartBackend
+from .services.inventory import InsufficientStock, release_order, reserve_order
+from .services.order_builder import build_order
+from .services.invoices import get_invoice, paid_orders_filter
+from .services.rate_limit import client_ip, is_rate_limited
+from .services.tracking import ORDER_NUMBER_RE, render_tracking
+from .services.webhooks import FLOW_PAID, FLOW_REJECTED, record_notification
 import uuid
 from django.contrib.humanize.templatetags.humanize import intcomma
-import requests
 from django.urls import reverse
 import hashlib
 import hmac
@@ -34,7 +47,7 @@ from django.views import View
 from django.core.exceptions import ValidationError
 from django import forms
 import time
-from django.db import connection
+from django.db import connection, transaction
 from django.utils.decorators import method_decorator
 from .adapters.mercadopago_adapter import MercadoPagoAdapter
 from django.db import models
@@ -45,21 +58,27 @@ logger = logging.getLogger(__name__)
 Payment = get_payment_model()
 logger = logging.getLogger('django.security')
 
+PRODUCTOS_POR_PAGINA = 12
+
+# render y build_order tocan el ORM (context processors, usuario): en
+# vistas async se ejecutan en un hilo
+arender = sync_to_async(render)
+abuild_order = sync_to_async(build_order)
+
 def get_cart_count(request):
-    if request.user.is_authenticated:
-        cart = Cart.objects.filter(user=request.user).first()
-        return cart.get_total_items() if cart else 0
-    else:
-        return len(request.session.get('cart', {}))
+    return CartService(request).count()
 
 def index(request):
-    offer_products = Product.objects.filter(discount_percentage__gt=0, active=True)[:8]
-    featured_products = Product.objects.filter(active=True)[:8]
+    # Querysets perezosos: solo se consultan si el fragmento no está en caché
+    # Ofertas con mayor descuento primero: el orden sale de product_active_sale_idx
+    offer_products = Product.objects.catalog().filter(discount_percentage__gt=0, active=True).order_by(
+        '-discount_percentage', '-created_at'
+    )[:8]
+    featured_products = Product.objects.catalog().filter(active=True)[:8]
     
     context = {
         'offer_products': offer_products,
         'featured_products': featured_products,
-        'main_categories': Category.objects.filter(parent=None, is_active=True)
     }
     return render(request, 'stock_smart/home.html', context)
 
@@ -146,56 +165,45 @@ def help_view(request):
     return render(request, 'stock_smart/ayuda.html')
 
 def category_view(request, slug):
-    category = get_object_or_404(Category, slug=slug, is_active=True)
+    tree = get_category_tree()
+    category = tree.get_or_404(slug=slug, active_only=True)
     
     # Obtener productos de la categoría
-    products = Product.objects.filter(
+    products = Product.objects.catalog().filter(
         category=category,
         stock__gt=0
-    ).order_by('-created_at')
+    )
+    products = paginate(request, products, PRODUCTOS_POR_PAGINA, ordering=ordering_from_request(request))
     
     # Obtener categorías para el mega menú
-    main_categories = Category.objects.filter(
-        parent__isnull=True,
-        is_active=True
-    ).prefetch_related('children')
+    main_categories = tree.roots()
     
     context = {
         'category': category,
         'products': products,
+        'page_obj': products,
         'main_categories': main_categories,
     }
     return render(request, 'stock_smart/category.html', context)
 
 
 def products(request):
-    products_list = Product.objects.all()
+    products_list = Product.objects.catalog()
     
-    # B��squeda
+    # Búsqueda (ordenada por relevancia salvo que se pida otro orden)
     query = request.GET.get('q')
-    if query:
-        products_list = products_list.filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query)
-        )  # Aquí faltaba cerrar el paréntesis
-    
-    # Ordenamiento
     order = request.GET.get('order')
-    if order:
-        if order == 'price_asc':
-            products_list = products_list.order_by('price')
-        elif order == 'price_desc':
-            products_list = products_list.order_by('-price')
-        elif order == 'name':
-            products_list = products_list.order_by('name')
+    if query:
+        products_list = search_catalog(query, products_list)
+        if order:
+            products_list = products_list.as_queryset()
     
-    # Paginación
-    paginator = Paginator(products_list, 9)  # 9 productos por página
-    page = request.GET.get('page')
-    products = paginator.get_page(page)
+    # Paginación por cursor (9 productos por página)
+    products = paginate(request, products_list, 9, ordering=ordering_from_request(request))
     
     context = {
         'products': products,
+        'page_obj': products,
     }
     return render(request, 'stock_smart/products.html', context)
 
@@ -317,24 +325,16 @@ def process_payment(request):
 
         # Crear orden directamente
         order_number = f'ORD-{timezone.now().strftime("%Y%m%d")}-{uuid.uuid4().hex[:8]}'
-        order = Order.objects.create(
+        order, _ = build_order(
+            {product.id: 1},
             order_number=order_number,
-            total_amount=product.final_price,
             status='pending',
+            payment_method='flow',
             customer_email=request.POST.get('email', ''),
             customer_name=f"{request.POST.get('nombre', '')} {request.POST.get('apellido', '')}"
         )
         logger.info(f"Orden creada: {order.order_number}")
 
-        # Crear item de orden
-        OrderItem.objects.create(
-            order=order,
-            product=product,
-            quantity=1,
-            price=product.final_price
-        )
-        logger.info("Item de orden creado")
-
         # Datos para Flow Sandbox
         payment_data = {
             "apiKey": settings.FLOW_API_KEY,
@@ -365,8 +365,8 @@ def process_payment(request):
         logger.info("Firma generada")
         
         # Enviar a Flow Sandbox
-        response = requests.post(
-            'https://sandbox.flow.cl/api/payment/create',
+        response = get_gateway_client('flow').post(
+            'payment/create',
             data=payment_data
         )
         
@@ -384,9 +384,13 @@ def process_payment(request):
                 return redirect(data['url'])
         
         logger.error("Error en respuesta de Flow Sandbox")
+        release_order(order)
         messages.error(request, 'Error al procesar el pago')
         return redirect('stock_smart:checkout_error')
         
+    except InsufficientStock as e:
+        messages.error(request, 'Producto sin stock disponible')
+        return redirect('stock_smart:checkout_error')
     except Exception as e:
         logger.error(f"Error en process_payment: {str(e)}")
         logger.error(traceback.format_exc())
@@ -444,8 +448,10 @@ def guest_checkout(request):
                     order_number = f'ORD-{timezone.now().strftime("%Y%m%d")}-{uuid.uuid4().hex[:8]}'
                     logger.info(f"Número de orden generado: {order_number}")
                     
-                    # Crear orden
-                    order = Order.objects.create(
+                    # Crear orden con su item; Flow crea su propia orden (y reserva) en process_payment
+                    order, _ = build_order(
+                        {product.id: 1},
+                        reserve=payment_method != 'flow',
                         order_number=order_number,
                         customer_name=f"{form.cleaned_data['nombre']} {form.cleaned_data['apellido']}",
                         customer_email=form.cleaned_data['email'],
@@ -456,19 +462,9 @@ def guest_checkout(request):
                         shipping_address=form.cleaned_data.get('direccion', ''),
                         shipping_method=form.cleaned_data['shipping'],
                         payment_method=payment_method,
-                        total_amount=final_price,  # Usamos el precio calculado
-                        status='pending_payment'
+                        status='pending'
                     )
                     logger.info(f"Orden creada con ID: {order.id}")
-
-                    # Crear item de orden
-                    OrderItem.objects.create(
-                        order=order,
-                        product=product,
-                        quantity=1,
-                        price=final_price  # Usamos el precio calculado
-                    )
-                    logger.info("Item de orden creado")
                     
                     # Guardar en sesión
                     request.session['order_id'] = order.id
@@ -497,10 +493,6 @@ def guest_checkout(request):
                             return redirect('stock_smart:checkout_error')
                     elif payment_method == 'transfer':
                         logger.info(f"Redirigiendo a instrucciones de transferencia para orden {order.id}")
-                        # Actualizar estado de la orden
-                        order.status = 'pending_payment'
-                        order.save()
-                        logger.info(f"Estado de orden actualizado a: pending_payment")
                         return render(request, 'stock_smart/transfer_instructions.html', {
                             'order': order,
                             'bank_info': {
@@ -548,13 +540,18 @@ def guest_checkout(request):
 
 
 def category_detail(request, category_id):
-    category = get_object_or_404(Category, id=category_id)
-    products = Product.objects.filter(category=category)
-    main_categories = Category.objects.filter(parent=None)
+    tree = get_category_tree()
+    category = tree.get_or_404(category_id=category_id)
+    products = paginate(
+        request, Product.objects.catalog().filter(category=category), PRODUCTOS_POR_PAGINA,
+        ordering=ordering_from_request(request)
+    )
+    main_categories = tree.roots(active_only=False)
     
     context = {
         'category': category,
         'products': products,
+        'page_obj': products,
         'main_categories': main_categories,
     }
     
@@ -562,12 +559,13 @@ def category_detail(request, category_id):
     return render(request, 'stock_smart/categories.html', context)
 
 def product_detail(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    related_products = Product.objects.filter(category=product.category).exclude(id=product.id)[:4]
+    product = get_object_or_404(Product.objects.select_related('category', 'brand'), id=product_id)
+    # Se evalúa solo si el fragmento de relacionados no está en caché
+    related_products = Product.objects.catalog().filter(category=product.category_id, active=True).exclude(id=product.id)[:4]
     
     context = {
-        'product': product,
-        'related_products': related_products,
+        'producto': product,
+        'productos_relacionados': related_products,
     }
     return render(request, 'stock_smart/producto_detalle.html', context)
 
@@ -604,6 +602,19 @@ def order_history(request):
         'titulo': 'Historial de Pedidos'
     })
 
+@login_required
+def descargar_boleta(request, order_id):
+    """Descarga la boleta PDF de una orden pagada (se genera una sola vez)"""
+    order = get_object_or_404(Order.objects.filter(paid_orders_filter()), id=order_id)
+    if not request.user.is_staff and order.customer_email.lower() != request.user.email.lower():
+        raise Http404('Orden no encontrada')
+
+    invoice = get_invoice(order)
+    return FileResponse(
+        invoice.open('rb'), content_type='application/pdf',
+        filename=f'boleta_{order.order_number}.pdf'
+    )
+
 @login_required
 def dashboard(request):
     if not request.user.is_staff:
@@ -619,9 +630,13 @@ def manage_products(request):
     if not request.user.is_staff:
         return redirect('stock_smart:productos_lista')
     
-    products = Product.objects.all()
+    products = paginate(
+        request, Product.objects.all(), 25,
+        ordering=ordering_from_request(request), with_count=True
+    )
     return render(request, 'stock_smart/dashboard/products.html', {
         'products': products,
+        'page_obj': products,
         'titulo': 'Gestión de Productos'
     })
 
@@ -645,41 +660,43 @@ def manage_users(request):
 
 def search_products(request):
     query = request.GET.get('q', '')
-    productos = Product.objects.all()
+    productos = Product.objects.catalog()
     
     # Obtener todas las categorías activas
-    categories = Category.objects.filter(is_active=True)
-    
-    logger.info(f"Categorías disponibles: {[cat.name for cat in categories]}")
+    categories = get_category_tree().active()
 
     if query:
-        productos = productos.filter(name__icontains=query) | productos.filter(description__icontains=query)
-        logger.info(f"Búsqueda realizada: {query}")
-        logger.info(f"Productos encontrados: {productos.count()}")
+        productos = search_catalog(query, productos)
+        logger.info(f"Búsqueda realizada: {query} ({len(productos)} resultados)")
+
+    productos = paginate(request, productos, PRODUCTOS_POR_PAGINA, ordering=ordering_from_request(request))
 
     context = {
         'productos': productos,
+        'page_obj': productos,
         'categories': categories,
         'search_query': query
     }
     return render(request, 'stock_smart/productos_lista.html', context)
 
+@require_GET
+def search_suggest(request):
+    """Sugerencias de autocompletado desde el índice en memoria (sin BD)"""
+    query = request.GET.get('q', '')[:100]
+    suggestions = get_suggestion_index().lookup(query) if len(query.strip()) >= 2 else []
+    return JsonResponse({'query': query, 'suggestions': suggestions})
+
 def filter_products(request):
-    category_id = request.GET.get('category')
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    
-    products = Product.objects.filter(active=True)
-    
-    if category_id:
-        products = products.filter(category_id=category_id)
-    if min_price:
-        products = products.filter(published_price__gte=min_price)
-    if max_price:
-        products = products.filter(published_price__lte=max_price)
+    facets = ProductFacets(request.GET)
+    productos = paginate(
+        request, facets.results(), PRODUCTOS_POR_PAGINA, ordering=ordering_from_request(request)
+    )
     
     return render(request, 'stock_smart/productos_lista.html', {
-        'productos': products,
+        'productos': productos,
+        'page_obj': productos,
+        'facets': facets.facets(),
+        'selected_category': facets.category,
         'titulo': 'Productos Filtrados'
     })
 
@@ -722,7 +739,7 @@ def flow_payment(request):
     
     api_url = "https://sandbox.flow.cl/api" if flow_creds.is_sandbox else "https://www.flow.cl/api"
     
-    response = requests.post(
+    response = get_gateway_client('flow').post(
         f"{api_url}/payment/create",
         json=payment_data,
         headers=headers
@@ -737,52 +754,6 @@ def flow_payment(request):
         messages.error(request, 'Error al procesar el pago. Por favor, intente nuevamente.')
         return redirect('stock_smart:checkout')
 
-@csrf_exempt
-def flow_confirm(request):
-    """Confirmación de pago desde Flow"""
-    if request.method == "POST":
-        token = request.POST.get('token')
-        flow_creds = get_flow_credentials()
-        
-        if not flow_creds:
-            return HttpResponse(status=500)
-        
-        # Verificar el pago con Flow
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {flow_creds.api_key}"
-        }
-        
-        api_url = "https://sandbox.flow.cl/api" if flow_creds.is_sandbox else "https://www.flow.cl/api"
-        
-        response = requests.get(
-            f"{api_url}/payment/getStatus",
-            params={"token": token},
-            headers=headers
-        )
-        
-        if response.status_code == 200:
-            payment_data = response.json()
-            order = Order.objects.get(id=payment_data['commerceOrder'])
-            
-            if payment_data['status'] == 2:  # Pago exitoso
-                order.status = 'PAID'
-                order.save()
-                
-                # Actualizar stock
-                cart = order.cart
-                for item in cart.cartitem_set.all():
-                    product = item.product
-                    product.stock -= item.quantity
-                    product.save()
-                
-                cart.completed = True
-                cart.save()
-                
-            return HttpResponse(status=200)
-    
-    return HttpResponse(status=400)
-
 def flow_success(request):
     """Página de éxito después del pago"""
     token = request.GET.get('token')
@@ -834,23 +805,37 @@ def update_cart_item(request, item_id):
     """
     if request.method == 'POST':
         try:
-            cart_item = get_object_or_404(CartItem, id=item_id)
+            # Solo items del carrito de quien hace la petición
+            backend = CartService(request).backend
+            cart = backend.get_cart() if isinstance(backend, DatabaseCartBackend) else None
+            if cart is None:
+                raise Http404('Carrito no encontrado')
+            cart_item = get_object_or_404(CartItem.objects.select_related('product'), id=item_id, cart=cart)
             quantity = int(request.POST.get('quantity', 1))
             
+            with transaction.atomic():
+                if quantity > 0:
+                    cart_item.quantity = quantity
+                    cart_item.save()
+                else:
+                    cart_item.delete()
+                cart.refresh_from_db(fields=['item_count', 'total_amount'])
+            
             if quantity > 0:
-                cart_item.quantity = quantity
-                cart_item.save()
                 return JsonResponse({
                     'success': True,
                     'message': 'Cantidad actualizada',
                     'new_quantity': quantity,
-                    'new_total': cart_item.total
+                    'new_total': cart_item.total,
+                    'cart_total': float(cart.total_amount),
+                    'cart_count': cart.item_count
                 })
             else:
-                cart_item.delete()
                 return JsonResponse({
                     'success': True,
-                    'message': 'Item eliminado del carrito'
+                    'message': 'Item eliminado del carrito',
+                    'cart_total': float(cart.total_amount),
+                    'cart_count': cart.item_count
                 })
                 
         except (ValueError, TypeError):
@@ -869,36 +854,28 @@ def cart_checkout(request):
     """
     Vista para el proceso de checkout del carrito completo
     """
-    try:
-        # Obtener el carrito activo del usuario
-        cart = Cart.objects.get(
-            user=request.user,
-            is_active=True
-        )
-        
-        # Verificar que haya items en el carrito
-        if not cart.cartitem_set.exists():
-            messages.warning(request, 'Tu carrito está vacío')
-            return redirect('stock_smart:cart')
-        
-        # Calcular totales
-        subtotal = sum(item.total for item in cart.cartitem_set.all())
-        iva = subtotal * 0.19
-        total = subtotal + iva
-        
-        context = {
-            'cart': cart,
-            'cart_items': cart.cartitem_set.all(),
-            'subtotal': subtotal,
-            'iva': iva,
-            'total': total,
-        }
-        
-        return render(request, 'stock_smart/cart_checkout.html', context)
-        
-    except Cart.DoesNotExist:
-        messages.error(request, 'No se encontró un carrito activo')
-        return redirect('stock_smart:productos_lista')
+    cart = CartService(request)
+    cart_items = cart.lines()
+    
+    # Verificar que haya items en el carrito
+    if not cart_items:
+        messages.warning(request, 'Tu carrito está vacío')
+        return redirect('stock_smart:cart')
+    
+    # Calcular totales
+    subtotal = cart.total(cart_items)
+    iva = subtotal * Decimal('0.19')
+    total = subtotal + iva
+    
+    context = {
+        'cart': cart,
+        'cart_items': cart_items,
+        'subtotal': subtotal,
+        'iva': iva,
+        'total': total,
+    }
+    
+    return render(request, 'stock_smart/cart_checkout.html', context)
 
 def generate_order_number():
     """Genera un número de orden único"""
@@ -1014,26 +991,29 @@ def buy_now_payment(request, product_id):
     """
     Procesa el pago de compra directa mediante Flow
     """
+    order = None
     try:
         # Obtener datos de la sesión
         buy_data = request.session.get('buy_now_data')
         if not buy_data:
             raise ValueError("No hay datos de compra en la sesión")
 
-        # Crear orden en nuestro sistema
-        order = Order.objects.create(
+        email = request.user.email if request.user.is_authenticated else request.POST.get('email')
+
+        # Crear orden con su item y el stock reservado; el precio sale del producto
+        order, _ = build_order(
+            {buy_data['product_id']: buy_data.get('quantity', 1)},
+            reserve=True,
             order_number=generate_order_number(),
-            user=request.user if request.user.is_authenticated else None,
-            total_amount=buy_data['total'],
-            payment_method='FLOW',
-            status='PENDING'
+            customer_name=request.user.get_full_name() if request.user.is_authenticated else request.POST.get('name', ''),
+            customer_email=email or '',
+            payment_method='flow',
         )
 
         # Preparar datos para Flow
         commerceOrder = order.order_number
         subject = f"Pago Stock Smart - Orden {commerceOrder}"
-        amount = int(float(buy_data['total']))
-        email = request.user.email if request.user.is_authenticated else request.POST.get('email')
+        amount = int(order.total_amount)
         
         # URLs de respuesta
         urlConfirmation = request.build_absolute_uri(reverse('stock_smart:flow_confirm'))
@@ -1059,8 +1039,8 @@ def buy_now_payment(request, product_id):
         payment_data["s"] = sign
 
         # Enviar a Flow
-        flow_response = requests.post(
-            f"{settings.FLOW_API_URL}/payment/create",
+        flow_response = get_gateway_client('flow').post(
+            'payment/create',
             json=payment_data,
             headers={"Content-Type": "application/json"}
         )
@@ -1075,6 +1055,9 @@ def buy_now_payment(request, product_id):
             raise ValueError(f"Error en Flow: {flow_response.text}")
 
     except Exception as e:
+        if order is not None:
+            # Sin pago iniciado la reserva no debe esperar a vencer
+            release_order(order)
         messages.error(request, f"Error al procesar el pago: {str(e)}")
         return redirect('stock_smart:checkout_options')
 
@@ -1082,25 +1065,28 @@ def cart_payment(request):
     """
     Procesa el pago del carrito mediante Flow
     """
+    order = None
     try:
-        cart = Cart.get_active_cart(request)
-        if not cart or not cart.cartitem_set.exists():
+        cart = CartService(request)
+        if cart.is_empty():
             raise ValueError("Carrito vacío")
 
-        # Crear orden
-        order = Order.objects.create(
+        email = request.user.email if request.user.is_authenticated else request.POST.get('email')
+
+        # Crear orden con todos sus items y el stock reservado
+        order, _ = build_order(
+            cart.quantities(),
+            reserve=True,
             order_number=generate_order_number(),
-            user=request.user if request.user.is_authenticated else None,
-            total_amount=cart.total,
-            payment_method='FLOW',
-            status='PENDING'
+            customer_name=request.user.get_full_name() if request.user.is_authenticated else request.POST.get('name', ''),
+            customer_email=email or '',
+            payment_method='flow',
         )
 
         # Preparar datos para Flow
         commerceOrder = order.order_number
         subject = f"Pago Stock Smart - Orden {commerceOrder}"
-        amount = int(float(cart.total))
-        email = request.user.email if request.user.is_authenticated else request.POST.get('email')
+        amount = int(order.total_amount)
 
         # URLs de respuesta
         urlConfirmation = request.build_absolute_uri(reverse('stock_smart:flow_confirm'))
@@ -1117,7 +1103,7 @@ def cart_payment(request):
             "urlReturn": urlReturn,
             "optional": json.dumps({
                 "order_type": "cart",
-                "cart_id": cart.id
+                "items": {str(product_id): quantity for product_id, quantity in cart.quantities().items()}
             })
         }
 
@@ -1126,8 +1112,8 @@ def cart_payment(request):
         payment_data["s"] = sign
 
         # Enviar a Flow
-        flow_response = requests.post(
-            f"{settings.FLOW_API_URL}/payment/create",
+        flow_response = get_gateway_client('flow').post(
+            'payment/create',
             json=payment_data,
             headers={"Content-Type": "application/json"}
         )
@@ -1142,6 +1128,9 @@ def cart_payment(request):
             raise ValueError(f"Error en Flow: {flow_response.text}")
 
     except Exception as e:
+        if order is not None:
+            # Sin pago iniciado la reserva no debe esperar a vencer
+            release_order(order)
         messages.error(request, f"Error al procesar el pago: {str(e)}")
         return redirect('stock_smart:cart')
 
@@ -1163,105 +1152,14 @@ def create_flow_signature(data):
     
     return signature
 
-def flow_return(request):
-    """
-    Vista de retorno después del pago en Flow
-    """
-    try:
-        token = request.GET.get('token')
-        if not token:
-            token = request.POST.get('token')
-        
-        # Verificar el estado del pago
-        params = {
-            'apiKey': settings.FLOW_API_KEY,
-            'token': token
-        }
-        params['s'] = generate_signature(params)
-        
-        response = requests.get(
-            'https://sandbox.flow.cl/api/payment/getStatus',
-            params=params
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            try:
-                order = Order.objects.get(flow_token=token)
-                
-                if data['status'] == 2:  # Pago exitoso
-                    order.status = 'PAID'
-                    order.save()
-                    
-                    # Actualizar stock
-                    for item in order.orderitem_set.all():
-                        product = item.product
-                        product.stock -= item.quantity
-                        product.save()
-                    
-                    # Limpiar carrito
-                    if 'cart_id' in request.session:
-                        del request.session['cart_id']
-                    
-                    messages.success(request, '¡Pago realizado con éxito!')
-                    return render(request, 'stock_smart/payment_success.html', {
-                        'order': order
-                    })
-                else:
-                    order.status = 'FAILED'
-                    order.save()
-                    messages.error(request, 'El pago no pudo ser procesado')
-                    return render(request, 'stock_smart/payment_failed.html', {
-                        'order': order
-                    })
-                    
-            except Order.DoesNotExist:
-                messages.error(request, 'Orden no encontrada')
-                return redirect('stock_smart:guest_checkout')
-                
-        else:
-            raise ValueError(f"Error en la respuesta de Flow: {response.text}")
-            
-    except Exception as e:
-        logger.error(f"Error en flow_return: {str(e)}")
-        messages.error(request, 'Error al procesar el pago')
-        return redirect('stock_smart:guest_checkout')
-
 @csrf_exempt
 def flow_confirm(request):
-    """Webhook para confirmación de Flow"""
-    try:
-        token = request.POST.get('token')
-        
-        # Verificar el pago
-        params = {
-            'apiKey': settings.FLOW_API_KEY,
-            'token': token
-        }
-        params['s'] = generate_signature(params)
-        
-        response = requests.get(
-            'https://sandbox.flow.cl/api/payment/getStatus',
-            params=params
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            try:
-                order = Order.objects.get(flow_token=token)
-                order.status = 'PAID' if data['status'] == 2 else 'FAILED'
-                order.save()
-                
-                return HttpResponse(status=200)
-            except Order.DoesNotExist:
-                return HttpResponse(status=404)
-        else:
-            return HttpResponse(status=400)
-            
-    except Exception as e:
-        logger.error(f"Error en flow_confirm: {str(e)}")
-        return HttpResponse(status=500)
-    return HttpResponse(status=405)
+    """Webhook para confirmación de Flow: se encola y se responde de inmediato"""
+    token = request.POST.get('token')
+    if not token:
+        return HttpResponse(status=400)
+    record_notification('flow', token, request.POST.dict())
+    return HttpResponse(status=200)
 
 def buy_now_confirm(request, product_id):
     """
@@ -1304,43 +1202,30 @@ def update_cart_api(request):
         product_id = data.get('product_id')
         quantity = int(data.get('quantity', 1))
 
-        # Obtener o crear carrito
-        cart = Cart.get_active_cart(request)
+        cart = CartService(request)
         product = get_object_or_404(Product, id=product_id)
 
         if action == 'add':
             # Agregar o actualizar item
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                product=product,
-                defaults={'quantity': quantity}
-            )
-            
-            if not created:
-                cart_item.quantity += quantity
-                cart_item.save()
+            cart.add(product, quantity)
 
         elif action == 'update':
             # Actualizar cantidad
-            cart_item = get_object_or_404(CartItem, cart=cart, product=product)
-            if quantity > 0:
-                cart_item.quantity = quantity
-                cart_item.save()
-            else:
-                cart_item.delete()
+            if not cart.quantity(product.id):
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Producto no encontrado en el carrito'
+                }, status=404)
+            cart.update(product.id, quantity, product=product)
 
         elif action == 'remove':
             # Eliminar item
-            CartItem.objects.filter(cart=cart, product=product).delete()
-
-        # Calcular totales
-        cart_total = sum(item.total for item in cart.cartitem_set.all())
-        cart_count = cart.cartitem_set.count()
+            cart.remove(product.id)
 
         return JsonResponse({
             'success': True,
-            'cart_total': float(cart_total),
-            'cart_count': cart_count,
+            'cart_total': float(cart.total()),
+            'cart_count': cart.count(),
             'message': 'Carrito actualizado exitosamente'
         })
 
@@ -1376,35 +1261,22 @@ def process_guest_order(request):
             if not checkout_data:
                 raise ValueError("No hay datos de checkout")
 
-            # Crear la orden
-            order = Order.objects.create(
-                order_number=generate_order_number(),
-                first_name=request.POST.get('first_name'),
-                last_name=request.POST.get('last_name'),
-                email=request.POST.get('email'),
-                phone=request.POST.get('phone'),
-                total_amount=checkout_data.get('total'),
-                status='PENDING'
-            )
-
-            # Crear items de la orden
+            # Crear la orden con todos sus items
             if checkout_data.get('is_buy_now'):
-                product = Product.objects.get(id=checkout_data['product_id'])
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=1,
-                    price=product.final_price
-                )
+                quantities = {checkout_data['product_id']: 1}
             else:
-                cart = Cart.objects.get(id=checkout_data['cart_id'])
-                for item in cart.cartitem_set.all():
-                    OrderItem.objects.create(
-                        order=order,
-                        product=item.product,
-                        quantity=item.quantity,
-                        price=item.product.final_price
-                    )
+                quantities = dict(
+                    CartItem.objects.filter(cart_id=checkout_data['cart_id']).values_list('product_id', 'quantity')
+                )
+            order, _ = build_order(
+                quantities,
+                order_number=generate_order_number(),
+                customer_name=f"{request.POST.get('first_name', '')} {request.POST.get('last_name', '')}".strip(),
+                customer_email=request.POST.get('email', ''),
+                customer_phone=request.POST.get('phone', ''),
+                payment_method='flow',
+                status='pending'
+            )
 
             # Preparar datos para Flow
             flow_data = {
@@ -1412,7 +1284,7 @@ def process_guest_order(request):
                 'subject': f'Orden #{order.order_number}',
                 'currency': 'CLP',
                 'amount': int(float(order.total_amount)),
-                'email': order.email,
+                'email': order.customer_email,
                 'urlConfirmation': request.build_absolute_uri(reverse('stock_smart:flow_confirm')),
                 'urlReturn': request.build_absolute_uri(reverse('stock_smart:flow_return')),
                 'apiKey': settings.FLOW_API_KEY
@@ -1436,8 +1308,8 @@ def process_guest_order(request):
             flow_data['s'] = signature
 
             # Llamada a Flow
-            response = requests.post(
-                'https://sandbox.flow.cl/api/payment/create',
+            response = get_gateway_client('flow').post(
+                'payment/create',
                 json=flow_data,
                 headers={'Content-Type': 'application/json'}
             )
@@ -1512,91 +1384,94 @@ def flow_confirmation(request):
             return HttpResponse(status=500)
     return HttpResponse(status=405)
 
-def flow_return(request):
-    """Vista que maneja el retorno del usuario desde Flow"""
+async def flow_return(request):
+    """
+    Retorno del usuario desde Flow (async: no bloquea el worker).
+
+    Solo encola la notificación y muestra el estado del pago: el stock y el
+    status de la orden los cambia el procesador de la bandeja (services/webhooks.py).
+    """
     try:
-        token = request.GET.get('token')
-        if not token:
-            token = request.POST.get('token')
-        
-        # Verificar el estado del pago
-        params = {
-            'apiKey': settings.FLOW_API_KEY,
-            'token': token
-        }
-        params['s'] = generate_signature(params)
-        
-        response = requests.get(
-            'https://sandbox.flow.cl/api/payment/getStatus',
-            params=params
-        )
-        
-        if response.status_code == 200:
-            data = response.json()
-            try:
-                order = Order.objects.get(flow_token=token)
-                
-                if data['status'] == 2:  # Pago exitoso
-                    order.status = 'PAID'
-                    order.save()
-                    
-                    # Actualizar stock
-                    for item in order.orderitem_set.all():
-                        product = item.product
-                        product.stock -= item.quantity
-                        product.save()
-                    
-                    # Limpiar carrito
-                    if 'cart_id' in request.session:
-                        del request.session['cart_id']
-                    
-                    messages.success(request, '¡Pago realizado con éxito!')
-                    return render(request, 'stock_smart/payment_success.html', {
-                        'order': order
-                    })
-                else:
-                    order.status = 'FAILED'
-                    order.save()
-                    messages.error(request, 'El pago no pudo ser procesado')
-                    return render(request, 'stock_smart/payment_failed.html', {
-                        'order': order
-                    })
-                    
-            except Order.DoesNotExist:
-                messages.error(request, 'Orden no encontrada')
-                return redirect('stock_smart:guest_checkout')
-                
-        else:
-            raise ValueError(f"Error en la respuesta de Flow: {response.text}")
-            
+        token = request.GET.get('token') or request.POST.get('token')
+        order = await Order.objects.filter(flow_token=token).afirst() if token else None
+        if order is None:
+            messages.error(request, 'Orden no encontrada')
+            return redirect('stock_smart:guest_checkout')
+
+        await sync_to_async(record_notification)('flow', token, {'token': token})
+
+        flow_status = None
+        if order.payment_status == 'pending':
+            # Mientras el worker no aplica la notificación, Flow dice qué mostrar
+            params = {
+                'apiKey': settings.FLOW_API_KEY,
+                'token': token
+            }
+            params['s'] = generate_signature(params)
+            response = await get_async_gateway_client('flow').get(
+                'payment/getStatus',
+                params=params
+            )
+            if response.status_code == 200:
+                flow_status = response.json().get('status')
+
+        if order.payment_status == 'completed' or flow_status == FLOW_PAID:
+            # Limpiar carrito
+            await request.session.apop('cart_id', None)
+            messages.success(request, '¡Pago realizado con éxito!')
+            return await arender(request, 'stock_smart/payment_success.html', {
+                'order': order
+            })
+        if order.payment_status == 'failed' or flow_status in FLOW_REJECTED:
+            messages.error(request, 'El pago no pudo ser procesado')
+            return await arender(request, 'stock_smart/payment_failed.html', {
+                'order': order
+            })
+        # Pago aún pendiente en Flow: la reserva se mantiene
+        return await arender(request, 'stock_smart/payment_pending.html', {
+            'order': order
+        })
+
     except Exception as e:
         logger.error(f"Error en flow_return: {str(e)}")
         messages.error(request, 'Error al procesar el pago')
         return redirect('stock_smart:guest_checkout')
 
-def process_flow_payment(request):
+async def process_flow_payment(request):
     """
-    Procesa el pago con Flow en modo sandbox
+    Procesa el pago con Flow en modo sandbox (async: la llamada a Flow no bloquea el worker)
     """
+    order = None
     try:
         logger.info("Iniciando proceso de pago con Flow")
         
         # Obtener datos del checkout
-        checkout_data = request.session.get('checkout_data', {})
+        checkout_data = await request.session.aget('checkout_data', {})
         if not checkout_data:
             raise ValueError("No hay datos de checkout disponibles")
 
-        # Convertir el total a un entero sin decimales
-        total = checkout_data.get('total', 0)
-        if isinstance(total, str):
-            total = total.replace(',', '').replace('.', '')
-        else:
-            total = int(float(total))
-        
-        logger.info(f"Total formateado para Flow: {total}")
-
         # Generar número de orden único
         order_number = str(uuid.uuid4())[:20]
+
+        # Crear orden e items con el stock reservado antes de iniciar el pago:
+        # sin stock no debe quedar un pago vivo en Flow
+        if checkout_data.get('is_buy_now'):
+            quantities = {checkout_data['product_id']: 1}
+        else:
+            quantities = await sync_to_async(lambda: CartService(request).quantities())()
+        order, _ = await abuild_order(
+            quantities,
+            order_number=order_number,
+            customer_name=f"{request.POST.get('first_name', '')} {request.POST.get('last_name', '')}".strip(),
+            customer_email=request.POST.get('email', ''),
+            customer_phone=request.POST.get('phone', ''),
+            payment_method='flow',
+            status='pending'
+        )
+
+        # El monto sale de la orden (precios del producto), sin decimales
+        total = int(order.total_amount)
+        logger.info(f"Total formateado para Flow: {total}")
         
         # Preparar datos para Flow
         payment_data = {
@@ -1604,7 +1479,7 @@ def process_flow_payment(request):
             'commerceOrder': order_number,
             'subject': f'Compra Stock Smart #{order_number}',
             'currency': 'CLP',
-            'amount': total,  # Ahora es un entero limpio
+            'amount': total,
             'email': request.POST.get('email'),
             'urlConfirmation': request.build_absolute_uri(reverse('stock_smart:flow_confirm')),
             'urlReturn': request.build_absolute_uri(reverse('stock_smart:flow_return')),
@@ -1612,30 +1487,19 @@ def process_flow_payment(request):
 
         logger.info(f"Datos de pago preparados: {payment_data}")
         
-        # Ordenar parámetros alfabéticamente
-        sorted_params = dict(sorted(payment_data.items()))
-        
-        # Crear string para firma
-        sign_string = ''
-        for key, value in sorted_params.items():
-            sign_string += str(value)
-
-        # Generar firma
-        secret_key = settings.FLOW_SECRET_KEY.encode('utf-8')
-        signature = hmac.new(
-            secret_key,
+        # Firma: valores ordenados por clave
+        sign_string = ''.join(str(value) for _, value in sorted(payment_data.items()))
+        payment_data['s'] = hmac.new(
+            settings.FLOW_SECRET_KEY.encode('utf-8'),
             sign_string.encode('utf-8'),
             hashlib.sha256
         ).hexdigest()
 
-        # Agregar firma a los datos
-        payment_data['s'] = signature
-
         logger.info("Enviando solicitud a Flow")
         
         # Hacer petición a Flow
-        response = requests.post(
-            'https://sandbox.flow.cl/api/payment/create',
+        response = await get_async_gateway_client('flow').post(
+            'payment/create',
             json=payment_data,
             headers={'Content-Type': 'application/json'}
         )
@@ -1644,43 +1508,16 @@ def process_flow_payment(request):
 
         if response.status_code == 200:
             flow_response = response.json()
+
+            # El token enlaza las notificaciones de Flow con la orden
+            order.flow_token = flow_response['token']
+            await order.asave(update_fields=['flow_token', 'updated_at'])
             
             # Guardar información del pago en la sesión
-            request.session['flow_payment'] = {
+            await request.session.aset('flow_payment', {
                 'token': flow_response['token'],
                 'order_number': order_number
-            }
-            
-            # Crear orden en la base de datos
-            order = Order.objects.create(
-                order_number=order_number,
-                first_name=request.POST.get('first_name'),
-                last_name=request.POST.get('last_name'),
-                email=request.POST.get('email'),
-                phone=request.POST.get('phone'),
-                total_amount=Decimal(str(checkout_data.get('total', 0))),
-                flow_token=flow_response['token'],
-                status='PENDING'
-            )
-
-            # Guardar items de la orden
-            if checkout_data.get('is_buy_now'):
-                product = Product.objects.get(id=checkout_data['product_id'])
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    quantity=1,
-                    price=product.final_price
-                )
-            else:
-                cart = Cart.get_active_cart(request)
-                for item in cart.cartitem_set.all():
-                    OrderItem.objects.create(
-                        order=order,
-                        product=item.product,
-                        quantity=item.quantity,
-                        price=item.product.final_price
-                    )
+            })
 
             # Redirigir a la página de pago de Flow
             payment_url = f"{flow_response['url']}?token={flow_response['token']}"
@@ -1691,6 +1528,9 @@ def process_flow_payment(request):
             raise ValueError(f"Error en la respuesta de Flow: {response.text}")
 
     except Exception as e:
+        if order is not None:
+            # Sin pago iniciado la reserva no debe esperar a vencer
+            await sync_to_async(release_order)(order)
         logger.error(f"Error en process_flow_payment: {str(e)}")
         messages.error(request, 'Error al procesar el pago. Por favor, intente nuevamente.')
         return redirect('stock_smart:guest_checkout')
@@ -1698,16 +1538,11 @@ def process_flow_payment(request):
 @csrf_exempt
 def payment_notify(request):
     """Webhook para notificaciones de Flow"""
-    Payment = get_payment_model()
-    try:
-        payment_id = request.POST.get('payment_id')
-        payment = Payment.objects.get(id=payment_id)
-        payment.status = PaymentStatus.CONFIRMED
-        payment.save()
-        return HttpResponse(status=200)
-    except Exception as e:
-        logger.error(f"Error en payment_notify: {str(e)}")
-        return HttpResponse(status=500)
+    payment_id = request.POST.get('payment_id')
+    if not payment_id:
+        return HttpResponse(status=400)
+    record_notification('payments', payment_id, request.POST.dict())
+    return HttpResponse(status=200)
 
 @method_decorator(csrf_exempt, name='dispatch')
 class PaymentSuccessView(View):
@@ -1728,13 +1563,10 @@ class PaymentSuccessView(View):
 
         try:
             order = Order.objects.get(flow_token=token)
+            # La orden se actualiza al procesar la notificación; aquí solo se muestra
+            record_notification('flow', token, request.POST.dict())
             
             if payment_status == '2':  # Pago exitoso
-                order.status = 'PAID'
-                order.payment_date = timezone.now()
-                order.save()
-                logger.info(f"Orden {order.order_number} marcada como pagada")
-                
                 return render(request, 'stock_smart/payment_success.html', {
                     'order': order,
                     'order_number': order.order_number,
@@ -1743,8 +1575,6 @@ class PaymentSuccessView(View):
             
             # Si el pago fue rechazado
             logger.warning(f"Pago rechazado o con error. Estado: {payment_status}")
-            order.status = 'REJECTED'
-            order.save()
             
             return render(request, 'stock_smart/payment_rejected.html', {
                 'order': order,
@@ -1764,32 +1594,6 @@ class PaymentSuccessView(View):
         messages.warning(request, 'Acceso no válido')
         return redirect('stock_smart:productos_lista')
 
-def send_confirmation_email(order):
-    """Función auxiliar para enviar correo de confirmación"""
-    try:
-        subject = f'Confirmación de Pago - Orden #{order.order_number}'
-        message = f"""
-        ¡Gracias por tu compra!
-        
-        Detalles de la orden:
-        Número de orden: {order.order_number}
-        Total: ${order.total_amount}
-        Estado: Pagado
-        
-        Pronto recibirás información sobre el envío.
-        """
-        
-        send_mail(
-            subject,
-            message,
-            'noreply@tusitio.com',
-            [order.customer_email],
-            fail_silently=False,
-        )
-    except Exception as e:
-        logger.error(f"Error al enviar correo de confirmación: {str(e)}")
-        # No relanzo la excepción para no interrumpir el flujo principal
-
 def payment_cancel(request):
     try:
         messages.warning(request, 'El pago ha sido cancelado')
@@ -1809,57 +1613,16 @@ def generate_signature(params):
     return signature
 
 def get_or_create_cart(request):
-    if request.user.is_authenticated:
-        cart, created = Cart.objects.get_or_create(
-            user=request.user,
-            completed=False
-        )
-    else:
-        cart_id = request.session.get('cart_id')
-        if cart_id:
-            cart = Cart.objects.filter(id=cart_id, completed=False).first()
-            if not cart:
-                cart = Cart.objects.create()
-                request.session['cart_id'] = cart.id
-        else:
-            cart = Cart.objects.create()
-            request.session['cart_id'] = cart.id
-    return cart
+    """Carrito persistente (Cart) del usuario o visitante actual"""
+    user = request.user if request.user.is_authenticated else None
+    return DatabaseCartBackend(request, user=user).get_cart(create=True)
 
 def cart_view(request):
-    cart_items = []
-    total_amount = Decimal('0')
-    total_discount = Decimal('0')
-    
     try:
-        cart = request.session.get('cart', {})
-        logger.info(f"Carrito actual: {cart}")
-        
-        # Procesar cada item en el carrito
-        for product_id, item in cart.items():
-            try:
-                product = Product.objects.get(id=product_id)
-                quantity = Decimal(str(item.get('quantity', 0)))
-                price = Decimal(str(item.get('price', '0')))
-                
-                item_total = price * quantity
-                total_amount += item_total
-                
-                cart_items.append({
-                    'product': product,
-                    'quantity': quantity,
-                    'price': price,
-                    'total': item_total
-                })
-                
-                logger.info(f"Producto procesado: {product.name}, Precio: {price}, Cantidad: {quantity}, Total: {item_total}")
-                
-            except Product.DoesNotExist:
-                logger.error(f"Producto no encontrado: {product_id}")
-                continue
-            except Exception as e:
-                logger.error(f"Error procesando producto {product_id}: {str(e)}")
-                continue
+        cart = CartService(request)
+        cart_items = cart.lines()
+        total_amount = cart.total(cart_items)
+        total_discount = Decimal('0')
         
         logger.info(f"Total amount final: {total_amount}, Items procesados: {len(cart_items)}")
         
@@ -1890,16 +1653,17 @@ def update_cart(request):
             
             logger.info(f"Actualizando carrito - ID: {product_id}, Acción: {action}")
             
-            cart = request.session.get('cart', {})
+            cart = CartService(request)
             
-            if not cart:
+            if cart.is_empty():
                 logger.error("Carrito vacío")
                 return JsonResponse({
                     'success': False,
                     'error': 'El carrito está vacío'
                 })
             
-            if product_id not in cart:
+            quantity = cart.quantity(product_id) if product_id.isdigit() else 0
+            if not quantity:
                 logger.error(f"Producto {product_id} no encontrado en el carrito")
                 return JsonResponse({
                     'success': False,
@@ -1907,26 +1671,21 @@ def update_cart(request):
                 })
             
             if action == 'add':
-                cart[product_id]['quantity'] += 1
+                cart.update(product_id, quantity + 1)
                 logger.info(f"Cantidad incrementada para producto {product_id}")
             elif action == 'subtract':
-                if cart[product_id]['quantity'] > 1:
-                    cart[product_id]['quantity'] -= 1
+                if quantity > 1:
+                    cart.update(product_id, quantity - 1)
                     logger.info(f"Cantidad reducida para producto {product_id}")
                 else:
                     logger.info(f"No se puede reducir más la cantidad del producto {product_id}")
             elif action == 'remove':
-                del cart[product_id]
+                cart.remove(product_id)
                 logger.info(f"Producto {product_id} eliminado del carrito")
             
-            request.session['cart'] = cart
-            request.session.modified = True
-            
-            cart_count = sum(item['quantity'] for item in cart.values())
-            
             return JsonResponse({
                 'success': True,
-                'cart_count': cart_count,
+                'cart_count': cart.count(),
                 'message': f'Carrito actualizado correctamente. Acción: {action}'
             })
             
@@ -1954,15 +1713,13 @@ def remove_from_cart(request):
             product_id = str(data.get('product_id'))
             
             # Eliminar del carrito
-            cart = request.session.get('cart', {})
-            if product_id in cart:
-                del cart[product_id]
-                request.session['cart'] = cart
-                request.session.modified = True
+            cart = CartService(request)
+            if product_id.isdigit() and cart.quantity(product_id):
+                cart.remove(product_id)
                 
                 # Calcular nuevo total
-                cart_total = sum(float(item['price']) * item['quantity'] for item in cart.values())
-                cart_count = sum(item['quantity'] for item in cart.values())
+                cart_total = cart.total()
+                cart_count = cart.count()
                 
                 return JsonResponse({
                     'success': True,
@@ -1985,57 +1742,52 @@ def remove_from_cart(request):
     return JsonResponse({'success': False})
 
 def category_products(request, category_id):
-    category = get_object_or_404(Category, id=category_id)
-    
-    # Obtener productos de la categoría actual y sus subcategorías
-    categories = [category]
-    if category.children.exists():
-        categories.extend(category.children.all())
-        for child in category.children.all():
-            if child.children.exists():
-                categories.extend(child.children.all())
+    tree = get_category_tree()
+    category = tree.get_or_404(category_id=category_id)
     
-    products = Product.objects.filter(
-        category__in=categories,
+    # Obtener productos de la categoría actual y todo su subárbol
+    products = Product.objects.catalog().filter(
+        category_id__in=tree.subtree_ids(category.id, active_only=False),
         active=True
-    ).distinct()
+    )
+    products = paginate(request, products, PRODUCTOS_POR_PAGINA, ordering=ordering_from_request(request))
     
     context = {
         'category': category,
         'products': products,
-        'main_categories': Category.objects.filter(parent=None, is_active=True)
+        'page_obj': products,
+        'main_categories': tree.roots()
     }
     return render(request, 'stock_smart/category_products.html', context)
 
 def view_cart(request):
-    # Obtener carrito del visitante
-    cart = Cart.get_cart_for_visitor(request.visitor_id)
-    cart_items = CartItem.objects.filter(cart=cart)
+    cart = CartService(request)
+    cart_items = cart.lines()
     
     context = {
         'cart_items': cart_items,
-        'cart_total': sum(item.subtotal for item in cart_items),
-        'main_categories': Category.objects.filter(parent=None, is_active=True)
+        'cart_total': cart.total(cart_items),
+        'main_categories': get_category_tree().roots()
     }
     return render(request, 'stock_smart/cart.html', context)
 
 def productos_lista(request):
     try:
         search_query = request.GET.get('q', '')
-        productos = Product.objects.all()
+        productos = Product.objects.catalog()
         
         # Obtener todas las categorías activas, ordenadas por nombre
-        categories = Category.objects.filter(is_active=True).order_by('name')
-        
-        logger.info(f"Categorías cargadas: {[cat.name for cat in categories]}")
+        categories = get_category_tree().active()
 
         if search_query:
-            productos = productos.filter(name__icontains=search_query) | productos.filter(description__icontains=search_query)
-            logger.info(f"Búsqueda realizada: {search_query}")
-            logger.info(f"Productos encontrados: {productos.count()}")
+            productos = search_catalog(search_query, productos)
+            logger.info(f"Búsqueda realizada: {search_query} ({len(productos)} resultados)")
+
+        productos = paginate(request, productos, PRODUCTOS_POR_PAGINA, ordering=ordering_from_request(request))
 
         context = {
             'productos': productos,
+            'page_obj': productos,
             'categories': categories,
             'search_query': search_query
         }
@@ -2043,7 +1795,7 @@ def productos_lista(request):
     except Exception as e:
         logger.error(f"Error al cargar categorías: {str(e)}")
         return render(request, 'stock_smart/productos_lista.html', {
-            'productos': Product.objects.all(),
+            'productos': KeysetPaginator(Product.objects.catalog(), PRODUCTOS_POR_PAGINA).get_page(),
             'categories': [],
             'search_query': search_query if 'search_query' in locals() else ''
         })
@@ -2052,38 +1804,39 @@ def productos_por_categoria(request, slug):
     try:
         logger.info(f"Buscando productos para categoría: {slug}")
         
-        # Obtener la categoría actual
-        categoria = get_object_or_404(Category, slug=slug)
+        # Obtener la categoría actual desde el árbol cacheado
+        tree = get_category_tree()
+        categoria = tree.get_or_404(slug=slug)
         logger.info(f"Categoría encontrada: {categoria.name}, ID: {categoria.id}")
         
         # Obtener todas las categorías activas para el menú
-        categories = Category.objects.filter(is_active=True).order_by('name')
+        categories = tree.active()
         
         # Verificar si es categoría padre
-        if categoria.parent is None:
+        if categoria.parent_id is None:
             logger.info(f"Es una categoría padre: {categoria.name}")
             
             # Obtener subcategorías
-            subcategorias = Category.objects.filter(parent=categoria, is_active=True)
+            subcategorias = tree.children(categoria.id)
             logger.info(f"Subcategorías encontradas: {[sub.name for sub in subcategorias]}")
             
             # Obtener productos de la categoría principal y subcategorías
-            productos = Product.objects.filter(
-                models.Q(category=categoria) |
-                models.Q(category__in=subcategorias)
-            ).distinct()
+            productos = Product.objects.catalog().filter(
+                category_id__in=tree.subtree_ids(categoria.id) | {categoria.id}
+            )
             
         else:
             logger.info(f"Es una subcategoría: {categoria.name}")
-            productos = Product.objects.filter(category=categoria)
+            productos = Product.objects.catalog().filter(category=categoria)
             subcategorias = None
         
-        logger.info(f"Total productos encontrados: {productos.count()}")
+        productos = paginate(request, productos, PRODUCTOS_POR_PAGINA, ordering=ordering_from_request(request))
         
         context = {
             'category': categoria,  # Cambiado a 'category' para coincidir con el template
             'categories': categories,
             'products': productos,  # Cambiado a 'products' para coincidir con el template
+            'page_obj': productos,
             'subcategories': subcategorias if 'subcategorias' in locals() else None,
         }
         
@@ -2102,12 +1855,8 @@ def productos_por_categoria(request, slug):
 @login_required
 def checkout_direct(request, product_id):
     product = get_object_or_404(Product, id=product_id)
-    # Crear un CartItem temporal o redirigir directamente al checkout
-    cart_item = CartItem.objects.create(
-        user=request.user,
-        product=product,
-        quantity=1
-    )
+    # Agregar el producto al carrito del usuario
+    CartService(request).add(product)
     # Redirigir al proceso de checkout
     return redirect('stock_smart:cart_view')  # O a tu vista de checkout existente
 
@@ -2172,37 +1921,6 @@ def checkout_guest(request, product_id):
         'cart_count': get_cart_count(request),
     }
     return render(request, 'stock_smart/guest_checkout.html', context)
-def standardize_cart(cart):
-    """Estandariza el formato del carrito"""
-    standardized_cart = {}
-    for product_id, item in cart.items():
-        # Ignorar entradas con product_id None o inválido
-        if product_id == 'None' or not product_id:
-            logger.warning(f"Ignorando entrada inválida en carrito: {product_id}")
-            continue
-            
-        try:
-            if isinstance(item, (int, str)):
-                # Convertir formato antiguo a nuevo
-                product = Product.objects.get(id=product_id)
-                standardized_cart[str(product_id)] = {
-                    'quantity': int(item),
-                    'price': str(product.get_final_price),
-                    'name': product.name
-                }
-            elif isinstance(item, dict):
-                # Mantener formato nuevo
-                standardized_cart[str(product_id)] = item
-                
-            logger.info(f"Producto {product_id} estandarizado correctamente")
-        except Product.DoesNotExist:
-            logger.warning(f"Producto {product_id} no encontrado, ignorando")
-            continue
-        except Exception as e:
-            logger.error(f"Error al estandarizar producto {product_id}: {str(e)}")
-            continue
-            
-    return standardized_cart
 
 def add_to_cart(request):
     if request.method == 'POST':
@@ -2217,34 +1935,12 @@ def add_to_cart(request):
             product = get_object_or_404(Product, id=product_id)
             logger.info(f"Producto encontrado: {product.name}")
             
-            # Asegurarse de que existe un carrito en la sesión
-            if 'cart' not in request.session:
-                request.session['cart'] = {}
-                logger.info("Nuevo carrito creado en sesión")
-            
-            cart = request.session.get('cart', {})
-            # Estandarizar el carrito existente
-            cart = standardize_cart(cart)
-            logger.info(f"Carrito estandarizado: {cart}")
-            
             # Agregar o actualizar producto
-            if product_id in cart:
-                cart[product_id]['quantity'] += 1
-                logger.info(f"Incrementada cantidad para producto {product_id}")
-            else:
-                cart[product_id] = {
-                    'quantity': 1,
-                    'price': str(product.get_final_price),
-                    'name': product.name
-                }
-                logger.info(f"Nuevo producto agregado al carrito: {cart[product_id]}")
+            cart = CartService(request)
+            quantity = cart.add(product)
+            logger.info(f"Cantidad para producto {product_id}: {quantity}")
             
-            # Guardar carrito actualizado
-            request.session['cart'] = cart
-            request.session.modified = True
-            
-            logger.info(f"Carrito actualizado: {cart}")
-            cart_count = sum(item['quantity'] for item in cart.values())
+            cart_count = cart.count()
             logger.info(f"Total items en carrito: {cart_count}")
             logger.info("=== FIN DEBUG ===")
             
@@ -2269,32 +1965,16 @@ def add_to_cart(request):
 def user_checkout(request):
     try:
         # Obtener el carrito
-        cart = request.session.get('cart', {})
-        cart_items = []
-        total = Decimal('0')
-        
-        # Procesar items del carrito
-        for product_id, item_data in cart.items():
-            product = get_object_or_404(Product, id=product_id)
-            quantity = item_data['quantity']
-            price = Decimal(item_data['price'])
-            item_total = price * quantity
-            
-            cart_items.append({
-                'product': product,
-                'quantity': quantity,
-                'price': price,
-                'total': item_total
-            })
-            total += item_total
+        cart = CartService(request)
+        cart_items = cart.lines()
         
         # Obtener datos del usuario
         user = request.user
         context = {
             'cart_items': cart_items,
-            'total': total,
+            'total': cart.total(cart_items),
             'user': user,
-            'cart_count': sum(item['quantity'] for item in cart.values())
+            'cart_count': cart.snapshot().count
         }
         
         return render(request, 'stock_smart/user_checkout.html', context)
@@ -2305,33 +1985,13 @@ def user_checkout(request):
 
 def cart_checkout_options(request):
     try:
-        cart = request.session.get('cart', {})
-        if not cart:
+        cart = CartService(request)
+        cart_items = cart.lines()
+        if not cart_items:
             messages.warning(request, 'Tu carrito está vacío')
             return redirect('stock_smart:cart')
             
-        cart_items = []
-        total = Decimal('0')
-        
-        # Procesar items del carrito
-        for product_id, item_data in cart.items():
-            try:
-                product = Product.objects.get(id=product_id)
-                quantity = item_data['quantity']
-                price = Decimal(item_data['price'])
-                item_total = price * quantity
-                
-                cart_items.append({
-                    'product': product,
-                    'quantity': quantity,
-                    'price': price,
-                    'total': item_total
-                })
-                
-                total += item_total
-                
-            except Product.DoesNotExist:
-                continue
+        total = cart.total(cart_items)
         
         # Calcular IVA
         iva = total * Decimal('0.19')
@@ -2342,7 +2002,7 @@ def cart_checkout_options(request):
             'subtotal': total,
             'iva': iva,
             'total': total_con_iva,
-            'cart_count': sum(item['quantity'] for item in cart.values())
+            'cart_count': cart.snapshot().count
         }
         
         return render(request, 'stock_smart/cart_checkout_options.html', context)
@@ -2354,33 +2014,16 @@ def cart_checkout_options(request):
 @login_required
 def user_cart_checkout(request):
     try:
-        cart = request.session.get('cart', {})
-        if not cart:
+        cart = CartService(request)
+        cart_items = cart.lines()
+        if not cart_items:
             return redirect('stock_smart:cart')
-            
-        # Reutilizar lógica existente pero con template específico
-        cart_items = []
-        total = Decimal('0')
-        
-        for product_id, item_data in cart.items():
-            product = get_object_or_404(Product, id=product_id)
-            quantity = item_data['quantity']
-            price = Decimal(item_data['price'])
-            item_total = price * quantity
-            
-            cart_items.append({
-                'product': product,
-                'quantity': quantity,
-                'price': price,
-                'total': item_total
-            })
-            total += item_total
         
         context = {
             'cart_items': cart_items,
-            'total': total,
+            'total': cart.total(cart_items),
             'user': request.user,
-            'cart_count': sum(item['quantity'] for item in cart.values())
+            'cart_count': cart.snapshot().count
         }
         
         return render(request, 'stock_smart/user_cart_checkout.html', context)
@@ -2391,32 +2034,15 @@ def user_cart_checkout(request):
 
 def guest_cart_checkout(request):
     try:
-        cart = request.session.get('cart', {})
-        if not cart:
+        cart = CartService(request)
+        cart_items = cart.lines()
+        if not cart_items:
             return redirect('stock_smart:cart')
-            
-        # Similar a guest_checkout pero con template específico
-        cart_items = []
-        total = Decimal('0')
-        
-        for product_id, item_data in cart.items():
-            product = get_object_or_404(Product, id=product_id)
-            quantity = item_data['quantity']
-            price = Decimal(item_data['price'])
-            item_total = price * quantity
-            
-            cart_items.append({
-                'product': product,
-                'quantity': quantity,
-                'price': price,
-                'total': item_total
-            })
-            total += item_total
         
         context = {
             'cart_items': cart_items,
-            'total': total,
-            'cart_count': sum(item['quantity'] for item in cart.values())
+            'total': cart.total(cart_items),
+            'cart_count': cart.snapshot().count
         }
         
         return render(request, 'stock_smart/guest_cart_checkout.html', context)
@@ -2430,8 +2056,8 @@ def validate_product(request, product_id):
         try:
             product = get_object_or_404(Product, id=product_id)
             
-            # Validar stock
-            if product.stock <= 0:
+            # Validar stock (descontando reservas de órdenes pendientes)
+            if product.available_stock <= 0:
                 return JsonResponse({
                     'success': False,
                     'message': 'Producto sin stock disponible'
@@ -2456,7 +2082,7 @@ def validate_product(request, product_id):
                     'id': product.id,
                     'name': product.name,
                     'price': float(price),
-                    'stock': product.stock,
+                    'stock': product.available_stock,
                     'discount': product.discount_percentage
                 }
             })
@@ -2471,49 +2097,17 @@ def validate_product(request, product_id):
 
 @csrf_exempt  # Necesario para recibir POST de Flow
 def payment_confirm(request):
-    try:
-        logger.info("="*50)
-        logger.info("INICIANDO PAYMENT CONFIRM")
-        logger.info(f"Método: {request.method}")
-        logger.info(f"POST data: {request.POST}")
-        
-        if request.method != 'POST':
-            logger.error("Método no permitido")
-            return HttpResponse('Método no permitido', status=405)
-        
-        # Obtener token
-        token = request.POST.get('token')
-        logger.info(f"Token recibido: {token}")
-        
-        if not token:
-            logger.error("No se recibió token de Flow")
-            return HttpResponse('Token no recibido', status=400)
-        try:
-            # Buscar orden por token
-            order = Order.objects.get(flow_token=token)
-            
-            # Verificar estado del pago
-            flow_service = FlowPaymentService()
-            payment_status = flow_service.get_payment_status(token)
-            
-            if payment_status.get('status') == 2:  # Pago exitoso
-                # Actualizar estado de la orden
-                order.status = 'paid'
-                order.save()
-                
-                logger.info(f"Pago confirmado para orden: {order.order_number}")
-                return HttpResponse('OK', status=200)
-            else:
-                logger.error(f"Estado de pago inválido: {payment_status}")
-                return HttpResponse('Estado de pago inválido', status=400)
-                
-        except Order.DoesNotExist:
-            logger.error(f"No se encontró orden para el token: {token}")
-            return HttpResponse('Orden no encontrada', status=404)
-            
-    except Exception as e:
-        logger.error(f"Error en payment_confirm: {str(e)}")
-        return HttpResponse('Error interno', status=500)
+    if request.method != 'POST':
+        return HttpResponse('Método no permitido', status=405)
+
+    token = request.POST.get('token')
+    if not token:
+        logger.error("No se recibió token de Flow")
+        return HttpResponse('Token no recibido', status=400)
+
+    # El estado se consulta y aplica al drenar la bandeja (process_payment_notifications)
+    record_notification('flow', token, request.POST.dict())
+    return HttpResponse('OK', status=200)
 
 def detalle_producto(request, producto_id):
     try:
@@ -2556,27 +2150,24 @@ def update_cart_quantity(request):
         logger.info("Actualizando cantidad en carrito")
         product_id = request.POST.get('product_id')
         new_quantity = int(request.POST.get('quantity', 1))
-        cart = request.session.get('cart', {})
+        cart = CartService(request)
         
-        if product_id in cart:
-            # Corregimos el paréntesis faltante
-            item_total = int(float(cart[product_id]['price'])) * new_quantity
-            cart[product_id]['quantity'] = new_quantity
-            cart[product_id]['total'] = item_total
-            
-            request.session['cart'] = cart
-            request.session.modified = True
+        if product_id and product_id.isdigit() and cart.quantity(product_id):
+            cart.update(product_id, new_quantity)
             
             # Calcular nuevo total del carrito
-            cart_total = sum(item['total'] for item in cart.values())
+            snapshot = cart.snapshot()
+            line = snapshot.get(product_id)
+            item_total = line.total if line else 0
+            cart_total = snapshot.subtotal
             
             logger.info(f"Carrito actualizado: Producto {product_id}, Nueva cantidad: {new_quantity}")
             
             return JsonResponse({
                 'success': True,
                 'new_quantity': new_quantity,
-                'item_total': item_total,
-                'cart_total': cart_total
+                'item_total': int(item_total),
+                'cart_total': int(cart_total)
             })
     except Exception as e:
         logger.error(f"Error al actualizar carrito: {str(e)}")
@@ -2612,26 +2203,21 @@ def payment_error(request):
         messages.error(request, 'Error al mostrar la página de error de pago')
         return redirect('stock_smart:productos_lista')
 
-class ProductosPorCategoria(ListView):
+class ProductosPorCategoria(KeysetPaginationMixin, ListView):
     model = Product
     template_name = 'stock_smart/productos_lista.html'
     context_object_name = 'productos'
     paginate_by = 12
 
     def get_queryset(self):
-        queryset = Product.objects.filter(active=True)
+        queryset = Product.objects.catalog().filter(active=True)
         query = self.request.GET.get('q')
         
         if query:
-            logger.info(f"Búsqueda realizada: {query}")
-            queryset = queryset.filter(
-                Q(name__icontains=query) |
-                Q(description__icontains=query) |
-                Q(category__name__icontains=query) |
-                Q(brand__name__icontains=query)
-            ).distinct()
-            
-            logger.info(f"Resultados encontrados: {queryset.count()}")
+            # El índice incluye marca y categoría como palabras clave
+            results = search_catalog(query, queryset)
+            logger.info(f"Búsqueda realizada: {query} ({len(results)} resultados)")
+            return results
         
         return queryset.order_by('-created_at')
 
@@ -2640,26 +2226,21 @@ class ProductosPorCategoria(ListView):
         context['search_query'] = self.request.GET.get('q', '')
         return context
 
-class ProductosListaView(ListView):  # Cambiamos a PascalCase para la clase
+class ProductosListaView(KeysetPaginationMixin, ListView):  # Cambiamos a PascalCase para la clase
     model = Product
     template_name = 'stock_smart/productos_lista.html'
     context_object_name = 'productos'
     paginate_by = 12
 
     def get_queryset(self):
-        queryset = Product.objects.filter(active=True)
+        queryset = Product.objects.catalog().filter(active=True)
         query = self.request.GET.get('q')
         
         if query:
-            logger.info(f"Búsqueda realizada: {query}")
-            queryset = queryset.filter(
-                Q(name__icontains=query) |
-                Q(description__icontains=query) |
-                Q(category__name__icontains=query) |
-                Q(brand__name__icontains=query)
-            ).distinct()
-            
-            logger.info(f"Resultados encontrados: {queryset.count()}")
+            # El índice incluye marca y categoría como palabras clave
+            results = search_catalog(query, queryset)
+            logger.info(f"Búsqueda realizada: {query} ({len(results)} resultados)")
+            return results
         
         return queryset.order_by('-created_at')
 
@@ -2719,48 +2300,15 @@ class CartOptionsCheckoutView(View):
         logger.info("INICIANDO CREACIÓN DE ORDEN")
         
         try:
-            cart = request.session.get('cart', {})
+            cart = CartService(request)
+            products_data = cart.lines()
             
-            if not cart:
+            if not products_data:
                 messages.warning(request, "Tu carrito está vacío")
                 return redirect('stock_smart:cart')
 
             # Calcular totales
-            products_data = []
-            subtotal = Decimal('0')
-            
-            for product_id, item_data in cart.items():
-                try:
-                    product = Product.objects.get(id=int(product_id))
-                    quantity = int(item_data.get('quantity', 0))
-                    
-                    # Calcular precio con descuento si existe
-                    if product.discount_percentage > 0:
-                        price = product.price * (1 - product.discount_percentage/100)
-                    else:
-                        price = product.price
-                        
-                    item_total = price * quantity
-                    subtotal += item_total
-                    
-                    products_data.append({
-                        'product': product,
-                        'quantity': quantity,
-                        'price': price,
-                        'total': item_total
-                    })
-                    
-                    logger.info(f"Producto agregado: {product.name}")
-                    logger.info(f"Cantidad: {quantity}")
-                    logger.info(f"Precio unitario: ${price}")
-                    logger.info(f"Total item: ${item_total}")
-                    
-                except Product.DoesNotExist:
-                    logger.error(f"Producto {product_id} no encontrado")
-                    continue
-                except Exception as e:
-                    logger.error(f"Error procesando producto {product_id}: {str(e)}")
-                    continue
+            subtotal = cart.total(products_data)
 
             # Calcular IVA y total
             iva = subtotal * Decimal('0.19')
@@ -2771,24 +2319,14 @@ class CartOptionsCheckoutView(View):
             logger.info(f"IVA: ${iva}")
             logger.info(f"Total: ${total}")
 
-            # Crear orden
-            order = Order.objects.create(
+            # Crear orden con todos sus items; el stock se aparta recién
+            # al crear el pago (un GET puede ser recarga o crawler)
+            order, _ = build_order(
+                cart.quantities(),
+                reserve=False,
                 order_number=generate_order_number(),
-                subtotal=subtotal,
-                iva=iva,
-                total=total,
                 status='pending'
             )
-            
-            # Crear items de la orden
-            for item in products_data:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item['product'],
-                    quantity=item['quantity'],
-                    price=item['price'],
-                    total=item['total']
-                )
             # Guardar ID de orden en sesión
             request.session['order_id'] = order.id
             
@@ -2920,6 +2458,9 @@ class CartPaymentView(View):
                 'urlReturn': request.build_absolute_uri(reverse('stock_smart:cart_payment_return'))
             }
 
+            # Apartar el stock antes de crear el pago (no hace nada si ya está apartado)
+            reserve_order(order)
+
             # Crear orden en Flow
             flow_response = flow_service.create_payment(payment_data)
             
@@ -2928,9 +2469,13 @@ class CartPaymentView(View):
                 return redirect(flow_response['url'])
             else:
                 logger.error(f"Error creando pago Flow: {flow_response.get('error', 'Unknown error')}")
+                release_order(order)
                 messages.error(request, "Error al procesar el pago. Por favor, intente nuevamente.")
                 return redirect('stock_smart:cart')
 
+        except InsufficientStock:
+            messages.error(request, 'Producto sin stock disponible')
+            return redirect('stock_smart:cart')
         except Order.DoesNotExist:
             logger.error(f"Orden no encontrada: {order_id}")
             messages.error(request, "Orden no encontrada")
@@ -2942,59 +2487,17 @@ class CartPaymentView(View):
         
         
 class CartPaymentConfirmView(View):
-    @csrf_exempt
+    @method_decorator(csrf_exempt)
     def post(self, request):
         logger.info("Recibiendo confirmación de pago Flow")
-        try:
-            # Obtener datos de Flow
-            flow_service = FlowPaymentService()
-            payment_data = flow_service.get_payment_status(request.POST)
-            
-            if not payment_data:
-                logger.error("No se recibieron datos de pago de Flow")
-                return HttpResponse(status=400)
-
-            # Obtener la orden
-            order = Order.objects.get(order_number=payment_data['commerceOrder'])
-            
-            # Actualizar estado según respuesta de Flow
-            if payment_data['status'] == 2:  # Pago exitoso
-                order.status = 'paid'
-                order.payment_date = timezone.now()
-                order.payment_id = payment_data['flowOrder']
-                order.save()
-                
-                # Actualizar stock
-                for item in order.orderitem_set.all():
-                    product = item.product
-                    product.stock -= item.quantity
-                    product.save()
-                    
-                # Limpiar carrito de la sesión
-                if 'cart' in request.session:
-                    del request.session['cart']
-                if 'order_id' in request.session:
-                    del request.session['order_id']
-                request.session.modified = True
-                
-                logger.info(f"Pago confirmado para orden {order.order_number}")
-                
-                # Enviar email de confirmación
-                try:
-                    send_confirmation_email(order)
-                except Exception as e:
-                    logger.error(f"Error enviando email de confirmación: {str(e)}")
-                
-            else:
-                order.status = 'failed'
-                order.save()
-                logger.warning(f"Pago fallido para orden {order.order_number}")
-            
-            return HttpResponse(status=200)
+        token = request.POST.get('token')
+        if not token:
+            logger.error("No se recibieron datos de pago de Flow")
+            return HttpResponse(status=400)
 
-        except Exception as e:
-            logger.error(f"Error en confirmación de pago: {str(e)}")
-            return HttpResponse(status=500)
+        # El pago se verifica y aplica a la orden al drenar la bandeja
+        record_notification('flow', token, request.POST.dict())
+        return HttpResponse(status=200)
 
 class CartPaymentReturnView(View):
     template_name = 'stock_smart/cart_payment_return.html'
@@ -3004,7 +2507,7 @@ class CartPaymentReturnView(View):
         try:
             # Obtener datos de Flow
             flow_service = FlowPaymentService()
-            payment_data = flow_service.get_payment_status(request.GET)
+            payment_data = flow_service.get_payment_status(request.GET.get('token'))
             
             if not payment_data:
                 logger.error("No se recibieron datos de retorno de Flow")
@@ -3065,6 +2568,9 @@ class ProcessCartCheckoutView(View):
                 'urlReturn': request.build_absolute_uri(reverse('stock_smart:cart_payment_return'))
             }
 
+            # Apartar el stock antes de crear el pago (no hace nada si ya está apartado)
+            reserve_order(order)
+
             # Crear orden en Flow
             flow_service = FlowPaymentService()
             flow_response = flow_service.create_payment(flow_data)
@@ -3079,9 +2585,13 @@ class ProcessCartCheckoutView(View):
                 return redirect(flow_response['url'])
             else:
                 logger.error(f"Error creando pago Flow: {flow_response.get('error', 'Unknown error')}")
+                release_order(order)
                 messages.error(request, "Error al procesar el pago. Por favor, intente nuevamente.")
                 return redirect('stock_smart:cart')
 
+        except InsufficientStock:
+            messages.error(request, 'Producto sin stock disponible')
+            return redirect('stock_smart:cart')
         except Order.DoesNotExist:
             logger.error(f"Orden no encontrada: {order_id}")
             messages.error(request, "Orden no encontrada")
@@ -3102,110 +2612,33 @@ class TerminosView(View):
         return render(request, 'stock_smart/terminos.html')
 
 class TrackingView(View):
+    """
+    Seguimiento público de una orden por número.
+
+    El detalle se sirve desde caché (services/tracking.py) y las búsquedas
+    se limitan por IP para que el polling de los clientes no cargue la BD.
+    """
     template_name = 'stock_smart/seguimiento.html'
-    
+
     def get(self, request):
-        logger.info("="*50)
-        logger.info("INICIANDO BÚSQUEDA DE ORDEN")
-        
-        try:
-            order_number = request.GET.get('order_number')
-            logger.info(f"Buscando orden número: {order_number}")
-            
-            if not order_number:
-                logger.info("No se proporcionó número de orden")
-                return render(request, self.template_name)
-
-            # Consulta SQL directa para obtener la orden
-            with connection.cursor() as cursor:
-                # Primero, obtener los datos de la orden
-                cursor.execute("""
-                    SELECT 
-                        id, order_number, status, payment_status, 
-                        shipping_method, first_name, last_name, 
-                        email, phone, address, comuna, region,
-                        shipping_cost, subtotal, iva, total,
-                        created_at, shipping_notes
-                    FROM stock_smart_order 
-                    WHERE order_number = %s
-                """, [order_number])
-                
-                order_row = cursor.fetchone()
-                
-                if order_row:
-                    # Convertir los resultados en un diccionario
-                    columns = [col[0] for col in cursor.description]
-                    order = dict(zip(columns, order_row))
-                    
-                    # Obtener los items de la orden
-                    cursor.execute("""
-                        SELECT 
-                            p.name,
-                            oi.quantity,
-                            oi.price,
-                            (oi.quantity * oi.price) as total
-                        FROM stock_smart_orderitem oi
-                        JOIN stock_smart_product p ON oi.product_id = p.id
-                        WHERE oi.order_id = %s
-                    """, [order['id']])
-                    
-                    items = []
-                    for item_row in cursor.fetchall():
-                        items.append({
-                            'name': item_row[0],
-                            'quantity': item_row[1],
-                            'price': item_row[2],
-                            'total': item_row[3]
-                        })
-                    
-                    # Formatear estados para display
-                    order['status'] = self.get_status_display(order['status'])
-                    order['payment_status'] = self.get_payment_status_display(order['payment_status'])
-                    order['shipping_method'] = self.get_shipping_method_display(order['shipping_method'])
-                    
-                    context = {
-                        'order': order,
-                        'items': items
-                    }
-                    
-                    logger.info(f"Orden encontrada: {order['order_number']}")
-                    return render(request, self.template_name, context)
-                else:
-                    logger.warning(f"No se encontró la orden: {order_number}")
-                    messages.error(request, "No se encontró la orden especificada")
-                    return render(request, self.template_name)
-                    
-        except Exception as e:
-            logger.error(f"Error al buscar orden: {str(e)}")
-            logger.error(traceback.format_exc())
-            messages.error(request, "Error al buscar la orden")
+        order_number = request.GET.get('order_number', '').strip()
+        if not order_number:
             return render(request, self.template_name)
 
-    def get_status_display(self, status):
-        status_choices = {
-            'pending': 'Pendiente',
-            'processing': 'Procesando',
-            'shipped': 'Enviado',
-            'delivered': 'Entregado',
-            'cancelled': 'Cancelado'
-        }
-        return status_choices.get(status, status)
-
-    def get_payment_status_display(self, status):
-        payment_status_choices = {
-            'pending': 'Pendiente',
-            'completed': 'Completado',
-            'failed': 'Fallido',
-            'refunded': 'Reembolsado'
-        }
-        return payment_status_choices.get(status, status)
-
-    def get_shipping_method_display(self, method):
-        shipping_method_choices = {
-            'pickup': 'Retiro en tienda',
-            'starken': 'Envío Starken'
-        }
-        return shipping_method_choices.get(method, method)
+        limit, window = settings.TRACKING_RATE_LIMIT
+        if is_rate_limited('tracking', client_ip(request), limit, window):
+            messages.error(request, "Demasiadas consultas. Espera un momento e inténtalo de nuevo.")
+            response = render(request, self.template_name, status=429)
+            response['Retry-After'] = str(window)
+            return response
+
+        tracking_html = None
+        if ORDER_NUMBER_RE.fullmatch(order_number):
+            tracking_html = render_tracking(order_number)
+        if tracking_html is None:
+            logger.info(f"Seguimiento: no se encontró la orden {order_number[:50]}")
+            messages.error(request, "No se encontró la orden especificada")
+        return render(request, self.template_name, {'tracking_html': tracking_html})
 
 @csrf_protect
 def payment_form(request):
@@ -3241,109 +2674,6 @@ def payment_form(request):
         messages.error(request, 'Error al cargar el formulario de pago')
         return redirect('stock_smart:checkout_error')
 
-@csrf_protect
-def payment_success(request):
-    logger.info('Accediendo a payment_success')
-    try:
-        logger.info("="*50)
-        logger.info("PROCESANDO PAGO EXITOSO")
-        
-        # Obtener order_id de la sesión
-        order_id = request.session.get('order_id')
-        logger.info(f"Order ID en sesión: {order_id}")
-        
-        if not order_id:
-            logger.warning("No se encontró order_id en sesión")
-            messages.warning(request, 'No se encontró información de la orden')
-            # En lugar de redireccionar, renderizamos el template con mensaje de éxito genérico
-            return render(request, 'stock_smart/payment_success.html', {})
-        
-        try:
-            order = Order.objects.select_related().get(id=order_id)
-        except Order.DoesNotExist:
-            logger.error(f"No se encontró la orden con ID: {order_id}")
-            messages.error(request, 'Orden no encontrada')
-            return render(request, 'stock_smart/payment_success.html', {})
-        
-        # Si la orden ya está pagada, solo mostrar la página de éxito
-        if order.status == 'PAID':
-            return render(request, 'stock_smart/payment_success.html', {'order': order})
-        
-        try:
-            # Iniciar transacción para asegurar la integridad de los datos
-            with transaction.atomic():
-                # Actualizar estado de la orden
-                order.status = 'PAID'
-                order.payment_date = timezone.now()
-                
-                # Actualizar stock de productos
-                for item in order.orderitem_set.all():
-                    product = item.product
-                    if product.stock >= item.quantity:
-                        product.stock -= item.quantity
-                        product.save()
-                        logger.info(f"Stock actualizado para producto {product.id}: {product.stock}")
-                    else:
-                        raise ValueError(f"Stock insuficiente para {product.name}")
-                
-                order.save()
-                logger.info(f"Orden {order.order_number} actualizada correctamente")
-                
-                # Limpiar sesión
-                request.session.pop('order_id', None)
-                request.session.pop('cart_id', None)
-                request.session.modified = True
-                
-                # Intentar enviar email
-                try:
-                    send_confirmation_email(order)
-                    logger.info("Correo de confirmación enviado")
-                except Exception as e:
-                    logger.error(f"Error al enviar correo: {str(e)}")
-                
-                messages.success(request, '¡Pago realizado con éxito!')
-                
-                return render(request, 'stock_smart/payment_success.html', {
-                    'order': order,
-                })
-                
-        except ValueError as ve:
-            logger.error(f"Error de validación: {str(ve)}")
-            messages.error(request, str(ve))
-            return redirect('stock_smart:checkout_error')
-            
-    except Exception as e:
-        logger.error(f"Error en payment_success: {str(e)}")
-        logger.error(traceback.format_exc())
-        messages.error(request, 'Error al procesar el pago')
-        return redirect('stock_smart:checkout_error')
-
-def send_confirmation_email(order):
-    """Función auxiliar para enviar correo de confirmación"""
-    try:
-        subject = f'Confirmación de Pago - Orden #{order.order_number}'
-        message = f"""
-        ¡Gracias por tu compra!
-        
-        Detalles de la orden:
-        Número de orden: {order.order_number}
-        Total: ${order.total_amount}
-        Estado: Pagado
-        
-        Pronto recibirás información sobre el envío.
-        """
-        
-        send_mail(
-            subject,
-            message,
-            'noreply@tusitio.com',
-            [order.customer_email],
-            fail_silently=False,
-        )
-    except Exception as e:
-        logger.error(f"Error al enviar correo de confirmación: {str(e)}")
-        # No relanzo la excepción para no interrumpir el flujo principal
-
 @require_http_methods(["GET", "POST"])
 def logout_view(request):
     try:
@@ -3380,15 +2710,12 @@ def cart_update(request, product_id):
         logger.info(f"Iniciando actualización de carrito para producto {product_id}")
         
         if request.method == 'POST':
-            cart = request.session.get('cart', {})
             quantity = int(request.POST.get('quantity', 1))
             
             logger.info(f"Actualizando cantidad: {quantity} para producto: {product_id}")
             
             # Actualizar cantidad en el carrito
-            cart[str(product_id)] = quantity
-            request.session['cart'] = cart
-            request.session.modified = True
+            CartService(request).update(product_id, quantity)
             
             logger.info("Carrito actualizado exitosamente")
             return JsonResponse({'status': 'success'})
@@ -3401,8 +2728,7 @@ def cart_update(request, product_id):
         return JsonResponse({'error': str(e)}, status=400)
 
 def clear_cart(request):
-    request.session['cart'] = {}
-    request.session.modified = True
+    CartService(request).clear()
     return JsonResponse({'status': 'success', 'message': 'Carrito limpiado'})
 
 def mercadopago_success(request):
@@ -3478,26 +2804,29 @@ def mercadopago_pending(request):
 @csrf_exempt
 @require_http_methods(["POST"])
 def mercadopago_webhook(request):
-    logger.info("="*50)
-    logger.info("WEBHOOK MERCADOPAGO RECIBIDO")
-    logger.info(f"Datos recibidos: {request.POST}")
-    
-    mp = MercadoPagoAdapter()
-    if mp.process_webhook(request.POST):
-        logger.info("Webhook procesado exitosamente")
+    """Encola la notificación de MercadoPago (tipo e id del recurso) y responde 200"""
+    try:
+        body = json.loads(request.body or b'{}')
+    except ValueError:
+        body = {}
+    topic = request.GET.get('type') or request.GET.get('topic') or body.get('type') or body.get('topic')
+    resource_id = (
+        request.GET.get('data.id') or request.GET.get('id')
+        or (body.get('data') or {}).get('id') or body.get('id')
+    )
+    if not topic or not resource_id:
+        logger.warning(f"Webhook MercadoPago sin tipo o id: {request.GET.dict()}")
         return HttpResponse(status=200)
-    
-    logger.error("Error al procesar webhook")
-    return HttpResponse(status=400)
+
+    record_notification('mercadopago', f'{topic}:{resource_id}', body)
+    return HttpResponse(status=200)
+
 @require_http_methods(["POST"])
-def mercadopago_create_preference(request):
+async def mercadopago_create_preference(request):
     try:
         logger.info("="*50)
         logger.info("CREANDO PREFERENCIA MERCADOPAGO")
         
-        # Imprimir el body completo de la solicitud
-        logger.info(f"Request body raw: {request.body}")
-        
         try:
             data = json.loads(request.body)
             logger.info(f"Datos parseados: {data}")
@@ -3509,7 +2838,7 @@ def mercadopago_create_preference(request):
             }, status=400)
 
         # Verificar que tenemos el product_id en la sesión
-        product_id = request.session.get('product_id')
+        product_id = await request.session.aget('product_id')
         logger.info(f"Product ID from session: {product_id}")
         
         if not product_id:
@@ -3521,13 +2850,14 @@ def mercadopago_create_preference(request):
 
         try:
             # Obtener el producto
-            product = Product.objects.get(id=product_id)
+            product = await Product.objects.aget(id=product_id)
             logger.info(f"Producto encontrado: {product.name}, Precio: {product.final_price}")
 
             # Crear la orden
             order_number = f'ORD-{timezone.now().strftime("%Y%m%d")}-{uuid.uuid4().hex[:8]}'
             
-            order = Order.objects.create(
+            order, (order_item,) = await abuild_order(
+                {product.id: 1},
                 order_number=order_number,
                 customer_name=f"{data.get('nombre', '')} {data.get('apellido', '')}",
                 customer_email=data.get('email', ''),
@@ -3538,43 +2868,12 @@ def mercadopago_create_preference(request):
                 shipping_address=data.get('direccion', ''),
                 shipping_method=data.get('shipping', ''),
                 payment_method='mercadopago',
-                total_amount=product.final_price,
-                status='pending_payment'
+                status='pending'
             )
             logger.info(f"Orden creada: {order.id}")
 
-            # Crear item de orden
-            order_item = OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=1,
-                price=product.final_price
-            )
-            logger.info(f"Item de orden creado: {order_item.id}")
-
-            # Crear preferencia de MercadoPago
-            mp = MercadoPagoAdapter()
-            logger.info("MercadoPago adapter creado")
-            
-            # Crear datos de preferencia
-            preference_data = {
-                "items": [{
-                    "title": product.name,
-                    "quantity": 1,
-                    "currency_id": "CLP",
-                    "unit_price": float(product.final_price)
-                }],
-                "external_reference": str(order.id),
-                "back_urls": {
-                    "success": settings.MERCADOPAGO_SUCCESS_URL,
-                    "failure": settings.MERCADOPAGO_FAILURE_URL,
-                    "pending": settings.MERCADOPAGO_PENDING_URL
-                },
-                "notification_url": settings.MERCADOPAGO_WEBHOOK_URL
-            }
-            logger.info(f"Datos de preferencia: {preference_data}")
-            
-            preference = mp.create_preference(order)
+            # Crear preferencia de MercadoPago sin bloquear el worker
+            preference = await MercadoPagoAdapter().acreate_preference(order, order_item)
             logger.info(f"Respuesta de MercadoPago: {preference}")
 
             if preference and 'init_point' in preference:
@@ -3584,6 +2883,7 @@ def mercadopago_create_preference(request):
                 })
             else:
                 logger.error("No se recibió init_point en la respuesta")
+                await sync_to_async(release_order)(order)
                 return JsonResponse({
                     'status': 'error',
                     'message': 'Error al crear preferencia de pago'
@@ -3595,6 +2895,11 @@ def mercadopago_create_preference(request):
                 'status': 'error',
                 'message': 'Producto no encontrado'
             }, status=404)
+        except InsufficientStock:
+            return JsonResponse({
+                'status': 'error',
+                'message': 'Producto sin stock disponible'
+            }, status=409)
         except Exception as e:
             logger.error(f"Error al crear orden o preferencia: {str(e)}")
             logger.error(traceback.format_exc())
@@ -3693,16 +2998,3 @@ def payment_pending(request):
             'error_message': 'Error al procesar el estado pendiente del pago'
         })
 
-@csrf_exempt
-def mercadopago_webhook(request):
-    try:
-        logger.info("="*50)
-        logger.info("WEBHOOK MERCADOPAGO")
-        logger.info(f"Method: {request.method}")
-        logger.info(f"Headers: {request.headers}")
-        logger.info(f"Body: {request.body}")
-        
-        return HttpResponse(status=200)
-    except Exception as e:
-        logger.error(f"Error en webhook: {str(e)}")
-        return HttpResponse(status=500)
\ No newline at end of file